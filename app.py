@@ -1,15 +1,31 @@
 # app.py
+import os
 import time
 from pathlib import Path
 from datetime import datetime
 
-from flask import Flask, request, send_from_directory, send_file, url_for, render_template, abort, make_response
+from flask import Flask, request, send_file, url_for, render_template, abort, make_response, jsonify, redirect
 from werkzeug.utils import secure_filename
+import hashlib
 import json
+import re
+import shutil
+import tempfile
+import threading
+from contextlib import ExitStack
 
-from merge import merge_from_any
-from converters import detect_pdf_engine, docx_to_pdf
-from parser import md_file_to_docx   # unchanged
+from merge import merge_from_any, preload_template
+from converters import detect_pdf_engine, docx_to_pdf, docx_to_pdf_batched, optimize_pdf
+from pdf_sections import MAX_WORKERS as SECTION_MAX_WORKERS, docx_to_pdf_sections
+from parser import Cancelled, check_cancel, md_file_to_docx, build_image_index
+from pandoc_render import configured_engine, md_to_docx
+from render_pool import pool_from_config
+from jobs import BackgroundRunner, Limiter, Overloaded, ProgressBoard, Workspace, watch_disconnect
+from archive import ArchiveError, extract_archive
+from assets import AssetPipeline
+from storage import check_key, storage_from_config
+from upload_store import ContentStore, UploadRequest
+import estimator
 
 # for reading core properties and counting PDF pages
 from docx import Document as DocxDocument
@@ -27,12 +43,73 @@ OUTPUT_DIR = BASE_DIR / "outputs"
 for p in (UPLOAD_DIR, OUTPUT_DIR):
     p.mkdir(exist_ok=True)
 
+# Shared home of uploads, outputs and job state (uploads/<job>/…, outputs/<job>/…).
+# Jobs still work in the local UPLOAD_DIR/OUTPUT_DIR and publish to it; with the
+# default LocalStorage(BASE_DIR) those are the same files and publishing is free.
+STORAGE = storage_from_config(BASE_DIR, BASE_DIR / "config.json")
+
+# Markdown renderer: "native" (parser.py) or "pandoc" (pandoc_render.py, template as
+# --reference-doc); bench_renderers.py compares the two on a given set of sections
+MD_ENGINE = configured_engine(BASE_DIR / "config.json")
+
+# One file per distinct upload (blobs/<sha256>); uploads/<job>/… are hard links.
+# File parts are hashed while Werkzeug's parser streams them to disk.
+UPLOAD_STORE = ContentStore(BASE_DIR / "blobs")
+UploadRequest.upload_store = UPLOAD_STORE
+app.request_class = UploadRequest
+
+# static/ → .assets/<name>.<hash>.<ext> (+ .gz/.br), served as immutable
+ASSETS = AssetPipeline(BASE_DIR / "static", BASE_DIR / ".assets")
+ASSETS.init_app(app)
+
 # ~100 MB request cap
 app.config["MAX_CONTENT_LENGTH"] = 100 * 1024 * 1024
 
-ALLOWED_RAW = {".docx", ".md", ".markdown", ".mdx"}
+ALLOWED_RAW = {".docx", ".md", ".markdown", ".mdx", ".zip"}
 ALLOWED_MD  = {".md", ".markdown", ".mdx"}
 ALLOWED_TPL = {".docx"}
+ALLOWED_ARCHIVE = {".zip"}
+
+# Loose multi-file uploads only; a .zip archive may hold any number of sections
+MAX_LOOSE_SECTIONS = 20
+
+# Admission control: render/merge is CPU-bound, PDF conversion launches soffice.
+# Beyond slots + queue depth, /convert answers 503 with Retry-After.
+RENDER_LIMIT = Limiter("render", slots=os.cpu_count() or 2, max_waiting=8)
+PDF_LIMIT    = Limiter("pdf", slots=2, max_waiting=8)
+
+# Jobs the preflight estimator deems too big for the request thread
+BACKGROUND = BackgroundRunner(workers=1, max_queued=4, store=STORAGE)
+
+# Stage events for /progress/<id> (SSE) and dedupe of identical in-flight jobs
+PROGRESS = ProgressBoard(store=STORAGE)
+
+# Each open event stream holds a server thread: cap how many, and end each after
+# SSE_MAX_S (EventSource reconnects with Last-Event-ID and carries on)
+SSE_LIMIT = Limiter("progress stream", slots=32, max_waiting=0)
+SSE_MAX_S = 120
+
+# Render + merge run in warm worker processes (one per CPU unless configured),
+# so concurrent conversions use every core; None = in the request thread
+RENDER_POOL = pool_from_config(BASE_DIR / "config.json", templates=[str(BASE_DIR / "templates" / "template.docx")])
+
+
+def _offload(ws: Workspace, fn, *args, cancel=None, memory: dict | None = None, **kwargs):
+    """
+    Run a render/merge stage in RENDER_POOL, or in this thread without one.
+    The stage is measured where it runs; `memory` keeps the largest figures seen.
+    """
+    if RENDER_POOL is None:
+        result, mem = estimator.measure(fn, *args, cancel=cancel, **kwargs)
+    else:
+        result, mem = RENDER_POOL.call(estimator.measure, fn, *args, cancel=cancel,
+                                       cancel_flag=ws.outputs / ".cancel", **kwargs)
+    if memory is not None:
+        memory["where"] = "thread" if RENDER_POOL is None else "render pool"
+        for key in ("job_mb", "rss_peak_mb"):
+            if mem[key] is not None and (memory.get(key) is None or mem[key] > memory[key]):
+                memory[key] = mem[key]
+    return result
 
 
 def _ext_ok(filename: str, allowed: set[str]) -> bool:
@@ -56,195 +133,368 @@ def _icon_for_name(name: str) -> str:
         return 'ti ti-file-type-docx'
     if ext == '.pdf':
         return 'ti ti-file-type-pdf'
+    if ext == '.zip':
+        return 'ti ti-file-zip'
     if ext in ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff', '.svg'):
         return 'ti ti-image'
     return 'ti ti-file-text'
 
 
+_EMPTY_RESULT = dict(
+    docx_url="",
+    pdf_url="",
+    pdf_preview_url="",
+    pdf_error_message="",
+    doc_version="",
+    issued_date="",
+    doc_author="",
+    template_name="",
+    total_pages="",
+    description="",
+    docx_size="",
+    pdf_size="",
+    pdf_optimization="",
+    xml_compaction="",
+    conversion_time="",
+    image_count="",
+    skipped_images="",
+    uploaded_files=[],
+    server_message="",
+    job_url=""
+)
+
+
+def _render_index(**fields) -> str:
+    ctx = dict(_EMPTY_RESULT)
+    ctx.update(fields)
+    return render_template("index.html", **ctx)
+
+
+def _error_page(message: str, uploaded_files=None) -> str:
+    return _render_index(pdf_error_message=message, server_message=message, uploaded_files=uploaded_files or [])
+
+
+@app.errorhandler(Overloaded)
+def overloaded(e: Overloaded):
+    print(f"Admission: {e.stage} queue full, asking client to retry in {e.retry_after}s")
+    resp = make_response(_error_page("The server is busy with other conversions. Please retry in a few seconds."), 503)
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp
+
+
 @app.get("/")
 def index():
-    return render_template(
-        "index.html",
-        docx_url="",
-        pdf_url="",
-        pdf_preview_url="",
-        pdf_error_message="",
-        doc_version="",
-        issued_date="",
-        doc_author="",
-        template_name="",
-        total_pages="",
-        description="",
-        docx_size="",
-        pdf_size="",
-        conversion_time="",
-        image_count="",
-        skipped_images="",
-        uploaded_files=[],
-        server_message=""
-    )
+    return _render_index()
 
 
-@app.post("/convert")
-def convert():
-    tpl        = request.files.get("template_file")
-    raw_single = request.files.get("raw_file")
-    raw_many   = request.files.getlist("raw_files") or []
+def _publish(ws: Workspace, area: str, paths) -> None:
+    """Copy workspace files to STORAGE as <area>/<job id>/<name> (area: uploads | outputs)."""
+    for p in paths:
+        if p is None or not Path(p).exists():
+            continue
+        key = f"{area}/{ws.id}/{Path(p).name}"
+        try:
+            STORAGE.put_file(key, Path(p))
+            ws.published.append(key)
+        except Exception as e:
+            print(f"Could not store {Path(p).name}:", e)
 
-    if not tpl or not tpl.filename or not _ext_ok(tpl.filename, ALLOWED_TPL):
-        return render_template("index.html", docx_url="", pdf_url="", pdf_preview_url="", pdf_error_message="Missing or invalid template", doc_version="", issued_date="", doc_author="", template_name="", total_pages="", description="", docx_size="", pdf_size="", conversion_time="", image_count="", skipped_images="", uploaded_files=[], server_message="Missing or invalid template")
 
-    if not raw_single and not raw_many:
-        return render_template("index.html", docx_url="", pdf_url="", pdf_preview_url="", pdf_error_message="No Markdown/Raw file(s) uploaded", doc_version="", issued_date="", doc_author="", template_name="", total_pages="", description="", docx_size="", pdf_size="", conversion_time="", image_count="", skipped_images="", uploaded_files=[], server_message="No Markdown/Raw file(s) uploaded")
+def _discard(ws: Workspace) -> None:
+    """Remove everything a cancelled job left: its directories and what was published from them."""
+    for key in ws.published:
+        try:
+            STORAGE.delete(key)
+        except Exception as e:
+            print(f"Could not delete {key}:", e)
+    shutil.rmtree(ws.uploads, ignore_errors=True)
+    shutil.rmtree(ws.outputs, ignore_errors=True)
 
-    if raw_many and raw_single:
-        raw_single = None
 
-    if raw_many:
-        filtered = []
-        for f in raw_many:
-            if not f or not f.filename:
-                continue
-            if not _ext_ok(f.filename, ALLOWED_MD):
-                return render_template("index.html", docx_url="", pdf_url="", pdf_preview_url="", pdf_error_message="Invalid raw file in list", doc_version="", issued_date="", doc_author="", template_name="", total_pages="", description="", docx_size="", pdf_size="", conversion_time="", image_count="", skipped_images="", uploaded_files=[], server_message="Invalid raw file in list")
-            filtered.append(f)
-        if not filtered:
-            return render_template("index.html", docx_url="", pdf_url="", pdf_preview_url="", pdf_error_message="No valid markdown files", doc_version="", issued_date="", doc_author="", template_name="", total_pages="", description="", docx_size="", pdf_size="", conversion_time="", image_count="", skipped_images="", uploaded_files=[], server_message="No valid markdown files")
-        if len(filtered) > 20:
-            filtered = filtered[:20]
-        raw_many = filtered
-
-    if raw_single:
-        if not raw_single.filename or not _ext_ok(raw_single.filename, ALLOWED_RAW):
-            return render_template("index.html", docx_url="", pdf_url="", pdf_preview_url="", pdf_error_message="Invalid raw file", doc_version="", issued_date="", doc_author="", template_name="", total_pages="", description="", docx_size="", pdf_size="", conversion_time="", image_count="", skipped_images="", uploaded_files=[], server_message="Invalid raw file")
-
-    ts = time.strftime("%Y%m%d-%H%M%S")
+def _store_upload(upload, dst: Path) -> str:
+    """Store + link an upload; returns its SHA-256."""
+    if isinstance(upload, BlobUpload):
+        return upload.save(dst)
+    return UPLOAD_STORE.save(upload, dst).name
+
+
+def _save_uploads(ws: Workspace, tpl, raw_single, raw_many) -> dict:
+    """
+    Save the template and raw uploads into the job workspace: each file is
+    stored once in UPLOAD_STORE and hard-linked under its per-job name.
+    A .zip raw upload is extracted into <workspace>/archive/; its sections
+    become the section list and its images the resolver's first stop.
+    Raises ArchiveError for unusable archives.
+    """
+    ts = ws.ts
 
     safe_tpl  = secure_filename(tpl.filename) or f"template_{ts}.docx"
-    tpl_path  = UPLOAD_DIR / f"{Path(safe_tpl).stem}_{ts}.docx"
-    tpl.save(tpl_path)
+    tpl_path  = ws.uploads / f"{Path(safe_tpl).stem}_{ts}.docx"
+    digests = [_store_upload(tpl, tpl_path)]
 
-    out_docx  = OUTPUT_DIR / f"merged_{ts}.docx"
-    out_pdf   = OUTPUT_DIR / f"merged_{ts}.pdf"
+    saved = {
+        "tpl_path": tpl_path,
+        "template_name": tpl.filename or "",
+        "sections": [],       # [(path, original_name)] for multi-Markdown uploads
+        "raw_path": None,     # single raw upload (.md or .docx)
+        "raw_name": "",
+        "archive_name": "",   # .zip upload: sections + images extracted from it
+        "image_index": None,
+        "uploaded_files": [],
+        "digests": digests,   # SHA-256 of every uploaded file, template first
+    }
 
-    apply_img_style = request.form.get("img_style") is not None
+    if raw_many:
+        for i, f in enumerate(raw_many, start=1):
+            original_name = f.filename or f"section_{i:02d}.md"
+            safe = secure_filename(original_name) or f"section_{i:02d}.md"
+            p = ws.uploads / f"{Path(safe).stem}_{ts}_{i:02d}{Path(safe).suffix.lower()}"
+            digests.append(_store_upload(f, p))
+            saved["sections"].append((p, original_name))
+    elif _ext_ok(raw_single.filename, ALLOWED_ARCHIVE):
+        original_name = raw_single.filename
+        safe = secure_filename(original_name) or f"archive_{ts}.zip"
+        zip_path = ws.uploads / f"{Path(safe).stem}_{ts}.zip"
+        digests.append(_store_upload(raw_single, zip_path))
+        _publish(ws, "uploads", [tpl_path, zip_path])
+        size = zip_path.stat().st_size
+        try:
+            sections, index = extract_archive(zip_path, ws.uploads / "archive")
+        finally:
+            zip_path.unlink(missing_ok=True)
+        saved["sections"] = sections
+        saved["image_index"] = index
+        saved["archive_name"] = original_name
+        saved["uploaded_files"].append({
+            "name": zip_path.name,
+            "display_name": f"{original_name} ({len(sections)} sections, {len(set(index.values()))} images)",
+            "size": size,
+            "size_human": sizeof_fmt(size),
+            "icon": _icon_for_name(original_name),
+        })
+        return saved
+    else:
+        raw_ext  = Path(raw_single.filename).suffix.lower()
+        original_name = raw_single.filename or f"raw_{ts}{raw_ext}"
+        safe_raw = secure_filename(original_name) or f"raw_{ts}{raw_ext}"
+        raw_path = ws.uploads / f"{Path(safe_raw).stem}_{ts}{raw_ext}"
+        digests.append(_store_upload(raw_single, raw_path))
+        saved["raw_path"] = raw_path
+        saved["raw_name"] = original_name
 
-    pdf_error_message = ""
-    image_count = 0
-    skipped_images = 0
-    conversion_time = ""
-    uploaded_files = []
+    pairs = saved["sections"] or [(saved["raw_path"], saved["raw_name"])]
+    _publish(ws, "uploads", [tpl_path] + [p for p, _ in pairs])
+    for p, orig in pairs:
+        try:
+            size = p.stat().st_size
+        except Exception:
+            size = 0
+        saved["uploaded_files"].append({
+            "name": str(p.name),
+            "display_name": orig,
+            "size": size,
+            "size_human": sizeof_fmt(size),
+            "icon": _icon_for_name(orig)
+        })
+    return saved
 
-    try:
-        t0 = time.perf_counter()
 
-        if raw_many:
-            saved = []
-            base_dirs = []
-            saved_pairs = []
-            for i, f in enumerate(raw_many, start=1):
-                original_name = f.filename or f"section_{i:02d}.md"
-                safe = secure_filename(original_name) or f"section_{i:02d}.md"
-                p = UPLOAD_DIR / f"{Path(safe).stem}_{ts}_{i:02d}{Path(safe).suffix.lower()}"
-                f.save(p)
-                saved.append(p)
-                saved_pairs.append((p, original_name))
-                base_dirs.append(Path(original_name).parent)
-
-            for p, orig in saved_pairs:
-                try:
-                    size = p.stat().st_size
-                except Exception:
-                    size = 0
-                uploaded_files.append({
-                    "name": str(p.name),
-                    "display_name": orig,
-                    "size": size,
-                    "size_human": sizeof_fmt(size),
-                    "icon": _icon_for_name(orig)
-                })
-
-            combined_md = UPLOAD_DIR / f"combined_{ts}.md"
-            with combined_md.open("w", encoding="utf-8") as out:
-                for i, p in enumerate(saved, start=1):
-                    text = p.read_text(encoding="utf-8")
-                    out.write(text)
-                    if i != len(saved):
-                        out.write("\n\n")
-
-            tmp_docx = str(out_docx.with_name(out_docx.stem + "_from_md.docx"))
-            md_file_to_docx(
-                str(combined_md),
-                tmp_docx,
-                base_dir=base_dirs[0].resolve() if base_dirs else None,
+def _markdown_inputs(saved: dict) -> list:
+    """(markdown_path, base_dir) pairs for the estimator; empty for raw .docx uploads."""
+    if saved["archive_name"]:
+        return [(p, p.parent) for p, _ in saved["sections"]]
+    if saved["sections"]:
+        return [(p, Path(orig).parent.resolve()) for p, orig in saved["sections"]]
+    raw_path = saved["raw_path"]
+    if raw_path.suffix.lower() in ALLOWED_MD:
+        return [(raw_path, Path(saved["raw_name"]).parent)]
+    return []
+
+
+def _render_and_merge(ws: Workspace, saved: dict, apply_img_style: bool, streaming: bool = False,
+                      toc_mode: str = "field", compact: bool = True) -> dict:
+    """Render Markdown and merge into the template. Raises on failure (Cancelled once cancelled)."""
+    ts = ws.ts
+    cancel = PROGRESS.cancel_event(ws.id)
+    tpl_path = saved["tpl_path"]
+    out_docx = ws.outputs / f"merged_{ts}.docx"
+
+    memory: dict = {}
+    t0 = time.perf_counter()
+
+    if saved["sections"]:
+        saved_paths = [p for p, _ in saved["sections"]]
+        if saved["archive_name"]:
+            base_dirs = [p.parent for p in saved_paths]
+        else:
+            base_dirs = [Path(orig).parent for _, orig in saved["sections"]]
+
+        combined_md = ws.uploads / f"combined_{ts}.md"
+        with combined_md.open("w", encoding="utf-8") as out:
+            for i, p in enumerate(saved_paths, start=1):
+                text = p.read_text(encoding="utf-8")
+                out.write(text)
+                if i != len(saved_paths):
+                    out.write("\n\n")
+
+        tmp_docx = str(out_docx.with_name(out_docx.stem + "_from_md.docx"))
+        PROGRESS.emit(ws.id, "rendering", sections=len(saved_paths))
+        _offload(
+            ws,
+            md_to_docx,
+            MD_ENGINE,
+            str(combined_md),
+            tmp_docx,
+            reference_doc=str(tpl_path),
+            base_dir=base_dirs[0].resolve() if base_dirs else None,
+            style_images=apply_img_style,
+            debug=True,
+            image_index=saved["image_index"],
+            cancel=cancel,
+            memory=memory,
+        )
+        PROGRESS.emit(ws.id, "merging", sections_rendered=len(saved_paths))
+
+        stats = _offload(ws, merge_from_any, str(tpl_path), tmp_docx, str(out_docx), streaming=streaming,
+                         toc_mode=toc_mode, compact=compact, cancel=cancel, memory=memory)
+    else:
+        raw_path = saved["raw_path"]
+        if raw_path.suffix.lower() in ALLOWED_MD:
+            PROGRESS.emit(ws.id, "rendering", sections=1)
+            _offload(
+                ws,
+                md_to_docx,
+                MD_ENGINE,
+                str(raw_path),
+                str(out_docx),
+                reference_doc=str(tpl_path),
+                base_dir=Path(saved["raw_name"]).parent,
                 style_images=apply_img_style,
                 debug=True,
+                cancel=cancel,
+                memory=memory,
             )
+            PROGRESS.emit(ws.id, "merging", sections_rendered=1)
+            stats = _offload(ws, merge_from_any, str(tpl_path), str(out_docx), str(out_docx),
+                             streaming=streaming, toc_mode=toc_mode, compact=compact, cancel=cancel,
+                             memory=memory)
+        else:
+            PROGRESS.emit(ws.id, "merging")
+            stats = _offload(ws, merge_from_any, str(tpl_path), str(raw_path), str(out_docx),
+                             streaming=streaming, toc_mode=toc_mode, compact=compact, cancel=cancel,
+                             memory=memory)
+
+    t1 = time.perf_counter()
+    PROGRESS.emit(ws.id, "merged", images_inserted=stats.get("inserted_images", 0),
+                  images_skipped=stats.get("skipped_images", 0))
+    return {"out_docx": out_docx, "stats": stats, "render_seconds": t1 - t0, "memory": memory}
+
 
-            stats = merge_from_any(str(tpl_path), tmp_docx, str(out_docx))
+def _export_pdf(out_docx: Path, optimize: bool = False, sections: bool = False, cancel=None) -> dict:
+    """
+    Convert the merged DOCX to PDF if an engine is available; with optimize,
+    post-process it (dedupe, object streams, linearization) and keep the stats.
+    With sections, long documents render in Heading 1 chunks side by side.
+    Setting `cancel` kills the conversion (the caller checks it afterwards).
+    """
+    out_pdf = out_docx.with_suffix(".pdf")
+    available, detail = detect_pdf_engine()
+    if not available:
+        print("No PDF engine detected:", detail)
+        return {"out_pdf": None, "pdf_error_message": "No PDF converter installed (LibreOffice or MS Word required)."}
+
+    t0 = time.perf_counter()
+    with PDF_LIMIT.slot():
+        if sections:
+            # One soffice per chunk: take only PDF slots that are free, so the limiter still bounds soffice count
+            wanted = min(os.cpu_count() or 2, SECTION_MAX_WORKERS) - 1
+            with PDF_LIMIT.extra_slots(wanted) as extra:
+                err = docx_to_pdf_sections(out_docx, out_pdf, workers=1 + extra, cancel=cancel)["error"]
         else:
-            raw_ext  = Path(raw_single.filename).suffix.lower()
-            original_name = raw_single.filename or f"raw_{ts}{raw_ext}"
-            safe_raw = secure_filename(original_name) or f"raw_{ts}{raw_ext}"
-            raw_path = UPLOAD_DIR / f"{Path(safe_raw).stem}_{ts}{raw_ext}"
-            raw_single.save(raw_path)
+            err = docx_to_pdf_batched(out_docx, out_pdf, cancel=cancel)
+    took = time.perf_counter() - t0
+    if err is None and out_pdf.exists():
+        result = {"out_pdf": out_pdf, "pdf_error_message": "", "pdf_seconds": took}
+        if optimize:
+            opt = optimize_pdf(out_pdf)
+            print(f"🗜️ PDF optimisation ({opt['engine']}): {opt['before_bytes']} → {opt['after_bytes']} bytes "
+                  f"in {opt['seconds']}s" + (f" — {opt['error']}" if opt["error"] else ""))
+            result["pdf_optimization"] = opt
+        return result
+    print("PDF conversion failed:", err)
+    return {"out_pdf": None, "pdf_error_message": err or "PDF conversion failed on the server.", "pdf_seconds": took}
 
-            try:
-                size = raw_path.stat().st_size
-            except Exception:
-                size = 0
-            uploaded_files.append({
-                "name": str(raw_path.name),
-                "display_name": original_name,
-                "size": size,
-                "size_human": sizeof_fmt(size),
-                "icon": _icon_for_name(original_name)
-            })
-
-            if raw_ext in {".md", ".markdown", ".mdx"}:
-                md_file_to_docx(
-                    str(raw_path),
-                    str(out_docx),
-                    base_dir=Path(original_name).parent,
-                    style_images=apply_img_style,
-                    debug=True,
-                )
-                stats = merge_from_any(str(tpl_path), str(out_docx), str(out_docx))
-            else:
-                stats = merge_from_any(str(tpl_path), str(raw_path), str(out_docx))
 
-        t1 = time.perf_counter()
-        conversion_time = f"{(t1 - t0):.2f}s"
+def _finish_job(ws: Workspace, saved: dict, merged: dict, preflight: dict,
+                optimize: bool = False) -> dict:
+    """PDF export, metadata and calibration logging; everything the result page needs."""
+    cancel = PROGRESS.cancel_event(ws.id)
+    check_cancel(cancel)
+    PROGRESS.emit(ws.id, "converting")
+    pdf = _export_pdf(merged["out_docx"], optimize=optimize, sections=preflight.get("parallel_pdf", False),
+                      cancel=cancel)
+    check_cancel(cancel)
+    _publish(ws, "outputs", [merged["out_docx"], pdf["out_pdf"]])
+    meta = _template_metadata(saved["tpl_path"], saved["template_name"])
 
-        image_count = int(stats.get("inserted_images", 0))
-        skipped_images = int(stats.get("skipped_images", 0))
+    out_pdf = pdf["out_pdf"]
+    if out_pdf is not None and PdfReader is not None:
+        try:
+            reader = PdfReader(str(out_pdf))
+            meta["total_pages"] = str(len(reader.pages))
+        except Exception as e:
+            print("PDF page count failed:", e)
+    PROGRESS.emit(ws.id, "converted", pdf=out_pdf is not None,
+                  pages=int(meta["total_pages"]) if str(meta["total_pages"]).isdigit() else None)
 
-    except Exception as e:
-        print("Merge error:", e)
-        pdf_error_message = "Internal error while merging files."
-        return render_template("index.html", docx_url="", pdf_url="", pdf_preview_url="", pdf_error_message=pdf_error_message, doc_version="", issued_date="", doc_author="", template_name="", total_pages="", description="", docx_size="", pdf_size="", conversion_time="", image_count="", skipped_images="", uploaded_files=uploaded_files, server_message="Internal error while merging files.")
+    if preflight:
+        estimator.record(ws.id, preflight["features"], preflight["estimate"], {
+            "render_seconds": round(merged["render_seconds"], 2),
+            "pdf_seconds": round(pdf.get("pdf_seconds", 0.0), 2),
+            "seconds": round(merged["render_seconds"] + pdf.get("pdf_seconds", 0.0), 2),
+            "pages": int(meta["total_pages"]) if str(meta["total_pages"]).isdigit() else None,
+            # Memory the render/merge added in the process that ran it, not this web process's lifetime peak
+            "memory_mb": merged["memory"].get("job_mb"),
+            "rss_peak_mb": merged["memory"].get("rss_peak_mb"),
+            "measured_in": merged["memory"].get("where"),
+        })
 
-    docx_url = url_for("download_output", filename=out_docx.name) if out_docx.exists() else ""
+    return {
+        "out_docx": merged["out_docx"],
+        "out_pdf": out_pdf,
+        "pdf_error_message": pdf["pdf_error_message"],
+        "stats": merged["stats"],
+        "pdf_optimization": pdf.get("pdf_optimization"),
+        "conversion_time": f"{merged['render_seconds']:.2f}s",
+        "uploaded_files": saved["uploaded_files"],
+        "meta": meta,
+    }
 
-    pdf_url = ""
-    pdf_preview_url = ""
-    available, detail = detect_pdf_engine()
-    if available:
-        err = docx_to_pdf(out_docx, out_pdf)
-        if err is None and out_pdf.exists():
-            pdf_url = url_for("download_output", filename=out_pdf.name)
-            pdf_preview_url = url_for("preview_output", filename=out_pdf.name)
-        else:
-            print("PDF conversion failed:", err)
-            pdf_error_message = err or "PDF conversion failed on the server."
-    else:
-        print("No PDF engine detected:", detail)
-        pdf_error_message = "No PDF converter installed (LibreOffice or MS Word required)."
 
+def _run_job(ws: Workspace, saved: dict, apply_img_style: bool, preflight: dict,
+             optimize: bool = False, toc_mode: str = "field", compact: bool = True) -> dict:
+    """Whole pipeline for the background path (no request context available here)."""
+    try:
+        merged = _render_and_merge(ws, saved, apply_img_style, streaming=preflight.get("streaming", False),
+                                   toc_mode=toc_mode, compact=compact)
+        result = _finish_job(ws, saved, merged, preflight, optimize)
+    except Cancelled:
+        _discard(ws)
+        PROGRESS.finish(ws.id, "cancelled")
+        raise
+    except Exception as e:
+        _discard(ws)
+        PROGRESS.finish(ws.id, "failed", error=str(e) or e.__class__.__name__)
+        raise
+    PROGRESS.finish(ws.id, "done", result=result)
+    return result
+
+
+def _template_metadata(tpl_path: Path, template_name: str) -> dict:
+    """Read version/author/date/etc. from the template's revision table or core properties."""
     doc_version = ""
     issued_date = ""
     doc_author = ""
-    template_name = tpl.filename if tpl and tpl.filename else ""
     total_pages = ""
     description = ""
 
@@ -332,78 +582,580 @@ def convert():
     except Exception as e:
         print("Template metadata read failed:", e)
 
-    try:
-        if pdf_url and PdfReader is not None and out_pdf.exists():
-            try:
-                reader = PdfReader(str(out_pdf))
-                total_pages = str(len(reader.pages))
-            except Exception as e:
-                print("PDF page count failed:", e)
-    except Exception as e:
-        print("page count/check error:", e)
+    return {
+        "doc_version": doc_version,
+        "issued_date": issued_date,
+        "doc_author": doc_author,
+        "template_name": template_name,
+        "total_pages": total_pages,
+        "description": description,
+    }
+
+
+def _result_page(ws_id: str, result: dict) -> str:
+    # Paths arrive as strings when the job state was read back from job.json;
+    # the files themselves are looked up in STORAGE (the job may have run on another node)
+    out_docx = Path(result["out_docx"])
+    out_pdf  = Path(result["out_pdf"]) if result["out_pdf"] else None
+    stats    = result["stats"]
+    docx_obj = STORAGE.stat(f"outputs/{ws_id}/{out_docx.name}")
+    pdf_obj  = STORAGE.stat(f"outputs/{ws_id}/{out_pdf.name}") if out_pdf is not None else None
+
+    docx_url = url_for("download_output", filename=f"{ws_id}/{out_docx.name}") if docx_obj else ""
+    pdf_url = ""
+    pdf_preview_url = ""
+    if pdf_obj is not None:
+        pdf_url = url_for("download_output", filename=f"{ws_id}/{out_pdf.name}")
+        pdf_preview_url = url_for("preview_output", filename=f"{ws_id}/{out_pdf.name}")
 
     docx_size = ""
     pdf_size = ""
-    try:
-        if out_docx.exists():
-            docx_size = sizeof_fmt(out_docx.stat().st_size)
-    except Exception:
-        docx_size = ""
-    try:
-        if out_pdf.exists():
-            pdf_size = sizeof_fmt(out_pdf.stat().st_size)
-    except Exception:
-        pdf_size = ""
+    pdf_optimization = ""
+    opt = result.get("pdf_optimization")
+    if opt and not opt.get("error"):
+        pdf_optimization = (f"{sizeof_fmt(opt['before_bytes'])} → {sizeof_fmt(opt['after_bytes'])} "
+                            f"in {opt['seconds']:.2f}s ({opt['engine']}"
+                            f"{', linearized' if opt['linearized'] else ', not linearized'})")
+    elif opt:
+        pdf_optimization = f"skipped: {opt['error']}"
+    xml_compaction = ""
+    comp = stats.get("compaction")
+    if comp:
+        xml_compaction = (f"{comp['elements_before']:,} → {comp['elements_after']:,} elements "
+                          f"({comp['paragraphs_removed']} empty paragraphs, "
+                          f"{comp['runs_removed'] + comp['runs_merged']} runs removed, "
+                          f"{comp['props_redundant']} redundant properties)")
+    if docx_obj is not None:
+        docx_size = sizeof_fmt(docx_obj.size)
+    if pdf_obj is not None:
+        pdf_size = sizeof_fmt(pdf_obj.size)
 
-    return render_template(
-        "index.html",
+    return _render_index(
         docx_url=docx_url,
         pdf_url=pdf_url,
         pdf_preview_url=pdf_preview_url,
-        pdf_error_message=pdf_error_message,
-        doc_version=doc_version,
-        issued_date=issued_date,
-        doc_author=doc_author,
-        template_name=template_name,
-        total_pages=total_pages,
-        description=description,
+        pdf_error_message=result["pdf_error_message"],
         docx_size=docx_size,
         pdf_size=pdf_size,
-        conversion_time=conversion_time,
-        image_count=str(image_count),
-        skipped_images=str(skipped_images),
-        uploaded_files=uploaded_files,
-        server_message=""
+        pdf_optimization=pdf_optimization,
+        xml_compaction=xml_compaction,
+        conversion_time=result["conversion_time"],
+        image_count=str(int(stats.get("inserted_images", 0))),
+        skipped_images=str(int(stats.get("skipped_images", 0))),
+        uploaded_files=result["uploaded_files"],
+        **result["meta"],
     )
 
 
-@app.get("/outputs/<path:filename>")
-def download_output(filename):
-    return send_from_directory(OUTPUT_DIR, filename, as_attachment=True)
+# ===================== BLOB UPLOADS =====================
 
+# The browser hashes each file (SHA-256), asks /blobs/check which ones the store
+# lacks, PUTs only those, and then posts /convert with "<sha256>:<filename>"
+# references (template_blob, raw_blobs) instead of the files themselves.
+# Blobs are content-addressed, so an unchanged chapter or template costs one
+# HEAD per Convert click instead of a re-upload.
 
-@app.get("/outputs/inline/<path:filename>")
-def preview_output(filename):
-    target = OUTPUT_DIR / filename
-    if not target.exists():
-        abort(404)
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+MAX_BLOB_CHECK = 64
+
+
+class _BlobMismatch(Exception):
+    pass
+
+
+def _blob_key(sha: str) -> str:
+    if not _SHA256_RE.match(sha or ""):
+        raise ValueError(f"not a SHA-256 hex digest: {sha!r}")
+    return f"blobs/{sha}"
+
+
+class BlobUpload:
+    """A stored blob standing in for a request.files entry (filename + save())."""
+
+    def __init__(self, sha: str, filename: str):
+        self.key = _blob_key(sha)
+        self.filename = filename
+
+    def save(self, dst: Path) -> str:
+        local = STORAGE.local_path(self.key)
+        if local is None:
+            with STORAGE.open_read(self.key) as src:
+                local = UPLOAD_STORE.put(src)
+        UPLOAD_STORE.link(local, dst)
+        return self.key.rsplit("/", 1)[1]
+
+
+def _blob_refs(refs: list[str]) -> tuple[list[BlobUpload], list[str]]:
+    """Parse "<sha256>:<filename>" references → (uploads, missing hashes). ValueError if malformed."""
+    uploads, missing = [], []
+    for ref in refs:
+        sha, sep, name = (ref or "").partition(":")
+        if not sep or not name:
+            raise ValueError(f"invalid blob reference: {ref!r}")
+        up = BlobUpload(sha.lower(), name)
+        if STORAGE.stat(up.key) is None:
+            missing.append(up.key.rsplit("/", 1)[1])
+        uploads.append(up)
+    return uploads, missing
+
+
+@app.post("/blobs/check")
+def blobs_check():
+    hashes = (request.get_json(silent=True) or {}).get("hashes")
+    if not isinstance(hashes, list) or len(hashes) > MAX_BLOB_CHECK:
+        return jsonify({"error": f"expected {{\"hashes\": [...]}} with at most {MAX_BLOB_CHECK} entries"}), 400
+    missing = []
+    for sha in dict.fromkeys(str(h).lower() for h in hashes):
+        try:
+            if STORAGE.stat(_blob_key(sha)) is None:
+                missing.append(sha)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    return jsonify({"missing": missing})
+
+
+@app.put("/blobs/<sha>")
+def blobs_put(sha):
+    sha = sha.lower()
+    try:
+        key = _blob_key(sha)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if STORAGE.stat(key) is not None:
+        return jsonify({"sha256": sha, "stored": False}), 200
+
+    # Hashed while it streams into the store; a mismatch aborts the write
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with STORAGE.open_write(key) as out:
+            while True:
+                chunk = request.stream.read(1024 * 1024)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                size += len(chunk)
+                out.write(chunk)
+            if digest.hexdigest() != sha:
+                raise _BlobMismatch()
+    except _BlobMismatch:
+        return jsonify({"error": "body does not match its SHA-256"}), 400
+    print(f"📦 Blob stored: {sha[:12]}… ({sizeof_fmt(size)})")
+    return jsonify({"sha256": sha, "stored": True}), 201
+
+
+@app.post("/convert")
+def convert():
+    # `scope` outlives the render slot: the disconnect watch covers the PDF step too
+    with ExitStack() as scope:
+        return _convert(scope)
+
+
+def _convert(scope: ExitStack):
+    # Admission comes before request.files is touched: a queued or rejected
+    # request never has its (up to 100 MB) body parsed into memory.
+    with ExitStack() as held:
+        held.enter_context(RENDER_LIMIT.slot())
+        tpl        = request.files.get("template_file")
+        raw_single = request.files.get("raw_file")
+        raw_many   = request.files.getlist("raw_files") or []
+
+        # Blob references stand in for files the browser didn't re-upload
+        tpl_ref  = request.form.get("template_blob")
+        raw_refs = request.form.getlist("raw_blobs")
+        if tpl_ref or raw_refs:
+            try:
+                tpl_blobs, missing = _blob_refs([tpl_ref] if tpl_ref else [])
+                raw_blobs, missing_raw = _blob_refs(raw_refs)
+            except ValueError as e:
+                return make_response(_error_page(str(e)), 400)
+            if missing or missing_raw:
+                # The client uploads them and retries
+                return jsonify({"error": "unknown blobs", "missing": missing + missing_raw}), 409
+            tpl = tpl or (tpl_blobs[0] if tpl_blobs else None)
+            raw_many = raw_many or raw_blobs
+
+        if not tpl or not tpl.filename or not _ext_ok(tpl.filename, ALLOWED_TPL):
+            return _error_page("Missing or invalid template")
+
+        if not raw_single and not raw_many:
+            return _error_page("No Markdown/Raw file(s) uploaded")
+
+        if raw_many and raw_single:
+            raw_single = None
 
-    if target.suffix.lower() == ".pdf":
+        if raw_many:
+            filtered = []
+            for f in raw_many:
+                if not f or not f.filename:
+                    continue
+                if _ext_ok(f.filename, ALLOWED_ARCHIVE):
+                    if len(raw_many) > 1:
+                        return _error_page("Upload a .zip archive on its own, without other sections")
+                    raw_single = f
+                    break
+                if not _ext_ok(f.filename, ALLOWED_MD):
+                    return _error_page("Invalid raw file in list")
+                filtered.append(f)
+            if raw_single:
+                raw_many = []
+            elif not filtered:
+                return _error_page("No valid markdown files")
+            else:
+                raw_many = filtered[:MAX_LOOSE_SECTIONS]
+
+        if raw_single:
+            if not raw_single.filename or not _ext_ok(raw_single.filename, ALLOWED_RAW):
+                return _error_page("Invalid raw file")
+
+        apply_img_style = request.form.get("img_style") is not None
+        # Opt-in per request: linearize + compress the PDF after conversion
+        want_pdf_optimize = request.form.get("pdf_optimize", "") in ("1", "on", "true")
+        # "server": build the TOC during the merge instead of forcing a field update on open
+        toc_mode = "server" if request.form.get("toc_mode") == "server" else "field"
+        # XML compaction is on unless the form turns it off
+        compact = request.form.get("compact", "1") not in ("0", "off", "false")
+
+        ws = Workspace(UPLOAD_DIR, OUTPUT_DIR)
         try:
-            resp = make_response(send_file(str(target.resolve()), mimetype="application/pdf"))
-            resp.headers["Content-Disposition"] = f"inline; filename={target.name}"
-            resp.headers['X-Frame-Options'] = 'SAMEORIGIN'
-            resp.headers['Content-Security-Policy'] = "frame-ancestors 'self'"
-            return resp
+            saved = _save_uploads(ws, tpl, raw_single, raw_many)
+        except ArchiveError as e:
+            print(f"Archive rejected [{ws.id}]:", e)
+            _discard(ws)
+            return _error_page(str(e))
+        except Exception:
+            _discard(ws)
+            raise
+
+        running = PROGRESS.open(ws.id, alias=_progress_id(request.form.get("progress_id")),
+                                dedupe_key=_dedupe_key(saved, apply_img_style, want_pdf_optimize, toc_mode,
+                                                       compact))
+        if running is not None:
+            held.close()   # don't sit on a render slot while the first submission works
+            return _join_inflight(running, ws, scope)
+        # A client that hangs up (closed tab, proxy timeout) cancels the job
+        scope.enter_context(watch_disconnect(
+            request.environ, lambda: PROGRESS.release(ws.id, "client disconnected")))
+        PROGRESS.emit(ws.id, "uploaded", files=len(saved["digests"]))
+
+        # Preflight: cheap scan of the Markdown to decide where (and whether) to run
+        preflight = {}
+        md_inputs = _markdown_inputs(saved)
+        if md_inputs:
+            feats = estimator.scan_markdown(md_inputs, saved["image_index"])
+            est = estimator.estimate(feats)
+            route, reason = estimator.decide(est)
+            print(f"📏 Preflight [{ws.id}]: {feats} → {est} → {route}")
+            preflight = {"features": feats, "estimate": est,
+                         "streaming": est["memory_mb"] > estimator.THRESHOLDS["streaming_memory_mb"],
+                         "parallel_pdf": est["pages"] >= estimator.THRESHOLDS["parallel_pdf_pages"]}
+            if route == "reject":
+                _discard(ws)
+                PROGRESS.finish(ws.id, "failed", error=reason)
+                return make_response(_error_page(reason, saved["uploaded_files"]), 413)
+            if route == "background":
+                try:
+                    BACKGROUND.submit(ws.id, _run_job, ws, saved, apply_img_style, preflight,
+                                      want_pdf_optimize, toc_mode, compact)
+                except Overloaded:
+                    _discard(ws)
+                    PROGRESS.finish(ws.id, "failed", error="background queue is full")
+                    raise
+                PROGRESS.emit(ws.id, "queued")
+                return make_response(_render_index(
+                    server_message=f"{reason} Results will be at {url_for('job_result', job_id=ws.id)}",
+                    job_url=url_for("job_result", job_id=ws.id),
+                    uploaded_files=saved["uploaded_files"],
+                ), 202)
+
+        try:
+            merged = _render_and_merge(ws, saved, apply_img_style, streaming=preflight.get("streaming", False),
+                                       toc_mode=toc_mode, compact=compact)
+        except Cancelled:
+            return _cancelled(ws)
         except Exception as e:
-            print("Preview serve error:", e)
-            return send_from_directory(OUTPUT_DIR, filename, as_attachment=False)
+            print("Merge error:", e)
+            _discard(ws)
+            PROGRESS.finish(ws.id, "failed", error="Internal error while merging files.")
+            return _error_page("Internal error while merging files.", saved["uploaded_files"])
+
+    try:
+        result = _finish_job(ws, saved, merged, preflight, want_pdf_optimize)
+    except Cancelled:
+        return _cancelled(ws)
+    except Overloaded:
+        # PDF slots or remote workers saturated → 503 + Retry-After; the retry starts over
+        _discard(ws)
+        PROGRESS.finish(ws.id, "failed", error="PDF conversion is busy")
+        raise
+    except Exception as e:
+        _discard(ws)
+        PROGRESS.finish(ws.id, "failed", error=str(e) or e.__class__.__name__)
+        raise
+    PROGRESS.finish(ws.id, "done", result=result)
+    return _result_page(ws.id, result)
+
+
+# ===================== PROGRESS =====================
+
+_PROGRESS_ID_RE = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+# How long a resubmission waits for the identical job it was folded into
+JOIN_TIMEOUT_S = 900
+
+
+def _progress_id(value: str | None) -> str | None:
+    """The browser's channel alias, if it sent a usable one."""
+    return value if value and _PROGRESS_ID_RE.match(value) else None
+
+
+def _dedupe_key(saved: dict, apply_img_style: bool, optimize: bool, toc_mode: str,
+                compact: bool = True) -> str:
+    """Same files (content and names, in order) + same options → same key."""
+    names = [saved["template_name"]] + [f["display_name"] for f in saved["uploaded_files"]]
+    blob = json.dumps([saved["digests"], names, apply_img_style, optimize, toc_mode, compact])
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def _cancelled(ws: Workspace):
+    _discard(ws)
+    PROGRESS.finish(ws.id, "cancelled")
+    print(f"🛑 Job {ws.id} cancelled; workspace removed")
+    return make_response(_error_page("Conversion cancelled."), 409)
+
+
+def _join_inflight(job_id: str, ws: Workspace, scope: ExitStack):
+    """Answer a resubmission with the result of the identical job already running."""
+    print(f"♻️ Resubmission [{ws.id}] folded into running job {job_id}")
+    _discard(ws)
+    if BACKGROUND.get(job_id) is not None:
+        return make_response(_render_index(
+            server_message=f"This conversion is already running. Results will be at {url_for('job_result', job_id=job_id)}",
+            job_url=url_for("job_result", job_id=job_id),
+        ), 202)
+
+    gone = threading.Event()
+
+    def hung_up():
+        gone.set()
+        PROGRESS.release(job_id, "client disconnected")
+
+    scope.enter_context(watch_disconnect(request.environ, hung_up))
+    outcome, deadline = None, time.monotonic() + JOIN_TIMEOUT_S
+    while outcome is None and not gone.is_set() and time.monotonic() < deadline:
+        outcome = PROGRESS.wait(job_id, timeout_s=1.0)
+    if outcome is None:
+        return make_response(_error_page("The same conversion is still running; please try again shortly."), 503)
+    if outcome["state"] != "done":
+        return _error_page(outcome["error"] or "The same conversion failed.")
+    return _result_page(job_id, outcome["result"])
+
+
+@app.post("/progress/<key>/cancel")
+def progress_cancel(key):
+    """Explicit cancel (Cancel button, tab closing via sendBeacon) for a job id or progress_id."""
+    if not _PROGRESS_ID_RE.match(key):
+        abort(404)
+    return jsonify({"cancelled": PROGRESS.cancel(key, "cancelled by the user")})
+
+
+@app.get("/progress/<key>")
+def progress_events(key):
+    """
+    Server-sent events for one job (by job id or the browser's progress_id):
+    one "progress" event per stage — uploaded, queued, rendering, merging,
+    merged, converting, converted, then done | failed | cancelled — each carrying the
+    counts so far (files, sections, images_inserted, pages …).
+    """
+    if not _PROGRESS_ID_RE.match(key):
+        abort(404)
+    try:
+        after = int(request.headers.get("Last-Event-ID", "0"))
+    except ValueError:
+        after = 0
+
+    scope = ExitStack()
+    scope.enter_context(SSE_LIMIT.slot())   # all streams taken → Overloaded (503)
+
+    def stream():
+        yield "retry: 3000\n\n"
+        for event in PROGRESS.follow(key, after=after, timeout_s=SSE_MAX_S):
+            if event is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"id: {event['seq']}\nevent: progress\ndata: {json.dumps(event)}\n\n"
+
+    resp = app.response_class(stream(), mimetype="text/event-stream")
+    resp.call_on_close(scope.close)
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"   # nginx: don't buffer the stream
+    return resp
+
+
+@app.get("/jobs/<job_id>")
+def job_result(job_id):
+    job = BACKGROUND.get(job_id)
+    if job is None:
+        abort(404)
+    if job["state"] == "done":
+        return _result_page(job_id, job["result"])
+    if job["state"] == "failed":
+        return _error_page(f"Background conversion failed: {job['error']}")
+    return make_response(_render_index(
+        server_message=f"Conversion is {job['state']}. This page refreshes until it is ready.",
+        job_url=url_for("job_result", job_id=job_id),
+    ), 202)
+
+
+@app.get("/jobs/<job_id>/status")
+def job_status(job_id):
+    job = BACKGROUND.get(job_id)
+    if job is None:
+        abort(404)
+    return jsonify({"job": job_id, "state": job["state"], "error": job["error"]})
+
+
+# ===================== WARM-UP =====================
+
+DEFAULT_TEMPLATE = BASE_DIR / "templates" / "template.docx"
+
+_WARMUP = {"state": "cold", "detail": "", "seconds": None}
+
+_WARMUP_SAMPLE = """# Warm-up
+
+Some **bold** text.
+
+- item one
+  - item two
+
+| A | B |
+|---|---|
+| 1 | 2 |
+"""
+
+
+def warm_up(dummy_pdf: bool = True) -> None:
+    """
+    Pay the first-request costs up front: engine detection, template parse,
+    image index, one render+merge through python-docx/lxml and (optionally) a
+    dummy PDF export so LibreOffice creates its user profile now.
+    """
+    _WARMUP["state"] = "warming"
+    t0 = time.perf_counter()
+    steps = []
+    try:
+        available, detail = detect_pdf_engine()
+        steps.append(f"engine: {detail}")
+
+        if DEFAULT_TEMPLATE.exists():
+            preload_template(str(DEFAULT_TEMPLATE))
+            steps.append("template cached")
+
+        steps.append(f"image index: {build_image_index()} file(s)")
+
+        tmp = Path(tempfile.mkdtemp(prefix="warmup_"))
+        try:
+            md = tmp / "warmup.md"
+            md.write_text(_WARMUP_SAMPLE, encoding="utf-8")
+            raw_docx = tmp / "warmup_raw.docx"
+            out_docx = tmp / "warmup.docx"
+            md_file_to_docx(str(md), str(raw_docx), base_dir=tmp)
+            if DEFAULT_TEMPLATE.exists():
+                merge_from_any(str(DEFAULT_TEMPLATE), str(raw_docx), str(out_docx))
+            else:
+                out_docx = raw_docx
+            steps.append("render+merge ok")
+
+            if RENDER_POOL is not None:
+                steps.append(f"render pool: {RENDER_POOL.start()} process(es)")
 
-    resp = make_response(send_from_directory(OUTPUT_DIR, filename, as_attachment=False))
+            if dummy_pdf and available:
+                err = docx_to_pdf(out_docx, tmp / "warmup.pdf")
+                steps.append("dummy PDF ok" if err is None else f"dummy PDF failed: {err}")
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        _WARMUP["state"] = "ready"
+    except Exception as e:
+        steps.append(f"error: {e}")
+        # A failed warm-up still leaves a working (just colder) server
+        _WARMUP["state"] = "ready"
+    _WARMUP["seconds"] = round(time.perf_counter() - t0, 2)
+    _WARMUP["detail"] = "; ".join(steps)
+    print(f"🔥 Warm-up finished in {_WARMUP['seconds']}s — {_WARMUP['detail']}")
+
+
+@app.get("/healthz/ready")
+def healthz_ready():
+    body = {"ready": _WARMUP["state"] == "ready", **_WARMUP}
+    return jsonify(body), (200 if body["ready"] else 503)
+
+
+# ===================== OUTPUT SERVING =====================
+
+# Outputs never change once written, so a content hash makes a strong ETag:
+# reloading the preview costs a 304, and byte ranges (If-Range) stay valid.
+# STORAGE computes it once per file (LocalStorage caches it, S3 keeps it as metadata).
+
+# Behind nginx/Apache, let the front end stream the file (X-Sendfile /
+# X-Accel-Redirect) instead of a Python worker. Otherwise send_file hands the
+# open file to the WSGI server's file_wrapper, which uses os.sendfile().
+app.config["USE_X_SENDFILE"] = os.environ.get("DOC_COMPOSER_X_SENDFILE", "") == "1"
+
+
+def _send_output(filename: str, as_attachment: bool, mimetype: str | None = None):
+    """
+    Serve outputs/<filename> from STORAGE:
+      • object stores → 302 to a short-lived presigned URL (no bytes through the app),
+      • local files   → send_file with a content-hash ETag: If-None-Match gets 304,
+                        Range / If-Range get 206 so PDF viewers load incrementally,
+      • otherwise     → streamed from the store, still with the ETag.
+    """
+    try:
+        rel = check_key(filename)
+    except ValueError:
+        abort(404)
+    # Job state lives beside the outputs but is never served (test the normalised key: "x/job.json/.",
+    # caseless: "JOB.JSON" is the same file on Windows and macOS)
+    folded = rel.casefold()
+    if folded == "job.json" or folded.endswith("/job.json"):
+        abort(404)
+    key = f"outputs/{rel}"
+    obj = STORAGE.stat(key)
+    if obj is None:
+        abort(404)
+    name = Path(rel).name
+
+    url = STORAGE.presigned_url(key, download_name=name, as_attachment=as_attachment, mimetype=mimetype)
+    if url:
+        return redirect(url, code=302)
+
+    local = STORAGE.local_path(key)
+    return send_file(
+        local if local is not None else STORAGE.open_read(key),
+        mimetype=mimetype,
+        as_attachment=as_attachment,
+        download_name=name,
+        conditional=True,
+        etag=obj.etag,
+        last_modified=obj.modified,
+        max_age=None,   # → Cache-Control: no-cache, i.e. always revalidate via the ETag
+    )
+
+
+@app.get("/outputs/<path:filename>")
+def download_output(filename):
+    return _send_output(filename, as_attachment=True)
+
+
+@app.get("/outputs/inline/<path:filename>")
+def preview_output(filename):
+    mimetype = "application/pdf" if filename.lower().endswith(".pdf") else None
+    resp = _send_output(filename, as_attachment=False, mimetype=mimetype)
     resp.headers['X-Frame-Options'] = 'SAMEORIGIN'
     resp.headers['Content-Security-Policy'] = "frame-ancestors 'self'"
     return resp
 
 
 if __name__ == "__main__":
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
     app.run(debug=True, host="127.0.0.1", port=5055)
@@ -0,0 +1,133 @@
+# archive.py
+"""
+Single-upload manuscripts: a .zip holding Markdown sections plus their assets.
+
+extract_archive() streams the members to disk one at a time (never the whole
+archive in memory) and only keeps Markdown and image files. Every name is
+checked against zip-slip (absolute paths, drive letters, "..", symlinks) and
+the uncompressed total is counted while copying, so a forged header can't
+smuggle a zip bomb past the limits.
+
+The image index it returns maps archive-relative paths and bare file names
+(both lower-cased) to the extracted files; parser._resolve_image_path()
+consults it (parser._lookup_index_image) before any server-side directory.
+"""
+from __future__ import annotations
+import posixpath
+import re
+import stat
+import zipfile
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from parser import ALLOWED_EXTENSIONS as IMAGE_EXTENSIONS
+
+MAX_ARCHIVE_MEMBERS = 5000
+MAX_ARCHIVE_BYTES = 1024 * 1024 * 1024   # uncompressed, all kept members together
+_CHUNK = 1024 * 1024
+
+SECTION_EXTENSIONS = {".md", ".markdown", ".mdx"}
+
+_DRIVE = re.compile(r"^[A-Za-z]:")
+_DIGITS = re.compile(r"(\d+)")
+
+
+class ArchiveError(ValueError):
+    """The upload is not a usable archive (corrupt, unsafe or too large)."""
+
+
+def _safe_member_name(name: str) -> Optional[str]:
+    """Normalised relative POSIX path, or None if the name would escape the target."""
+    name = name.replace("\\", "/")
+    if name.startswith("/") or _DRIVE.match(name):
+        return None
+    norm = posixpath.normpath(name)
+    if norm in (".", "") or norm == ".." or norm.startswith("../"):
+        return None
+    return norm
+
+
+def _natural_key(rel: str) -> List:
+    """'2_intro.md' sorts before '10_setup.md'."""
+    return [int(t) if t.isdigit() else t.lower() for t in _DIGITS.split(rel)]
+
+
+def build_archive_image_index(root: Path, rel_paths: List[str]) -> Dict[str, Path]:
+    """Full relative paths first, then bare names (first occurrence wins)."""
+    index: Dict[str, Path] = {}
+    for rel in rel_paths:
+        index.setdefault(rel.lower(), root / rel)
+    for rel in rel_paths:
+        index.setdefault(posixpath.basename(rel).lower(), root / rel)
+    return index
+
+
+def extract_archive(zip_path: Path, dest: Path) -> Tuple[List[Tuple[Path, str]], Dict[str, Path]]:
+    """
+    Extract sections and images from zip_path into dest.
+    Returns ([(section_path, archive_name)] in natural order, image_index).
+    Raises ArchiveError.
+    """
+    try:
+        zf = zipfile.ZipFile(zip_path)
+    except (zipfile.BadZipFile, OSError) as e:
+        raise ArchiveError(f"Not a valid .zip archive ({e})")
+
+    dest.mkdir(parents=True, exist_ok=True)
+    root = dest.resolve()
+    sections: List[Tuple[Path, str]] = []
+    images: List[str] = []
+    total = 0
+
+    with zf:
+        infos = zf.infolist()
+        if len(infos) > MAX_ARCHIVE_MEMBERS:
+            raise ArchiveError(f"Archive has {len(infos)} entries (limit {MAX_ARCHIVE_MEMBERS}).")
+
+        for info in infos:
+            if info.is_dir():
+                continue
+            if stat.S_ISLNK(info.external_attr >> 16):
+                continue
+            rel = _safe_member_name(info.filename)
+            if rel is None:
+                raise ArchiveError(f"Unsafe path in archive: {info.filename!r}")
+            parts = rel.split("/")
+            if parts[0] == "__MACOSX" or any(p.startswith(".") for p in parts):
+                continue
+            ext = posixpath.splitext(rel)[1].lower()
+            if ext not in SECTION_EXTENSIONS and ext not in IMAGE_EXTENSIONS:
+                continue
+
+            target = (root / rel).resolve()
+            if not target.is_relative_to(root):
+                raise ArchiveError(f"Unsafe path in archive: {info.filename!r}")
+            target.parent.mkdir(parents=True, exist_ok=True)
+
+            try:
+                with zf.open(info) as src, target.open("wb") as out:
+                    while True:
+                        chunk = src.read(_CHUNK)
+                        if not chunk:
+                            break
+                        total += len(chunk)
+                        if total > MAX_ARCHIVE_BYTES:
+                            raise ArchiveError(
+                                f"Archive expands beyond {MAX_ARCHIVE_BYTES // (1024 * 1024)} MB.")
+                        out.write(chunk)
+            except (zipfile.BadZipFile, zlib.error, EOFError, NotImplementedError, RuntimeError) as e:
+                raise ArchiveError(f"Could not extract {info.filename!r}: {e}")
+
+            if ext in SECTION_EXTENSIONS:
+                sections.append((target, rel))
+            else:
+                images.append(rel)
+
+    if not sections:
+        raise ArchiveError("The archive contains no Markdown (.md / .mdx) sections.")
+    sections.sort(key=lambda s: _natural_key(s[1]))
+    print(f"📦 Extracted {len(sections)} section(s) and {len(images)} image(s) "
+          f"({total / (1024 * 1024):.1f} MB) from {zip_path.name}")
+    return sections, build_archive_image_index(root, images)
+
@@ -0,0 +1,171 @@
+# assets.py
+"""
+Fingerprinted, precompressed static assets.
+
+Every file under static/ is copied to .assets/ as <stem>.<sha256[:12]><suffix>,
+next to a .gz and (with the optional `brotli` package) a .br variant for text
+types. Templates link them via the `asset_url` Jinja global, e.g.
+  <script src="{{ asset_url('app.js') }}"></script>
+and /assets/<name> answers with `Cache-Control: public, max-age=31536000,
+immutable`: a changed file gets a new name, so browsers never revalidate and
+repeat page loads make no asset requests. The smallest encoding the client
+accepts is sent (br → gzip → identity) with Vary: Accept-Encoding.
+
+The build runs at startup and only writes what's missing, so it can also be
+done ahead of time (e.g. in an image build):
+  python assets.py
+"""
+from __future__ import annotations
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import sys
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+BASE_DIR = Path(__file__).resolve().parent
+ONE_YEAR = 365 * 24 * 3600
+
+# Worth compressing: text formats above a packet or so
+_COMPRESSIBLE = {".css", ".js", ".mjs", ".map", ".json", ".svg", ".txt", ".html", ".xml"}
+_MIN_COMPRESS_BYTES = 1024
+
+
+def _brotli():
+    try:
+        import brotli
+        return brotli
+    except ImportError:
+        return None
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp, 0o644)   # mkstemp's 0600 would hide it from a front-end web server
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+class AssetPipeline:
+    def __init__(self, src_dir: Path, out_dir: Path):
+        self.src_dir = Path(src_dir)
+        self.out_dir = Path(out_dir)
+        self.manifest: dict[str, str] = {}    # "app.js" → "app.3f2a9c0d1b7e.js"
+        self._served: set[str] = set()
+        self._mtimes: dict[str, int] = {}
+
+    # ---------- BUILD ----------
+
+    def build(self) -> dict[str, str]:
+        """Fingerprint + precompress everything under src_dir; returns the manifest."""
+        brotli = _brotli()
+        manifest, written = {}, 0
+        for path in sorted(p for p in self.src_dir.rglob("*") if p.is_file()):
+            rel = path.relative_to(self.src_dir).as_posix()
+            data = path.read_bytes()
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            name = (Path(rel).parent / f"{path.stem}.{digest}{path.suffix}").as_posix().removeprefix("./")
+            manifest[rel] = name
+            self._mtimes[rel] = path.stat().st_mtime_ns
+
+            target = self.out_dir / name
+            if not target.exists():
+                _write_atomic(target, data)
+                written += 1
+            if path.suffix.lower() not in _COMPRESSIBLE or len(data) < _MIN_COMPRESS_BYTES:
+                continue
+            gz = target.with_name(target.name + ".gz")
+            if not gz.exists():
+                _write_atomic(gz, gzip.compress(data, compresslevel=9, mtime=0))
+                written += 1
+            br = target.with_name(target.name + ".br")
+            if brotli is not None and not br.exists():
+                _write_atomic(br, brotli.compress(data, quality=11))
+                written += 1
+
+        if manifest != self.manifest or written:
+            _write_atomic(self.out_dir / "manifest.json", json.dumps(manifest, indent=2).encode("utf-8"))
+            print(f"🎨 Assets: {len(manifest)} file(s), {written} written to {self.out_dir}"
+                  + ("" if brotli else " (gzip only; pip install brotli for .br)"))
+        self.manifest = manifest
+        self._served = set(manifest.values())
+        return manifest
+
+    def _stale(self) -> bool:
+        for rel, mtime in self._mtimes.items():
+            try:
+                if (self.src_dir / rel).stat().st_mtime_ns != mtime:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    # ---------- FLASK ----------
+
+    def init_app(self, app) -> None:
+        self.build()
+        app.add_url_rule("/assets/<path:name>", "asset", self.serve)
+        app.add_template_global(lambda name: self.url(name, reload=app.debug), "asset_url")
+
+    def url(self, name: str, reload: bool = False) -> str:
+        from flask import url_for
+
+        # In debug mode an edited file is picked up on the next page render
+        if reload and self._stale():
+            self.build()
+        fingerprinted = self.manifest.get(name)
+        if fingerprinted is None:
+            return url_for("static", filename=name)
+        return url_for("asset", name=fingerprinted)
+
+    def _variant(self, name: str) -> tuple[Path, Optional[str]]:
+        from flask import request
+
+        target = self.out_dir / name
+        accepted = request.accept_encodings
+        for encoding, ext in (("br", ".br"), ("gzip", ".gz")):
+            if accepted[encoding] > 0:
+                variant = target.with_name(target.name + ext)
+                if variant.exists():
+                    return variant, encoding
+        return target, None
+
+    def serve(self, name: str):
+        from flask import abort, send_file
+
+        if name not in self._served:
+            abort(404)
+        path, encoding = self._variant(name)
+        resp = send_file(
+            path,
+            mimetype=mimetypes.guess_type(name)[0] or "application/octet-stream",
+            conditional=True,
+            etag=f"{Path(name).stem.rsplit('.', 1)[-1]}-{encoding or 'identity'}",
+            max_age=ONE_YEAR,
+        )
+        resp.cache_control.public = True
+        resp.cache_control.immutable = True
+        resp.vary.add("Accept-Encoding")
+        if encoding:
+            resp.headers["Content-Encoding"] = encoding
+        return resp
+
+
+def main() -> int:
+    pipeline = AssetPipeline(BASE_DIR / "static", BASE_DIR / ".assets")
+    for src, name in pipeline.build().items():
+        print(f"{src} → {name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+# bench_pdf_sections.py
+"""
+Wall-clock comparison: one soffice for the whole document vs section-parallel
+rendering (pdf_sections.docx_to_pdf_sections) on 4 and 8 workers.
+
+Usage:
+  python bench_pdf_sections.py [merged.docx] [--workers 4 8] [--repeat 3]
+  python bench_pdf_sections.py --chapters 60        # synthetic manual
+
+Without an input a manual of --chapters Heading 1 chapters (text, tables and
+an image each) is rendered from Markdown and merged into the default template
+with the server-side TOC, so the cross-chunk PAGEREF/link handling is part
+of what gets timed. The best of --repeat runs is reported per mode.
+Run it on a host with at least as many cores as the largest worker count.
+"""
+from __future__ import annotations
+import argparse
+import base64
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# 1×1 PNG so the synthetic manual carries images without needing assets
+_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg==")
+
+
+def build_manual(workdir: Path, chapters: int) -> Path:
+    from parser import md_file_to_docx
+    from merge import merge_from_any
+
+    (workdir / "pixel.png").write_bytes(_PNG)
+    para = "The quick brown fox jumps over the lazy dog while the manual keeps going. " * 12
+    lines = []
+    for c in range(chapters):
+        lines += [f"# Chapter {c + 1}", "", para, ""]
+        for s in range(6):
+            lines += [f"## Topic {c + 1}.{s + 1}", "", para, "", "![Figure](pixel.png)", "",
+                      "| Setting | Value |", "|---|---|"]
+            lines += [f"| option_{k} | {k * s} |" for k in range(8)]
+            lines += ["", para, ""]
+    md = workdir / "manual.md"
+    md.write_text("\n".join(lines), encoding="utf-8")
+    raw = workdir / "manual_raw.docx"
+    out = workdir / "manual.docx"
+    md_file_to_docx(str(md), str(raw), base_dir=workdir)
+    merge_from_any(str(BASE_DIR / "templates" / "template.docx"), str(raw), str(out), toc_mode="server")
+    return out
+
+
+def _best(fn, repeat: int):
+    best, last = None, None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        last = fn()
+        took = time.perf_counter() - t0
+        best = took if best is None else min(best, took)
+    return best, last
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("docx", nargs="?", help="Merged DOCX to convert (default: synthetic manual)")
+    ap.add_argument("--chapters", type=int, default=40, help="Chapters in the synthetic manual")
+    ap.add_argument("--workers", type=int, nargs="+", default=[4, 8])
+    ap.add_argument("--repeat", type=int, default=1)
+    ap.add_argument("-v", "--verbose", action="store_true", help="Keep the modules' progress output")
+    args = ap.parse_args(argv)
+
+    from converters import detect_pdf_engine, docx_to_pdf
+    from pdf_sections import docx_to_pdf_sections
+
+    ok, detail = detect_pdf_engine()
+    if not ok:
+        print(f"error: {detail}", file=sys.stderr)
+        return 1
+
+    work = Path(tempfile.mkdtemp(prefix="bench_pdf_"))
+    quiet = open(os.devnull, "w") if not args.verbose else None
+    real_stdout = sys.stdout
+    try:
+        if quiet:
+            sys.stdout = quiet
+        src = Path(args.docx) if args.docx else build_manual(work, args.chapters)
+        # Untimed run: LibreOffice's first start in a fresh profile is much slower
+        docx_to_pdf(src, work / "warmup.pdf")
+
+        rows = []
+        serial_s, err = _best(lambda: docx_to_pdf(src, work / "serial.pdf"), args.repeat)
+        if err:
+            raise RuntimeError(err)
+        from pypdf import PdfReader
+        rows.append(("serial", 1, serial_s, len(PdfReader(str(work / "serial.pdf")).pages), 1))
+        for w in args.workers:
+            # Each worker count gets its profiles initialised before timing
+            docx_to_pdf_sections(src, work / "warmup.pdf", workers=w)
+            took, stats = _best(lambda: docx_to_pdf_sections(src, work / f"sections_{w}.pdf", workers=w),
+                                args.repeat)
+            if stats["error"]:
+                raise RuntimeError(stats["error"])
+            rows.append((stats["mode"], w, took, stats["pages"], stats["renders"]))
+    except Exception as e:
+        sys.stdout = real_stdout
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        sys.stdout = real_stdout
+        if quiet:
+            quiet.close()
+        shutil.rmtree(work, ignore_errors=True)
+
+    print(f"{src.name}: {os.cpu_count()} CPU(s), {detail}")
+    print(f"{'mode':<10}{'workers':>8}{'seconds':>10}{'speedup':>9}{'pages':>7}{'renders':>9}")
+    for mode, w, took, pages, renders in rows:
+        print(f"{mode:<10}{w:>8}{took:>10.2f}{serial_s / took:>8.2f}x{pages:>7}{renders:>9}")
+    if max(args.workers) > (os.cpu_count() or 1):
+        print(f"note: fewer CPUs than {max(args.workers)} workers; speedups are capped accordingly")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
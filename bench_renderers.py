@@ -0,0 +1,165 @@
+# bench_renderers.py
+"""
+Built-in Markdown renderer (parser.md_file_to_docx) vs pandoc
+(pandoc_render.md_file_to_docx_pandoc): speed, and whether the merged
+documents come out the same.
+
+Usage:
+  python bench_renderers.py [section.md ...] [--template T.docx] [--repeat 3]
+  python bench_renderers.py --chapters 40 --show 20
+
+Without inputs a synthetic manual of --chapters chapters (headings, inline
+formatting, nested bullets, tables, images and hidden blocks) is generated.
+Each engine renders every input (best of --repeat, timed) and the results
+are merged into the template. The merged bodies are reduced to outlines —
+one entry per paragraph (style + text), table (shape + cell texts) and
+picture — and compared with difflib; --show prints the first differences.
+Exit status is 1 when the outlines differ, so it can gate a switch to pandoc.
+"""
+from __future__ import annotations
+import argparse
+import base64
+import difflib
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# 1×1 PNG so the synthetic manual carries images without needing assets
+_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg==")
+
+
+def build_manual(workdir: Path, chapters: int) -> list:
+    """One Markdown file per chapter, as the UI uploads them."""
+    (workdir / "pixel.png").write_bytes(_PNG)
+    para = ("The **quick** brown fox *jumps* over the `lazy` dog, see [the docs](https://example.com/docs). "
+            "The manual keeps going.\nA second source line joins the same paragraph.")
+    paths = []
+    for c in range(chapters):
+        lines = ["---", f"title: Chapter {c + 1}", "---", f"# Chapter {c + 1}", "", para, "",
+                 "--- text ---", "internal notes", "<!-- ### Key Activities -->", ""]
+        for s in range(4):
+            lines += [f"## Topic {c + 1}.{s + 1}", "", para, "",
+                      "- first step", "- second step with **bold**", "  - nested detail", "",
+                      "![Screen](pixel.png)", "", "<!-- reviewer comment -->",
+                      "| Setting | Value | Notes |", "|---|:---:|---:|"]
+            lines += [f"| option_{k} | {k * s} | *n{k}* |" for k in range(5)]
+            lines += ["", f"### Detail {c + 1}.{s + 1}.1", "", para, ""]
+        path = workdir / f"{c + 1:03d}_chapter.md"
+        path.write_text("\n".join(lines), encoding="utf-8")
+        paths.append(path)
+    return paths
+
+
+def outline(docx_path: Path) -> list:
+    """Body blocks as comparable strings."""
+    from docx import Document
+    from docx.oxml.ns import qn
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+
+    doc = Document(str(docx_path))
+    lines = []
+    for el in doc.element.body:
+        if el.tag == qn("w:p"):
+            p = Paragraph(el, doc._body)
+            pics = len(el.xpath(".//pic:pic"))
+            text = re.sub(r"\s+", " ", p.text).strip()
+            if text or pics:
+                lines.append(f"p[{p.style.name if p.style is not None else ''}] {text}" + " [pic]" * pics)
+        elif el.tag == qn("w:tbl"):
+            t = Table(el, doc._body)
+            cells = " | ".join(re.sub(r"\s+", " ", c.text).strip() for row in t.rows for c in row.cells)
+            lines.append(f"tbl[{len(t.rows)}x{len(t.columns)}] {cells}")
+    return lines
+
+
+def _best(fn, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        took = time.perf_counter() - t0
+        best = took if best is None else min(best, took)
+    return best
+
+
+def run_engine(engine: str, inputs: list, template: Path, work: Path, repeat: int) -> dict:
+    from merge import merge_into_template
+    from pandoc_render import md_to_docx
+
+    raws = [work / f"{engine}_{i:03d}.docx" for i in range(len(inputs))]
+
+    def render():
+        for src, raw in zip(inputs, raws):
+            md_to_docx(engine, str(src), str(raw), reference_doc=str(template), base_dir=src.parent)
+
+    render_s = _best(render, repeat)
+    out = work / f"{engine}_merged.docx"
+    t0 = time.perf_counter()
+    merge_into_template(str(template), [str(r) for r in raws], str(out))
+    return {"engine": engine, "render_s": render_s, "merge_s": time.perf_counter() - t0,
+            "outline": outline(out)}
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("inputs", nargs="*", help="Markdown sections (default: synthetic manual)")
+    ap.add_argument("--template", default=str(BASE_DIR / "templates" / "template.docx"))
+    ap.add_argument("--chapters", type=int, default=20, help="Chapters in the synthetic manual")
+    ap.add_argument("--repeat", type=int, default=1)
+    ap.add_argument("--show", type=int, default=10, help="Differences to print")
+    ap.add_argument("-v", "--verbose", action="store_true", help="Keep the modules' progress output")
+    args = ap.parse_args(argv)
+
+    from pandoc_render import pandoc_available
+
+    ok, detail = pandoc_available()
+    if not ok:
+        print(f"error: {detail}", file=sys.stderr)
+        return 2
+
+    work = Path(tempfile.mkdtemp(prefix="bench_md_"))
+    quiet = open(os.devnull, "w") if not args.verbose else None
+    real_stdout = sys.stdout
+    try:
+        if quiet:
+            sys.stdout = quiet
+        inputs = [Path(p).resolve() for p in args.inputs] or build_manual(work, args.chapters)
+        template = Path(args.template)
+        results = [run_engine(e, inputs, template, work, args.repeat) for e in ("native", "pandoc")]
+    except Exception as e:
+        sys.stdout = real_stdout
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        sys.stdout = real_stdout
+        if quiet:
+            quiet.close()
+        shutil.rmtree(work, ignore_errors=True)
+
+    native, pandoc = results
+    print(f"{len(inputs)} section(s), {detail}")
+    print(f"{'engine':<8}{'render_s':>10}{'merge_s':>9}{'blocks':>8}")
+    for r in results:
+        print(f"{r['engine']:<8}{r['render_s']:>10.2f}{r['merge_s']:>9.2f}{len(r['outline']):>8}")
+    print(f"render speedup (native / pandoc): {native['render_s'] / pandoc['render_s']:.2f}x")
+
+    a, b = native["outline"], pandoc["outline"]
+    ratio = difflib.SequenceMatcher(None, a, b, autojunk=False).ratio()
+    diff = [d for d in difflib.unified_diff(a, b, "native", "pandoc", n=0, lineterm="")
+            if not d.startswith(("---", "+++", "@@"))]
+    print(f"structure: {ratio:.1%} of blocks match, {len(diff)} differing line(s)")
+    for line in diff[:args.show]:
+        print("  " + line[:160])
+    return 0 if not diff else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+# cli.py
+"""
+Command-line entry point for Document Composer (no Flask involved).
+
+Usage:
+  python cli.py md2docx section.md -o raw.docx [--base-dir DIR] [--no-img-style] [--engine pandoc --reference-doc T.docx]
+  python cli.py merge template.docx raw.(md|docx) -o out.docx [--streaming] [--toc server] [--no-compact]
+  python cli.py topdf out.docx [more.docx ...] [-o out.pdf | --outdir DIR] [--optimize] [--sections N]
+  python cli.py watch sections/ template.docx -o out.docx [--pdf] [--debounce-ms 150] [--poll]
+
+Heavy modules (python-docx/lxml, Pillow, pypdf) are imported inside the
+subcommand that needs them, so `--help`, argument errors and `topdf` start
+in a few tens of milliseconds — cheap enough to call from Makefiles.
+Exit status: 0 on success, 1 on conversion failure, 2 on usage errors.
+"""
+from __future__ import annotations
+import argparse
+import contextlib
+import os
+import sys
+from pathlib import Path
+
+
+def _quiet(enabled: bool):
+    """The library modules log with print(); -q sends that chatter to /dev/null."""
+    if not enabled:
+        return contextlib.nullcontext()
+    return contextlib.redirect_stdout(open(os.devnull, "w"))
+
+
+def _fail(msg: str) -> int:
+    print(f"error: {msg}", file=sys.stderr)
+    return 1
+
+
+def cmd_md2docx(args) -> int:
+    src = Path(args.input)
+    if not src.exists():
+        return _fail(f"not found: {src}")
+    out = Path(args.output) if args.output else src.with_suffix(".docx")
+    with _quiet(args.quiet):
+        from pandoc_render import configured_engine, md_to_docx
+        engine = args.engine or configured_engine(Path(__file__).resolve().parent / "config.json")
+        md_to_docx(
+            engine, str(src), str(out),
+            reference_doc=args.reference_doc,
+            base_dir=Path(args.base_dir) if args.base_dir else None,
+            style_images=not args.no_img_style,
+        )
+    print(out)
+    return 0
+
+
+def cmd_merge(args) -> int:
+    tpl, raw = Path(args.template), Path(args.raw)
+    for p in (tpl, raw):
+        if not p.exists():
+            return _fail(f"not found: {p}")
+    out = Path(args.output) if args.output else raw.with_name(raw.stem + "_merged.docx")
+    with _quiet(args.quiet):
+        from merge import merge_from_any
+        stats = merge_from_any(str(tpl), str(raw), str(out), streaming=args.streaming,
+                               toc_mode=args.toc, compact=not args.no_compact)
+    line = f"{out}\tinserted_images={stats.get('inserted_images', 0)}\tskipped_images={stats.get('skipped_images', 0)}"
+    comp = stats.get("compaction")
+    if comp:
+        line += f"\txml_elements={comp['elements_before']}->{comp['elements_after']}"
+    print(line)
+    return 0
+
+
+def cmd_topdf(args) -> int:
+    from converters import docx_to_pdf_many, optimize_pdf
+
+    inputs = [Path(p) for p in args.inputs]
+    if args.output and len(inputs) > 1:
+        print("error: -o/--output takes a single input; use --outdir for several", file=sys.stderr)
+        return 2
+    if args.output:
+        pairs = [(inputs[0], Path(args.output))]
+    else:
+        outdir = Path(args.outdir) if args.outdir else None
+        pairs = [(p, (outdir or p.parent) / (p.stem + ".pdf")) for p in inputs]
+
+    with _quiet(args.quiet):
+        if args.sections:
+            from pdf_sections import docx_to_pdf_sections
+            errors = [docx_to_pdf_sections(d, p, workers=args.sections)["error"] for d, p in pairs]
+        else:
+            # All inputs share one LibreOffice launch
+            errors = docx_to_pdf_many(pairs)
+    rc = 0
+    for (src, dst), err in zip(pairs, errors):
+        if err is None and args.optimize:
+            with _quiet(args.quiet):
+                opt = optimize_pdf(dst)
+            if opt["error"]:
+                print(f"warning: {dst}: {opt['error']}", file=sys.stderr)
+        if err is None:
+            print(dst)
+        else:
+            rc = _fail(f"{src}: {err}")
+    return rc
+
+
+def cmd_watch(args) -> int:
+    sections, tpl = Path(args.sections), Path(args.template)
+    if not sections.is_dir():
+        return _fail(f"not a directory: {sections}")
+    if not tpl.exists():
+        return _fail(f"not found: {tpl}")
+    import watch
+
+    out = Path(args.output) if args.output else sections.with_name(sections.name + "_merged.docx")
+    build = watch.WatchBuild(sections, tpl, out, pdf=out.with_suffix(".pdf") if args.pdf else None,
+                             style_images=not args.no_img_style, toc_mode=args.toc,
+                             compact=not args.no_compact)
+    return watch.run(build, debounce_s=args.debounce_ms / 1000, poll=args.poll,
+                     mute=lambda: _quiet(args.quiet), once=args.once)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(prog="cli.py", description="Markdown → DOCX → PDF without the web UI.")
+    ap.add_argument("-q", "--quiet", action="store_true", help="Suppress progress/debug output")
+    sub = ap.add_subparsers(dest="command", metavar="{md2docx,merge,topdf,watch}")
+    sub.required = True
+
+    p = sub.add_parser("md2docx", help="Render one Markdown file to a raw DOCX")
+    p.add_argument("input")
+    p.add_argument("-o", "--output", help="Output .docx (default: next to input)")
+    p.add_argument("--base-dir", help="Directory used to resolve relative image paths")
+    p.add_argument("--no-img-style", action="store_true", help="Don't add border/shadow to images")
+    p.add_argument("--engine", choices=("native", "pandoc"),
+                   help="Markdown renderer (default: MD_ENGINE in config.json, else native)")
+    p.add_argument("--reference-doc", help="Template whose styles pandoc uses (pandoc engine only)")
+    p.set_defaults(func=cmd_md2docx)
+
+    p = sub.add_parser("merge", help="Merge a raw .md/.docx into a template")
+    p.add_argument("template")
+    p.add_argument("raw")
+    p.add_argument("-o", "--output", help="Output .docx (default: <raw>_merged.docx)")
+    p.add_argument("--streaming", action="store_true", help="Write the output incrementally (for very large documents)")
+    p.add_argument("--toc", choices=("field", "server"), default="field",
+                   help="field: Word refreshes the TOC on open; server: entries are written during the merge")
+    p.add_argument("--no-compact", action="store_true",
+                   help="Keep the merged XML as rendered (no run merging or redundant-formatting cleanup)")
+    p.set_defaults(func=cmd_merge)
+
+    p = sub.add_parser("topdf", help="Convert one or more DOCX files to PDF")
+    p.add_argument("inputs", nargs="+")
+    dest = p.add_mutually_exclusive_group()
+    dest.add_argument("-o", "--output", help="Output .pdf (single input only)")
+    dest.add_argument("--outdir", help="Directory for the PDFs (default: next to each input)")
+    p.add_argument("--optimize", action="store_true",
+                   help="Compress/deduplicate and (with qpdf installed) linearize the PDFs")
+    p.add_argument("--sections", type=int, metavar="N", default=0,
+                   help="Render each document in Heading 1 chunks on N parallel LibreOffice workers")
+    p.set_defaults(func=cmd_topdf)
+
+    p = sub.add_parser("watch", help="Rebuild on every change to the sections, template or images")
+    p.add_argument("sections", help="Directory of .md sections (merged in name order)")
+    p.add_argument("template")
+    p.add_argument("-o", "--output", help="Output .docx (default: <sections>_merged.docx)")
+    p.add_argument("--pdf", action="store_true", help="Also export <output>.pdf after each rebuild")
+    p.add_argument("--toc", choices=("field", "server"), default="field")
+    p.add_argument("--no-img-style", action="store_true", help="Don't add border/shadow to images")
+    p.add_argument("--no-compact", action="store_true", help="Keep the merged XML as rendered")
+    p.add_argument("--debounce-ms", type=int, default=150, help="Quiet period before a burst of changes rebuilds")
+    p.add_argument("--poll", action="store_true", help="Poll mtimes instead of using inotify")
+    p.add_argument("--once", action="store_true", help="Build once and exit")
+    p.set_defaults(func=cmd_watch)
+    return ap
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except KeyboardInterrupt:
+        return 130
+    except Exception as e:
+        return _fail(str(e) or e.__class__.__name__)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
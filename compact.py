@@ -0,0 +1,229 @@
+# compact.py
+"""
+XML compaction for merged blocks, applied as the merge appends them (so the
+streaming writer sees already-compacted blocks too):
+  • consecutive empty body paragraphs collapse into one,
+  • empty runs are dropped and adjacent text-only runs with identical
+    properties are merged into one w:r,
+  • empty <w:rPr/> / <w:pPr/> are stripped,
+  • given the template's styles, direct formatting that repeats what the
+    paragraph's style (its basedOn chain and the document defaults) already
+    says is dropped.
+
+Only merged content is touched; the template's own XML is left as is.
+"""
+from __future__ import annotations
+from typing import Dict, Iterable, Optional
+
+from lxml import etree
+from docx.oxml.ns import qn
+
+_P = qn("w:p")
+_R = qn("w:r")
+_T = qn("w:t")
+_RPR = qn("w:rPr")
+_PPR = qn("w:pPr")
+_HYPERLINK = qn("w:hyperlink")
+_TBL = qn("w:tbl")
+_STYLE = qn("w:style")
+_BASED_ON = qn("w:basedOn")
+_P_STYLE = qn("w:pStyle")
+_R_STYLE = qn("w:rStyle")
+_NUM_PR = qn("w:numPr")
+_VAL = qn("w:val")
+_STYLE_ID = qn("w:styleId")
+_XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+
+# A paragraph holding any of these is not "empty" even without text
+_CONTENT_TAGS = {qn(t) for t in (
+    "w:drawing", "w:pict", "w:object", "w:br", "w:tab", "w:sym", "w:fldChar",
+    "w:instrText", "w:fldSimple", "w:bookmarkStart", "w:footnoteReference",
+    "w:endnoteReference", "w:commentReference",
+)}
+# …nor is one whose properties make it visible or structural
+_KEEP_PPR = {qn(t) for t in ("w:sectPr", "w:pageBreakBefore", "w:numPr")}
+# Paragraph properties never dropped as redundant: identity, numbering, nested
+# run props, revisions, and tabs (which add to the style's instead of replacing them)
+_OWN_PPR = {qn(t) for t in (
+    "w:pStyle", "w:numPr", "w:sectPr", "w:rPr", "w:pPrChange", "w:tabs",
+)}
+# …and run properties: the character style and revision marks
+_OWN_RPR = {qn(t) for t in ("w:rStyle", "w:rPrChange", "w:ins", "w:del")}
+
+
+def _is_empty_paragraph(p) -> bool:
+    ppr = p.find(_PPR)
+    if ppr is not None and any(child.tag in _KEEP_PPR for child in ppr):
+        return False
+    for el in p.iter():
+        if el.tag in _CONTENT_TAGS:
+            return False
+        if el.tag == _T and el.text:
+            return False
+    return True
+
+
+def _is_text_run(r) -> bool:
+    return all(child.tag in (_RPR, _T) for child in r) and sum(1 for c in r if c.tag == _T) <= 1
+
+
+def _is_empty_run(r) -> bool:
+    return _is_text_run(r) and not "".join(t.text or "" for t in r.iter(_T))
+
+
+def _sig(el) -> tuple:
+    """Namespace-independent identity of a property element (tag, attributes, children)."""
+    return el.tag, tuple(sorted(el.attrib.items())), tuple(_sig(c) for c in el)
+
+
+class _StyleSheet:
+    """Effective pPr/rPr of paragraph styles in a styles.xml, resolved through basedOn."""
+
+    def __init__(self, styles):
+        self._by_id = {s.get(_STYLE_ID): s for s in styles.iter(_STYLE)}
+        self._default_para = next((s.get(_STYLE_ID) for s in styles.iter(_STYLE)
+                                   if s.get(qn("w:type")) == "paragraph"
+                                   and s.get(qn("w:default")) in ("1", "true", "on")), None)
+        defaults = styles.find(qn("w:docDefaults"))
+        self._doc_defaults = {
+            kind: self._props(defaults.find(f"{qn(wrapper)}/{qn(kind)}") if defaults is not None else None)
+            for kind, wrapper in (("w:rPr", "w:rPrDefault"), ("w:pPr", "w:pPrDefault"))
+        }
+        self._cache: Dict[tuple, Dict[str, tuple]] = {}
+
+    @staticmethod
+    def _props(container) -> Dict[str, tuple]:
+        return {c.tag: _sig(c) for c in container} if container is not None else {}
+
+    def _chain(self, style_id: Optional[str]) -> list:
+        """The style and its ancestors, root first (stops on unknown ids and loops)."""
+        chain, seen = [], set()
+        while style_id and style_id not in seen and style_id in self._by_id:
+            seen.add(style_id)
+            style = self._by_id[style_id]
+            chain.append(style)
+            based = style.find(_BASED_ON)
+            style_id = based.get(_VAL) if based is not None else None
+        return chain[::-1]
+
+    def effective(self, style_id: Optional[str], kind: str, with_defaults: bool = True) -> Dict[str, tuple]:
+        """tag → signature of every `kind` ("w:rPr" / "w:pPr") property the style sets."""
+        key = (style_id, kind, with_defaults)
+        if key not in self._cache:
+            props = dict(self._doc_defaults[kind]) if with_defaults else {}
+            for style in self._chain(style_id):
+                props.update(self._props(style.find(qn(kind))))
+            self._cache[key] = props
+        return self._cache[key]
+
+    def paragraph_style(self, p) -> Optional[str]:
+        ps = p.find(f"{_PPR}/{_P_STYLE}")
+        return ps.get(_VAL) if ps is not None else self._default_para
+
+
+def _rpr_key(r) -> bytes:
+    rpr = r.find(_RPR)
+    return etree.tostring(rpr) if rpr is not None and len(rpr) else b""
+
+
+class Compactor:
+    """
+    `styles` is the <w:styles> element of the document the blocks land in
+    (e.g. tpl.styles.element); without it redundant formatting is kept.
+    Paragraphs inside tables are left to their table style and keep theirs.
+    """
+
+    def __init__(self, styles=None):
+        self.stats: Dict[str, int] = {
+            "elements_before": 0, "elements_after": 0,
+            "paragraphs_removed": 0, "runs_removed": 0, "runs_merged": 0,
+            "props_stripped": 0, "props_redundant": 0,
+        }
+        self._prev_empty = False
+        self._styles = _StyleSheet(styles) if styles is not None else None
+
+    def feed(self, blocks: Iterable) -> None:
+        """Compact newly appended body blocks (in document order)."""
+        for block in blocks:
+            self.stats["elements_before"] += sum(1 for _ in block.iter())
+            if block.tag == _P and _is_empty_paragraph(block):
+                if self._prev_empty:
+                    block.getparent().remove(block)
+                    self.stats["paragraphs_removed"] += 1
+                    continue
+                self._prev_empty = True
+            else:
+                self._prev_empty = False
+
+            paragraphs = [block] if block.tag == _P else list(block.iter(_P))
+            if self._styles is not None and block.tag == _P:
+                self._drop_redundant(block)
+            for p in paragraphs:
+                self._compact_runs(p)
+                for link in p.findall(_HYPERLINK):
+                    self._compact_runs(link)
+            self._strip_empty_props(block)
+            self.stats["elements_after"] += sum(1 for _ in block.iter())
+
+    def _compact_runs(self, container) -> None:
+        prev: Optional[etree._Element] = None
+        prev_key = b""
+        for r in list(container):
+            if r.tag != _R:
+                prev = None
+                continue
+            if _is_empty_run(r):
+                container.remove(r)
+                self.stats["runs_removed"] += 1
+                continue
+            if not _is_text_run(r):
+                prev = None
+                continue
+            key = _rpr_key(r)
+            if prev is not None and key == prev_key:
+                t_prev, t_cur = prev.find(_T), r.find(_T)
+                t_prev.text = (t_prev.text or "") + (t_cur.text or "")
+                if t_prev.text != t_prev.text.strip():
+                    t_prev.set(_XML_SPACE, "preserve")
+                container.remove(r)
+                self.stats["runs_merged"] += 1
+                continue
+            prev, prev_key = r, key
+
+    def _drop_redundant(self, p) -> None:
+        """Remove direct pPr/rPr children that equal what the paragraph style gives anyway."""
+        style_id = self._styles.paragraph_style(p)
+        ppr = p.find(_PPR)
+        # numbering indents sit between the style and direct formatting
+        numbered = (ppr is not None and ppr.find(_NUM_PR) is not None) or \
+            _NUM_PR in self._styles.effective(style_id, "w:pPr")
+        if ppr is not None:
+            inherited = self._styles.effective(style_id, "w:pPr")
+            for prop in list(ppr):
+                if prop.tag in _OWN_PPR or (numbered and prop.tag == qn("w:ind")):
+                    continue
+                if inherited.get(prop.tag) == _sig(prop):
+                    ppr.remove(prop)
+                    self.stats["props_redundant"] += 1
+
+        inherited = self._styles.effective(style_id, "w:rPr")
+        # only the paragraph's own runs: text boxes nest paragraphs with styles of their own
+        for r in p.findall(_R) + p.findall(f"{_HYPERLINK}/{_R}"):
+            rpr = r.find(_RPR)
+            if rpr is None:
+                continue
+            # a character style can override the paragraph style, so what it sets stays
+            rs = rpr.find(_R_STYLE)
+            shadowed = self._styles.effective(rs.get(_VAL), "w:rPr", with_defaults=False) if rs is not None else {}
+            for prop in list(rpr):
+                if prop.tag in _OWN_RPR or prop.tag in shadowed:
+                    continue
+                if inherited.get(prop.tag) == _sig(prop):
+                    rpr.remove(prop)
+                    self.stats["props_redundant"] += 1
+
+    def _strip_empty_props(self, block) -> None:
+        for el in list(block.iter(_RPR, _PPR)):
+            if len(el) == 0 and not el.attrib:
+                el.getparent().remove(el)
+                self.stats["props_stripped"] += 1
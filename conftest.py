@@ -0,0 +1,58 @@
+import os
+import stat
+import sys
+
+import pytest
+
+# Test double for LibreOffice: for every input .docx writes <stem>.pdf into
+# --outdir holding the SHA-256 of the input, so a test can tell which caller got
+# which PDF. Inputs containing b"BAD" produce no PDF (as a document soffice
+# can't load). FAKE_SOFFICE_SLEEP delays each launch; FAKE_SOFFICE_LOG gets one
+# line per launch listing its inputs.
+_FAKE_SOFFICE = """#!{python}
+import hashlib, os, sys, time
+args = sys.argv[1:]
+outdir = args[args.index("--outdir") + 1]
+inputs = [a for a in args if a.endswith(".docx")]
+log = os.environ.get("FAKE_SOFFICE_LOG")
+if log:
+    with open(log, "a") as f:
+        f.write(" ".join(os.path.basename(i) for i in inputs) + "\\n")
+time.sleep(float(os.environ.get("FAKE_SOFFICE_SLEEP", "0")))
+for path in inputs:
+    data = open(path, "rb").read()
+    if b"BAD" in data:
+        continue
+    stem = os.path.splitext(os.path.basename(path))[0]
+    with open(os.path.join(outdir, stem + ".pdf"), "wb") as f:
+        f.write(b"%PDF-1.4\\n% " + hashlib.sha256(data).hexdigest().encode() + b"\\n%%EOF\\n")
+"""
+
+
+@pytest.fixture
+def fake_soffice(tmp_path, monkeypatch):
+    """Put the stub soffice first on PATH and make converters detect it afresh."""
+    if sys.platform.startswith("win"):
+        pytest.skip("the soffice stub is a POSIX script")
+    import converters
+
+    bin_dir = tmp_path / "fake_bin"
+    bin_dir.mkdir()
+    exe = bin_dir / "soffice"
+    exe.write_text(_FAKE_SOFFICE.format(python=sys.executable), encoding="utf-8")
+    exe.chmod(exe.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    log = tmp_path / "soffice_calls.log"
+
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}")
+    monkeypatch.setenv("FAKE_SOFFICE_LOG", str(log))
+    monkeypatch.delenv("DOC_COMPOSER_PDF_WORKERS", raising=False)
+    for key in ("word", "soffice_path", "engine", "detail"):
+        monkeypatch.setitem(converters._DETECTED, key, None)
+    monkeypatch.setitem(converters._REMOTE, "pool", None)
+    monkeypatch.setattr(converters, "_BATCHER", None)
+    converters.detect_pdf_engine(refresh=True)
+
+    def launches():
+        return log.read_text().splitlines() if log.exists() else []
+
+    return {"bin": bin_dir, "log": log, "launches": launches}
@@ -0,0 +1,139 @@
+# conversion_worker.py
+"""
+Stand-alone PDF conversion node: docx_to_pdf over HTTP, so LibreOffice can be
+scaled separately from the Flask tier.
+
+Usage:
+  python conversion_worker.py --port 5601 [--host 0.0.0.0] [--slots 2] [--token SECRET]
+
+Endpoints:
+  GET  /healthz  → 200 {"ok", "engine", "active", "waiting", "slots"} (503 without an engine)
+  POST /convert  → DOCX as the raw request body, PDF as the response body.
+                   422 {"error"} when the document doesn't convert, 503 + Retry-After
+                   when all slots and the queue are taken, 401 on a bad token.
+                   If the caller hangs up mid-conversion, soffice is killed.
+
+Both bodies are streamed through temporary files. Every instance keeps its
+LibreOffice profiles under .lo_profiles/worker-<port>, so several workers can
+run on one host. Point the app at them with
+  DOC_COMPOSER_PDF_WORKERS=http://host-a:5601,http://host-b:5601
+(+ DOC_COMPOSER_WORKER_TOKEN when --token is set); see converters.RemoteWorkers.
+When every worker answers 503 the app answers 503 + Retry-After too; it only
+converts locally when no worker is reachable, and not at all with
+DOC_COMPOSER_PDF_LOCAL_FALLBACK=0.
+"""
+from __future__ import annotations
+import argparse
+import hmac
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+
+from flask import Flask, jsonify, request, send_file
+
+import converters
+from converters import (CANCELLED, _DETECTED, _convert_with_libreoffice, detect_pdf_engine, docx_to_pdf,
+                        lo_worker_profile)
+from jobs import Limiter, Overloaded, watch_disconnect
+
+BASE_DIR = Path(__file__).resolve().parent
+LO_PROFILE_ROOT = BASE_DIR / ".lo_profiles"
+_CHUNK = 1024 * 1024
+
+worker = Flask(__name__)
+worker.config["MAX_CONTENT_LENGTH"] = 200 * 1024 * 1024
+worker.config["WORKER_TOKEN"] = os.environ.get("DOC_COMPOSER_WORKER_TOKEN", "")
+
+SLOTS = Limiter("convert", slots=2, max_waiting=4)
+
+
+def _convert(docx_path: Path, pdf_path: Path, cancel=None):
+    # Concurrent soffice processes in one worker need a profile each
+    if _DETECTED.get("engine") == "libreoffice":
+        with lo_worker_profile() as profile:
+            return _convert_with_libreoffice(docx_path, pdf_path, profile=profile, cancel=cancel)
+    return docx_to_pdf(docx_path, pdf_path, cancel=cancel)
+
+
+@worker.before_request
+def _check_token():
+    token = worker.config["WORKER_TOKEN"]
+    if token and not hmac.compare_digest(request.headers.get("X-Worker-Token", ""), token):
+        return jsonify({"error": "bad or missing X-Worker-Token"}), 401
+
+
+@worker.errorhandler(Overloaded)
+def _overloaded(e: Overloaded):
+    resp = jsonify({"error": "worker busy"})
+    resp.status_code = 503
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp
+
+
+@worker.get("/healthz")
+def healthz():
+    ok, detail = detect_pdf_engine()
+    body = {"ok": ok and _DETECTED.get("engine") != "remote", "engine": detail, **SLOTS.stats()}
+    return jsonify(body), (200 if body["ok"] else 503)
+
+
+@worker.post("/convert")
+def convert():
+    with SLOTS.slot():
+        tmp = Path(tempfile.mkdtemp(prefix="convert_"))
+        try:
+            docx_path = tmp / "input.docx"
+            with docx_path.open("wb") as out:
+                shutil.copyfileobj(request.stream, out, _CHUNK)
+            if docx_path.stat().st_size == 0:
+                shutil.rmtree(tmp, ignore_errors=True)
+                return jsonify({"error": "empty request body"}), 400
+            pdf_path = tmp / "input.pdf"
+            cancel = threading.Event()
+            with watch_disconnect(request.environ, cancel.set):
+                err = _convert(docx_path, pdf_path, cancel=cancel)
+            if err == CANCELLED:
+                print("Caller went away; conversion cancelled")
+                shutil.rmtree(tmp, ignore_errors=True)
+                return jsonify({"error": err}), 499
+            if err is not None or not pdf_path.exists():
+                print("Conversion failed:", err)
+                shutil.rmtree(tmp, ignore_errors=True)
+                return jsonify({"error": err or "no PDF produced"}), 422
+            resp = send_file(pdf_path, mimetype="application/pdf", conditional=False)
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+    # The PDF streams out after the slot is released; the files go once it's sent
+    resp.call_on_close(lambda: shutil.rmtree(tmp, ignore_errors=True))
+    return resp
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Document Composer PDF conversion worker")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=5601)
+    ap.add_argument("--slots", type=int, default=2, help="Conversions running at once")
+    ap.add_argument("--max-waiting", type=int, default=4, help="Requests queued before answering 503")
+    ap.add_argument("--token", default=None, help="Shared secret expected in X-Worker-Token")
+    args = ap.parse_args()
+
+    global SLOTS
+    SLOTS = Limiter("convert", slots=args.slots, max_waiting=args.max_waiting)
+    if args.token is not None:
+        worker.config["WORKER_TOKEN"] = args.token
+    # A worker must convert locally, whatever the environment says
+    os.environ.pop("DOC_COMPOSER_PDF_WORKERS", None)
+    converters.set_lo_profile(LO_PROFILE_ROOT / f"worker-{args.port}")
+
+    ok, detail = detect_pdf_engine()
+    print(f"Conversion worker on {args.host}:{args.port} — {detail} ({args.slots} slot(s))")
+    if not ok:
+        print("WARNING: no PDF engine; /healthz will report 503")
+    worker.run(host=args.host, port=args.port, threaded=True, debug=False, use_reloader=False)
+
+
+if __name__ == "__main__":
+    main()
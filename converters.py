@@ -1,23 +1,110 @@
 # converters.py
 from __future__ import annotations
+import json
 import os
 import shutil
+import signal
 import subprocess
 import sys
+import tempfile
+import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Iterator, List, Optional, Tuple
+
+from jobs import Overloaded
 
 # Caches so we don't re-detect on every call
 _DETECTED: dict[str, Optional[str]] = {
     "word": None,          # "available" or None
     "soffice_path": None,  # full path to soffice.exe if found
     "engine": None,        # "word" | "libreoffice" | None
+    "detail": None,        # last detect_pdf_engine() message; None = not detected yet
 }
 
+# Error string for conversions stopped through their `cancel` event
+CANCELLED = "Conversion cancelled."
+
 def _windows() -> bool:
     return sys.platform.startswith("win")
 
+def _is_cancelled(cancel) -> bool:
+    return cancel is not None and cancel.is_set()
+
+def _kill_tree(proc: subprocess.Popen) -> None:
+    """Kill a process and everything it started (soffice → oosplash → soffice.bin)."""
+    try:
+        if _windows():
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(proc.pid)],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=15)
+        else:
+            os.killpg(proc.pid, signal.SIGKILL)
+    except Exception:
+        proc.kill()
+    try:
+        proc.communicate(timeout=5)
+    except Exception:
+        pass
+
+def _run_soffice(cmd: List[str], env: dict, timeout_s: float, cancel=None) -> bool:
+    """
+    Run one soffice command line in its own process group. Returns False if
+    `cancel` (a threading.Event) was set meanwhile; raises TimeoutExpired after
+    timeout_s. Either way the whole process tree is killed, not just the launcher.
+    """
+    group = ({"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP} if _windows()
+             else {"start_new_session": True})
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, **group)
+    deadline = time.monotonic() + timeout_s
+    while True:
+        try:
+            proc.communicate(timeout=0.25)
+            return True
+        except subprocess.TimeoutExpired:
+            pass
+        if _is_cancelled(cancel):
+            _kill_tree(proc)
+            return False
+        if time.monotonic() >= deadline:
+            _kill_tree(proc)
+            raise subprocess.TimeoutExpired(cmd, timeout_s)
+
+class _AllSet:
+    """is_set() once every one of the events is; a shared batch stops when nobody wants it."""
+
+    def __init__(self, events: list):
+        self.events = events
+
+    def is_set(self) -> bool:
+        return all(e.is_set() for e in self.events)
+
+@contextmanager
+def _abort_on_cancel(cancel, conn) -> Iterator[None]:
+    """While the block runs, shut the connection's socket down as soon as `cancel` is set."""
+    if cancel is None:
+        yield
+        return
+    done = threading.Event()
+
+    def watch():
+        while not done.wait(0.25):
+            if cancel.is_set():
+                sock = getattr(conn, "sock", None)
+                if sock is not None:
+                    try:
+                        sock.shutdown(2)   # SHUT_RDWR: unblocks the pending send/recv
+                    except OSError:
+                        pass
+                return
+
+    threading.Thread(target=watch, name="remote-cancel", daemon=True).start()
+    try:
+        yield
+    finally:
+        done.set()
+
 # ---------- WORD / docx2pdf ----------
 def _word_available() -> bool:
     """Return True if Word is usable via COM/docx2pdf."""
@@ -96,46 +183,128 @@ def _find_soffice() -> Optional[str]:
                 return c
     return None
 
-def _convert_with_libreoffice(docx_path: Path, pdf_path: Path, timeout_s: int = 180) -> Optional[str]:
-    """Use LibreOffice in headless mode. Returns None on success, else err string."""
-    soffice = _find_soffice()
-    if not soffice:
-        return "LibreOffice (soffice) was not found."
-
-    outdir = pdf_path.parent
-    outdir.mkdir(parents=True, exist_ok=True)
+# Private user profile for soffice (None → LibreOffice's default under HOME).
+# Two soffice processes sharing a profile hand work to each other or fail, so
+# every process that converts concurrently needs its own.
+_LO_PROFILE: dict[str, Optional[Path]] = {"dir": None}
 
+def set_lo_profile(profile_dir: Path | str | None, seed: Path | str | None = None) -> None:
+    """
+    Point soffice at `profile_dir` as its user installation. When `seed` is an
+    existing (already initialised) profile and `profile_dir` doesn't exist yet,
+    copy it so LibreOffice skips its slow first-run setup.
+    """
+    if profile_dir is None:
+        _LO_PROFILE["dir"] = None
+        return
+    target = Path(profile_dir)
+    if seed is not None and Path(seed).is_dir() and not target.exists():
+        try:
+            shutil.copytree(seed, target)
+        except Exception as e:
+            print("LibreOffice profile seed copy failed:", e)
+    target.mkdir(parents=True, exist_ok=True)
+    _LO_PROFILE["dir"] = target
+
+# Extra profiles for conversions that run side by side (pdf_sections). A slot
+# is held by one soffice at a time; the directories are kept between jobs so
+# only the first use of each pays for LibreOffice's first-run setup.
+_WORKER_SLOTS: set[int] = set()
+_WORKER_LOCK = threading.Lock()
+
+@contextmanager
+def lo_worker_profile() -> Iterator[Path]:
+    """Borrow a LibreOffice profile no other running soffice is using."""
+    with _WORKER_LOCK:
+        slot = 0
+        while slot in _WORKER_SLOTS:
+            slot += 1
+        _WORKER_SLOTS.add(slot)
+    try:
+        main = _LO_PROFILE["dir"]
+        if main is not None:
+            target = main.with_name(f"{main.name}_w{slot}")
+        else:
+            target = Path(tempfile.gettempdir()) / f"docx_composer_lo_w{slot}"
+        if not target.exists():
+            if main is not None and main.is_dir():
+                try:
+                    shutil.copytree(main, target)
+                except Exception as e:
+                    print("LibreOffice profile seed copy failed:", e)
+            target.mkdir(parents=True, exist_ok=True)
+        yield target
+    finally:
+        with _WORKER_LOCK:
+            _WORKER_SLOTS.discard(slot)
+
+def _soffice_cmd(soffice: str, inputs: List[Path], outdir: Path,
+                 profile: Optional[Path] = None, export_filter: str = "pdf") -> List[str]:
+    """Build the headless --convert-to pdf command line for one or more inputs."""
     # LibreOffice writes to outdir with the same base name
     # Use --convert-to pdf and explicit outdir
-    cmd = [
-        soffice,
+    cmd = [soffice]
+    profile = profile or _LO_PROFILE["dir"]
+    if profile is not None:
+        cmd.append(f"-env:UserInstallation={profile.resolve().as_uri()}")
+    cmd += [
         "--headless",
         "--invisible",
         "--norestore",
         "--nodefault",
         "--nolockcheck",
         "--convert-to",
-        "pdf",
-        str(docx_path.resolve()),
-        "--outdir",
-        str(outdir.resolve())
+        export_filter,
     ]
+    cmd.extend(str(p.resolve()) for p in inputs)
+    cmd.extend(["--outdir", str(outdir.resolve())])
+    return cmd
 
+def _soffice_env(outdir: Path) -> dict:
     # On some systems LibreOffice needs HOME or USER environment set to a writable dir
     env = os.environ.copy()
     env_home = env.get("HOME") or env.get("USERPROFILE") or str(outdir)
     env["HOME"] = env_home
+    return env
+
+def _finalize_pdf(expected: Path, pdf_path: Path) -> Optional[str]:
+    """Move LibreOffice's output to the caller's requested path."""
+    try:
+        if expected.resolve() != pdf_path.resolve():
+            # Overwrite if existing
+            if pdf_path.exists():
+                pdf_path.unlink()
+            expected.replace(pdf_path)
+    except Exception:
+        # if replace fails, attempt a copy
+        try:
+            shutil.copyfile(expected, pdf_path)
+        except Exception as e:
+            return f"Failed to finalize PDF: {e!s}"
+    return None
+
+def _convert_with_libreoffice(docx_path: Path, pdf_path: Path, timeout_s: int = 180,
+                              profile: Optional[Path] = None, export_filter: str = "pdf",
+                              cancel=None) -> Optional[str]:
+    """
+    Use LibreOffice in headless mode. Returns None on success, else err string.
+    `profile` overrides the shared user profile (see lo_worker_profile);
+    setting `cancel` kills soffice and returns CANCELLED.
+    """
+    soffice = _find_soffice()
+    if not soffice:
+        return "LibreOffice (soffice) was not found."
+
+    outdir = pdf_path.parent
+    outdir.mkdir(parents=True, exist_ok=True)
+
+    cmd = _soffice_cmd(soffice, [docx_path], outdir, profile=profile, export_filter=export_filter)
+    env = _soffice_env(outdir)
 
     try:
-        proc = subprocess.run(
-            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-            timeout=timeout_s, check=False, env=env
-        )
-        # some libreoffice versions return non-zero but still produce file; we'll check file existence
-        if proc.returncode != 0:
-            # include stderr/stdout for debugging
-            stderr = proc.stderr.decode("utf-8", "ignore") or proc.stdout.decode("utf-8", "ignore")
-            # continue to wait for file but return error if not found
+        # some libreoffice versions return non-zero but still produce file; we check file existence
+        if not _run_soffice(cmd, env, timeout_s, cancel):
+            return CANCELLED
         # LibreOffice names output as <basename>.pdf
     except subprocess.TimeoutExpired:
         return "LibreOffice conversion timed out."
@@ -163,45 +332,291 @@ def _convert_with_libreoffice(docx_path: Path, pdf_path: Path, timeout_s: int =
         return "LibreOffice didn't produce the PDF."
 
     # Finally move/rename expected -> pdf_path if needed (to ensure path matches)
+    return _finalize_pdf(expected, pdf_path)
+
+def _convert_many_with_libreoffice(pairs: List[Tuple[Path, Path]], timeout_s: int = 180,
+                                   cancel=None) -> List[Optional[str]]:
+    """
+    Convert several DOCX files with a single soffice launch.
+    Returns one entry per (docx, pdf) pair: None on success, else err string.
+    `timeout_s` is the budget per document; the batch gets the sum.
+    """
+    if not pairs:
+        return []
+    soffice = _find_soffice()
+    if not soffice:
+        return ["LibreOffice (soffice) was not found."] * len(pairs)
+
+    staging = Path(tempfile.mkdtemp(prefix="lo_batch_"))
     try:
-        if expected.resolve() != pdf_path.resolve():
-            # Overwrite if existing
-            if pdf_path.exists():
-                pdf_path.unlink()
-            expected.replace(pdf_path)
-    except Exception:
-        # if replace fails, attempt a copy
+        indir = staging / "in"
+        outdir = staging / "out"
+        indir.mkdir()
+        outdir.mkdir()
+
+        # Stage every input under a unique name so callers whose files share a
+        # stem (merged_<ts>.docx in different dirs) can't overwrite each other.
+        staged: List[Optional[Path]] = []
+        for k, (docx_path, _pdf) in enumerate(pairs):
+            target = indir / f"doc_{k:04d}.docx"
+            try:
+                try:
+                    os.link(docx_path, target)
+                except OSError:
+                    shutil.copyfile(docx_path, target)
+                staged.append(target)
+            except Exception:
+                staged.append(None)
+
+        inputs = [p for p in staged if p is not None]
+        if inputs:
+            try:
+                if not _run_soffice(_soffice_cmd(soffice, inputs, outdir), _soffice_env(outdir),
+                                    timeout_s * len(inputs), cancel):
+                    return [CANCELLED] * len(pairs)
+            except subprocess.TimeoutExpired:
+                print(f"LibreOffice batch of {len(inputs)} timed out; retrying leftovers one by one")
+            except Exception as e:
+                return [f"LibreOffice conversion failed to start: {e!s}"] * len(pairs)
+
+        results: List[Optional[str]] = []
+        for (docx_path, pdf_path), src in zip(pairs, staged):
+            if src is None:
+                results.append(f"DOCX file not readable: {docx_path}")
+                continue
+            produced = outdir / (src.stem + ".pdf")
+            if produced.exists():
+                pdf_path.parent.mkdir(parents=True, exist_ok=True)
+                results.append(_finalize_pdf(produced, pdf_path))
+            else:
+                # One bad document can take the whole soffice run down with it;
+                # retry alone so the failure stays with the file that caused it.
+                results.append(_convert_with_libreoffice(docx_path, pdf_path, timeout_s=timeout_s,
+                                                         cancel=cancel))
+        return results
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+# ---------- REMOTE WORKERS ----------
+class RemoteWorkers:
+    """
+    Client side of conversion_worker.py: spreads docx_to_pdf calls over a list
+    of worker base URLs.
+
+    Each call goes to the healthy worker with the fewest requests in flight
+    (ties rotate). Connection failures, timeouts and 5xx answers move on to the
+    next worker; a worker that failed is only tried again after a successful
+    GET /healthz, at most every `health_interval_s`. A 503 only means that
+    worker is busy: when every reachable worker is, convert() raises
+    Overloaded with the shortest Retry-After instead of loading the web tier.
+    A 422 means the document itself didn't convert and is returned as is.
+    Bodies stream both ways, so neither side holds a whole DOCX or PDF in memory.
+
+    `local_fallback` lets docx_to_pdf convert on this host when no worker is
+    reachable at all (DOC_COMPOSER_PDF_LOCAL_FALLBACK=0 turns it off).
+    """
+
+    def __init__(self, urls: List[str], token: Optional[str] = None, timeout_s: int = 300,
+                 health_interval_s: float = 10.0, local_fallback: bool = True):
+        self.token = token
+        self.timeout_s = timeout_s
+        self.health_interval_s = health_interval_s
+        self.local_fallback = local_fallback
+        self._lock = threading.Lock()
+        self._turn = 0
+        self.workers = [{"url": u.rstrip("/"), "healthy": True, "checked": 0.0, "inflight": 0,
+                         "done": 0, "failures": 0} for u in urls if u.strip()]
+
+    def _headers(self) -> dict:
+        return {"X-Worker-Token": self.token} if self.token else {}
+
+    def _request(self, url: str, method: str, body=None, headers=None, timeout: Optional[float] = None,
+                 cancel=None):
+        import http.client
+        from urllib.parse import urlsplit
+        parts = urlsplit(url)
+        conn_cls = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        conn = conn_cls(parts.netloc, timeout=timeout or self.timeout_s)
+        with _abort_on_cancel(cancel, conn):
+            conn.request(method, parts.path or "/", body=body, headers={**self._headers(), **(headers or {})})
+            return conn, conn.getresponse()
+
+    def check(self, worker: dict) -> bool:
+        """GET /healthz and record the answer."""
+        ok = False
         try:
-            shutil.copyfile(expected, pdf_path)
+            conn, resp = self._request(worker["url"] + "/healthz", "GET", timeout=3)
+            ok = resp.status == 200
+            resp.read()
+            conn.close()
+        except Exception:
+            ok = False
+        with self._lock:
+            worker["healthy"] = ok
+            worker["checked"] = time.monotonic()
+        return ok
+
+    def status(self) -> Tuple[int, int]:
+        """(healthy, configured) after re-checking every worker."""
+        return sum(self.check(w) for w in self.workers), len(self.workers)
+
+    def _pick(self, tried: set) -> Optional[dict]:
+        now = time.monotonic()
+        stale = [w for w in self.workers if w["url"] not in tried and not w["healthy"]
+                 and now - w["checked"] >= self.health_interval_s]
+        for w in stale:
+            self.check(w)
+        with self._lock:
+            ready = [w for w in self.workers if w["healthy"] and w["url"] not in tried]
+            if not ready:
+                return None
+            self._turn += 1
+            least = min(w["inflight"] for w in ready)
+            ready = [w for w in ready if w["inflight"] == least]
+            worker = ready[self._turn % len(ready)]
+            worker["inflight"] += 1
+            return worker
+
+    def _post(self, worker: dict, docx_path: Path, pdf_path: Path, cancel=None) -> Tuple[Optional[str], str]:
+        """One attempt. Returns (error, outcome): "done", "failed", "retry" (elsewhere) or "busy:<seconds>"."""
+        tmp = pdf_path.with_name(pdf_path.name + ".part")
+        try:
+            with docx_path.open("rb") as body:
+                # Cancelling drops the connection; the worker notices and kills its soffice
+                conn, resp = self._request(worker["url"] + "/convert", "POST", body=body, headers={
+                    "Content-Type": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                    "Content-Length": str(docx_path.stat().st_size),
+                }, cancel=cancel)
+            try:
+                if resp.status != 200:
+                    detail = resp.read(2000).decode("utf-8", "ignore")
+                    try:
+                        detail = json.loads(detail).get("error", detail)
+                    except Exception:
+                        pass
+                    err = f"worker {worker['url']} answered {resp.status}: {detail}"
+                    if resp.status == 503:
+                        retry_after = resp.getheader("Retry-After", "")
+                        return err, f"busy:{int(retry_after) if retry_after.isdigit() else 5}"
+                    return err, "retry" if resp.status >= 500 else "failed"
+                with tmp.open("wb") as out:
+                    shutil.copyfileobj(resp, out, 1024 * 1024)
+            finally:
+                conn.close()
+            os.replace(tmp, pdf_path)
+            return None, "done"
         except Exception as e:
-            return f"Failed to finalize PDF: {e!s}"
-
-    return None
+            if _is_cancelled(cancel):
+                return CANCELLED, "failed"
+            with self._lock:
+                worker["healthy"] = False
+                worker["checked"] = time.monotonic()
+            return f"worker {worker['url']} unreachable: {e!s}", "retry"
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    def convert(self, docx_path: Path, pdf_path: Path, cancel=None) -> Tuple[Optional[str], bool]:
+        """
+        Returns (error, answered): answered is False when no worker could take
+        the job at all, so the caller may still convert locally. Raises
+        Overloaded when the reachable workers are all busy.
+        """
+        tried: set = set()
+        busy: List[int] = []
+        err = "No remote conversion worker is reachable."
+        while True:
+            if _is_cancelled(cancel):
+                return CANCELLED, True
+            worker = self._pick(tried)
+            if worker is None:
+                if busy:
+                    raise Overloaded("pdf workers", min(busy))
+                return err, False
+            tried.add(worker["url"])
+            try:
+                err, outcome = self._post(worker, docx_path, pdf_path, cancel=cancel)
+            finally:
+                with self._lock:
+                    worker["inflight"] -= 1
+                    worker["done" if err is None else "failures"] += 1
+            if outcome.startswith("busy:"):
+                busy.append(int(outcome[5:]))
+                continue
+            if outcome != "retry":
+                return err, True
+            print(f"Remote conversion failed, trying another worker: {err}")
+
+
+_REMOTE: dict[str, Optional[RemoteWorkers]] = {"pool": None}
+
+def set_remote_workers(urls: List[str] | None, token: Optional[str] = None, timeout_s: int = 300,
+                       local_fallback: bool = True) -> None:
+    """
+    Send conversions to conversion_worker.py instances (None/empty → convert locally).
+    Defaults come from DOC_COMPOSER_PDF_WORKERS (comma-separated base URLs),
+    DOC_COMPOSER_WORKER_TOKEN and DOC_COMPOSER_PDF_LOCAL_FALLBACK on first engine detection.
+    """
+    _REMOTE["pool"] = (RemoteWorkers(urls, token=token, timeout_s=timeout_s, local_fallback=local_fallback)
+                       if urls else None)
+    _DETECTED["detail"] = None   # re-detect on next use
+
+def _remote_from_env() -> None:
+    if _REMOTE["pool"] is None and os.environ.get("DOC_COMPOSER_PDF_WORKERS"):
+        set_remote_workers(os.environ["DOC_COMPOSER_PDF_WORKERS"].split(","),
+                           token=os.environ.get("DOC_COMPOSER_WORKER_TOKEN") or None,
+                           local_fallback=os.environ.get("DOC_COMPOSER_PDF_LOCAL_FALLBACK", "1").strip().lower()
+                           not in ("0", "false", "no", "off"))
+
+def _convert_locally(docx_path: Path, pdf_path: Path, cancel=None) -> Optional[str]:
+    """Fallback for the remote engine when no worker is reachable."""
+    if _windows() and _word_available():
+        return _convert_with_word(docx_path, pdf_path)
+    if _find_soffice():
+        return _convert_with_libreoffice(docx_path, pdf_path, cancel=cancel)
+    return "no local converter to fall back to"
 
 # ---------- Public API ----------
-def detect_pdf_engine() -> Tuple[bool, str]:
+def detect_pdf_engine(refresh: bool = False) -> Tuple[bool, str]:
     """
     Detect and cache the best available engine.
-    Returns (available, details).
+    Returns (available, details). The first answer is reused until refresh=True.
     """
+    if _DETECTED.get("detail") is not None and not refresh:
+        return _DETECTED["engine"] is not None, _DETECTED["detail"]
+
+    # Configured worker nodes win even while they're down: every call re-checks
+    # them and falls back to a local engine if none answers (unless that is
+    # turned off with DOC_COMPOSER_PDF_LOCAL_FALLBACK=0).
+    _remote_from_env()
+    pool = _REMOTE["pool"]
+    if pool is not None and pool.workers:
+        healthy, total = pool.status()
+        _DETECTED["engine"] = "remote"
+        _DETECTED["detail"] = f"{healthy}/{total} remote conversion worker(s) healthy"
+        return True, _DETECTED["detail"]
+
     # Prefer Word on Windows because quality is excellent
     if _windows() and _word_available():
         _DETECTED["engine"] = "word"
-        return True, "Microsoft Word (COM) detected"
+        _DETECTED["detail"] = "Microsoft Word (COM) detected"
+        return True, _DETECTED["detail"]
 
     soffice = _find_soffice()
     if soffice:
         _DETECTED["engine"] = "libreoffice"
-        return True, f"LibreOffice at {soffice}"
+        _DETECTED["detail"] = f"LibreOffice at {soffice}"
+        return True, _DETECTED["detail"]
 
     _DETECTED["engine"] = None
-    return False, "No converter detected (install Microsoft Word or LibreOffice)."
+    _DETECTED["detail"] = "No converter detected (install Microsoft Word or LibreOffice)."
+    return False, _DETECTED["detail"]
 
-def docx_to_pdf(docx: Path | str, pdf: Path | str) -> Optional[str]:
+def docx_to_pdf(docx: Path | str, pdf: Path | str, cancel=None) -> Optional[str]:
     """
     Convert DOCX -> PDF.
     Returns None on success, or a short error message string.
     Tries the detected engine; if none detected yet, detects now.
+    Setting `cancel` (a threading.Event) stops the conversion → CANCELLED.
     """
     docx_path = Path(docx)
     pdf_path  = Path(pdf)
@@ -220,19 +635,28 @@ def docx_to_pdf(docx: Path | str, pdf: Path | str) -> Optional[str]:
             return "No PDF converter available (install Microsoft Word or LibreOffice)."
         engine = _DETECTED["engine"]
 
+    if engine == "remote":
+        # Busy workers raise Overloaded here; only unreachable ones fall through to a local conversion
+        err, answered = _REMOTE["pool"].convert(docx_path, pdf_path, cancel=cancel)
+        if answered or not _REMOTE["pool"].local_fallback:
+            return err
+        print("Remote conversion unavailable, converting locally:", err)
+        local_err = _convert_locally(docx_path, pdf_path, cancel=cancel)
+        return None if local_err is None else f"{err}; {local_err}"
+
     # Try selected engine, fall back to the other if it fails
     if engine == "word":
         err = _convert_with_word(docx_path, pdf_path)
         if err is None:
             return None
         # fallback to LO
-        lo_err = _convert_with_libreoffice(docx_path, pdf_path)
+        lo_err = _convert_with_libreoffice(docx_path, pdf_path, cancel=cancel)
         return lo_err or None
 
     if engine == "libreoffice":
-        err = _convert_with_libreoffice(docx_path, pdf_path)
-        if err is None:
-            return None
+        err = _convert_with_libreoffice(docx_path, pdf_path, cancel=cancel)
+        if err is None or err == CANCELLED:
+            return err
         # On Windows, try Word fallback if available
         if _windows() and _word_available():
             w_err = _convert_with_word(docx_path, pdf_path)
@@ -242,7 +666,205 @@ def docx_to_pdf(docx: Path | str, pdf: Path | str) -> Optional[str]:
     # Shouldn't reach here
     return "No PDF converter available (install Microsoft Word for docx2pdf or LibreOffice)."
 
+def docx_to_pdf_many(pairs: List[Tuple[Path | str, Path | str]], cancel=None) -> List[Optional[str]]:
+    """
+    Convert several DOCX -> PDF pairs.
+    Returns one entry per pair (None on success, else a short error message).
+    With LibreOffice all documents share a single soffice launch.
+    """
+    norm = [(Path(d), Path(p)) for d, p in pairs]
+    results: List[Optional[str]] = [None] * len(norm)
+
+    engine = _DETECTED.get("engine")
+    if engine is None:
+        available, _ = detect_pdf_engine()
+        if not available:
+            return ["No PDF converter available (install Microsoft Word or LibreOffice)."] * len(norm)
+        engine = _DETECTED["engine"]
+
+    if engine == "remote":
+        # One request per document, as many in flight as there are workers
+        with ThreadPoolExecutor(max_workers=max(1, len(_REMOTE["pool"].workers))) as pool:
+            return list(pool.map(lambda pair: docx_to_pdf(*pair, cancel=cancel), norm))
+    if engine != "libreoffice":
+        return [docx_to_pdf(d, p, cancel=cancel) for d, p in norm]
+
+    todo = []
+    for k, (docx_path, pdf_path) in enumerate(norm):
+        if not docx_path.exists():
+            results[k] = f"DOCX file not found: {docx_path}"
+        else:
+            todo.append(k)
+
+    batch_results = _convert_many_with_libreoffice([norm[k] for k in todo], cancel=cancel)
+    for k, err in zip(todo, batch_results):
+        if err is not None and err != CANCELLED and _windows() and _word_available():
+            err = _convert_with_word(*norm[k]) or None
+        results[k] = err
+    return results
+
+
+class PdfBatcher:
+    """
+    Coalesces concurrent docx_to_pdf requests into shared LibreOffice runs.
+
+    An idle batcher converts a request straight away; requests that arrive while
+    a run is in progress queue up and go together in the next run, so nobody
+    waits on a fixed window. Callers block on the returned Future; each gets
+    back its own error (or None), so one broken document never fails the
+    others in its batch.
+    """
+
+    def __init__(self, max_batch: int = 16):
+        self.max_batch = max_batch
+        self._pending: list = []   # (docx, pdf, future, cancel event or None)
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, docx: Path | str, pdf: Path | str, cancel=None) -> Future:
+        fut: Future = Future()
+        with self._cond:
+            self._pending.append((Path(docx), Path(pdf), fut, cancel))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="pdf-batcher", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return fut
+
+    def _take_batch(self) -> list:
+        with self._cond:
+            while not self._pending:
+                if not self._cond.wait(timeout=30):
+                    return []
+            # Whatever queued up during the previous run goes now, no extra wait
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                with self._cond:
+                    if not self._pending:
+                        self._thread = None
+                        return
+                continue
+            # Requests cancelled while queued are dropped; the shared soffice
+            # run is only killed once everyone still in it has cancelled.
+            for _d, _p, fut, cancel in batch:
+                if _is_cancelled(cancel):
+                    fut.set_result(CANCELLED)
+            batch = [b for b in batch if not b[2].done()]
+            if not batch:
+                continue
+            cancels = [c for *_rest, c in batch]
+            try:
+                errors = docx_to_pdf_many([(d, p) for d, p, _f, _c in batch],
+                                          cancel=_AllSet(cancels) if None not in cancels else None)
+            except Exception as e:
+                errors = [f"PDF batch failed: {e!s}"] * len(batch)
+            for (_d, _p, fut, _c), err in zip(batch, errors):
+                fut.set_result(err)
+
+
+_BATCHER: Optional[PdfBatcher] = None
+_BATCHER_LOCK = threading.Lock()
+
+def docx_to_pdf_batched(docx: Path | str, pdf: Path | str, cancel=None) -> Optional[str]:
+    """
+    Same contract as docx_to_pdf(), but concurrent callers are coalesced into a
+    single LibreOffice invocation. Other engines convert directly.
+    """
+    global _BATCHER
+    engine = _DETECTED.get("engine")
+    if engine is None:
+        detect_pdf_engine()
+        engine = _DETECTED.get("engine")
+    if engine != "libreoffice":
+        return docx_to_pdf(docx, pdf, cancel=cancel)
+    with _BATCHER_LOCK:
+        if _BATCHER is None:
+            _BATCHER = PdfBatcher()
+    return _BATCHER.submit(docx, pdf, cancel=cancel).result()
+
+# ---------- PDF POST-PROCESSING ----------
+def _optimize_with_qpdf(qpdf: str, src: Path, dst: Path, linearize: bool, timeout_s: int) -> Optional[str]:
+    cmd = [qpdf, "--object-streams=generate", "--compress-streams=y", "--recompress-flate",
+           "--remove-unreferenced-resources=yes"]
+    if linearize:
+        cmd.append("--linearize")
+    cmd += [str(src), str(dst)]
+    try:
+        proc = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout_s)
+    except subprocess.TimeoutExpired:
+        return f"qpdf timed out after {timeout_s}s"
+    # exit status 3 = succeeded with warnings
+    if proc.returncode not in (0, 3) or not dst.exists():
+        return f"qpdf failed ({proc.returncode}): {(proc.stderr or proc.stdout).strip()[:300]}"
+    return None
+
+def _optimize_with_pypdf(src: Path, dst: Path) -> Optional[str]:
+    try:
+        from pypdf import PdfWriter
+    except Exception:
+        return "pypdf is not installed"
+    try:
+        writer = PdfWriter(clone_from=str(src))
+        # Fonts and images LibreOffice embedded once per use collapse to one object
+        if hasattr(writer, "compress_identical_objects"):
+            writer.compress_identical_objects()   # defaults drop duplicates and orphans
+        for page in writer.pages:
+            page.compress_content_streams()
+        with dst.open("wb") as f:
+            writer.write(f)
+    except Exception as e:
+        return f"pypdf optimisation failed: {e!s}"
+    return None
+
+def optimize_pdf(pdf: Path | str, linearize: bool = True, timeout_s: int = 120) -> dict:
+    """
+    Shrink a finished PDF in place: deduplicate identical objects (fonts,
+    images), compress content and object streams and — with qpdf on PATH —
+    linearize it so viewers can show page 1 before the whole file arrives.
+    pypdf alone cannot linearize; it is the fallback when qpdf is missing.
+
+    Returns stats: engine, before_bytes, after_bytes, seconds, linearized and
+    error (None on success). The original file is kept if optimisation fails
+    or would make it bigger without adding linearization.
+    """
+    pdf = Path(pdf)
+    t0 = time.perf_counter()
+    before = pdf.stat().st_size
+    tmp = pdf.with_name(pdf.stem + ".opt.pdf")
+    qpdf = shutil.which("qpdf")
+    if qpdf:
+        engine = "qpdf"
+        err = _optimize_with_qpdf(qpdf, pdf, tmp, linearize, timeout_s)
+        linearized = linearize and err is None
+    else:
+        engine = "pypdf"
+        err = _optimize_with_pypdf(pdf, tmp)
+        linearized = False
+
+    after = before
+    if err is None:
+        after = tmp.stat().st_size
+        if after < before or linearized:
+            os.replace(tmp, pdf)
+        else:
+            after = before
+    tmp.unlink(missing_ok=True)
+    return {
+        "engine": engine,
+        "before_bytes": before,
+        "after_bytes": after,
+        "seconds": round(time.perf_counter() - t0, 3),
+        "linearized": linearized,
+        "error": err,
+    }
+
 def pdf_converter_status() -> str:
     """Human-friendly status string for health checks / debugging."""
-    ok, detail = detect_pdf_engine()
+    ok, detail = detect_pdf_engine(refresh=True)
     return f"{'OK' if ok else 'MISSING'} – {detail}"
@@ -0,0 +1,325 @@
+# docx_writer.py
+"""
+Save paths for python-docx documents built on top of a template.
+
+save_document() writes every part the merge never touches (headers, footers,
+fonts, theme, embedded logos…) by copying its compressed bytes straight out
+of the template zip; only document.xml, settings, relationships, content
+types and new media are serialised and compressed again.
+
+python-docx keeps the whole output as one lxml tree (plus every image blob)
+until Document.save(). StreamingDocxWriter instead:
+  • serialises new body blocks to a spool file as soon as they are produced
+    and drops them from the tree,
+  • writes each new image into the zip the moment it is flushed and frees its
+    blob,
+  • assembles word/document.xml as <template prefix> + <spooled blocks> +
+    <final sectPr/closing tags> on close().
+
+Peak memory is then the template plus the largest block, not the document.
+It uses the same template passthrough when closing.
+"""
+from __future__ import annotations
+import hashlib
+import os
+import shutil
+import struct
+import tempfile
+import zipfile
+from typing import Dict, Iterable, List, Optional, Set
+
+from lxml import etree
+from docx.opc.pkgwriter import _ContentTypesItem
+from docx.oxml.ns import qn
+from docx.parts.image import ImagePart
+
+_MARKER = b"<!--docx-writer-stream-->"
+_BLIP = qn("a:blip")
+_EMBED = qn("r:embed")
+_DOC_PR = qn("wp:docPr")
+
+# Regenerated entries get a fixed timestamp so identical inputs give identical bytes
+_FIXED_DATE = (1980, 1, 1, 0, 0, 0)
+_LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+_LOCAL_SIG = b"PK\x03\x04"
+
+
+# ===================== ZIP PASSTHROUGH =====================
+
+def _entry(name: str, compress_type: int = zipfile.ZIP_DEFLATED) -> zipfile.ZipInfo:
+    zi = zipfile.ZipInfo(name, _FIXED_DATE)
+    zi.compress_type = compress_type
+    zi.external_attr = 0o644 << 16
+    return zi
+
+
+def _copy_raw_member(src: zipfile.ZipFile, dst: zipfile.ZipFile, name: str) -> bool:
+    """
+    Append member `name` of src to dst without decompressing it.
+    Returns False (having written nothing) if the entry can't be copied as is.
+    """
+    info = src.getinfo(name)
+    if info.flag_bits & 0x1 or info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+        return False
+    src.fp.seek(info.header_offset)
+    header = src.fp.read(_LOCAL_HEADER.size)
+    if len(header) != _LOCAL_HEADER.size or header[:4] != _LOCAL_SIG:
+        return False
+    name_len, extra_len = _LOCAL_HEADER.unpack(header)[-2:]
+    data_offset = info.header_offset + _LOCAL_HEADER.size + name_len + extra_len
+
+    zi = zipfile.ZipInfo(info.filename, info.date_time)
+    zi.compress_type = info.compress_type
+    zi.external_attr = info.external_attr
+    zi.create_system = info.create_system
+    zi.flag_bits = info.flag_bits & 0x6   # keep the deflate level bits, drop the data descriptor
+    zi.CRC = info.CRC
+    zi.compress_size = info.compress_size
+    zi.file_size = info.file_size
+
+    dst.fp.seek(dst.start_dir)
+    zi.header_offset = dst.fp.tell()
+    dst.fp.write(zi.FileHeader())
+    src.fp.seek(data_offset)
+    left = info.compress_size
+    while left:
+        chunk = src.fp.read(min(left, 1024 * 1024))
+        if not chunk:
+            raise zipfile.BadZipFile(f"truncated member {name}")
+        dst.fp.write(chunk)
+        left -= len(chunk)
+    dst.filelist.append(zi)
+    dst.NameToInfo[zi.filename] = zi
+    dst.start_dir = dst.fp.tell()
+    dst._didModify = True
+    return True
+
+
+def _dirty_partnames(doc, extra: Iterable = ()) -> Set:
+    """Parts the merge rewrites: the main document and settings (updateFields)."""
+    return {doc.part.partname, doc.part._settings_part.partname, *extra}
+
+
+def _write_parts(zf: zipfile.ZipFile, doc, src: Optional[zipfile.ZipFile],
+                 dirty: Set, skip: Set[str] = frozenset()) -> Dict[str, int]:
+    """
+    Write every package part except the members in `skip` (already in zf).
+    Clean parts whose member exists in the template zip `src` are copied raw.
+    """
+    package = doc.part.package
+    parts = list(package.iter_parts())
+    src_names = set(src.namelist()) if src is not None else set()
+    copied = rewritten = 0
+
+    def put(member: str, clean: bool, blob_fn) -> None:
+        nonlocal copied, rewritten
+        if clean and member in src_names and _copy_raw_member(src, zf, member):
+            copied += 1
+            return
+        zf.writestr(_entry(member), blob_fn())
+        rewritten += 1
+
+    for part in parts:
+        part.before_marshal()
+        clean = part.partname not in dirty
+        member = part.partname.membername
+        if member not in skip:
+            put(member, clean, lambda: part.blob)
+        rels_member = part.partname.rels_uri.membername
+        if len(part.rels):
+            put(rels_member, clean, lambda: part.rels.xml)
+    zf.writestr(_entry("_rels/.rels"), package.rels.xml)
+    zf.writestr(_entry("[Content_Types].xml"), _ContentTypesItem.from_parts(parts).blob)
+    return {"copied_parts": copied, "rewritten_parts": rewritten}
+
+
+def save_document(doc, out_path: str, template_path: Optional[str] = None,
+                  dirty: Iterable = ()) -> Dict[str, int]:
+    """
+    Save `doc` to out_path. With template_path (the file doc was loaded from),
+    untouched parts are copied byte-for-byte; partnames in `dirty` are always
+    re-serialised in addition to document.xml and settings.xml.
+    Returns {"copied_parts": int, "rewritten_parts": int}.
+    """
+    src = zipfile.ZipFile(template_path) if template_path else None
+    try:
+        with zipfile.ZipFile(out_path, "w", zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+            return _write_parts(zf, doc, src, _dirty_partnames(doc, dirty))
+    finally:
+        if src is not None:
+            src.close()
+
+
+# ===================== STREAMING =====================
+
+
+class StreamingDocxWriter:
+    """
+    Usage:
+        writer = StreamingDocxWriter(doc, out_path)
+        writer.start()          # template content → prefix
+        ... add blocks to doc ...
+        writer.flush()          # after each block (or batch of blocks)
+        writer.close()          # remaining parts, rels, content types
+        (writer.abort()         # on failure: close and delete the partial file)
+    """
+
+    def __init__(self, doc, out_path: str, template_path: Optional[str] = None):
+        self.doc = doc
+        self.out_path = out_path
+        self.template_path = template_path
+        self.zf: Optional[zipfile.ZipFile] = None
+        self._src_names: Set[str] = set()
+        self._spool = tempfile.TemporaryFile()
+        self._prefix = b""
+        self._suffix = b""
+        self._sectPr = None
+        self._ns_decls: List[bytes] = []
+        self._written: Set[str] = set()        # member names already in the zip
+        self._by_sha1: Dict[str, str] = {}     # SHA1 of a flushed image → its rId
+        self._seen_rels = 0
+        self._max_id = 0                       # highest drawing id in the output so far
+        self.blocks_written = 0
+
+    # ---------- lifecycle ----------
+    def start(self) -> None:
+        body = self.doc.element.body
+        sect = body.find(qn("w:sectPr"))
+        self._sectPr = sect
+
+        self._track_ids(self.doc.element)
+        marker = etree.Comment(_MARKER[4:-3].decode())
+        if sect is not None:
+            sect.addprevious(marker)
+        else:
+            body.append(marker)
+        xml = etree.tostring(self.doc.element, encoding="UTF-8", xml_declaration=True, standalone=True)
+        body.remove(marker)
+        self._prefix, self._suffix = xml.split(_MARKER, 1)
+
+        # Template content now lives in the prefix; keep only the final sectPr
+        for el in list(body):
+            if el is not sect:
+                body.remove(el)
+
+        self._ns_decls = [
+            (f' xmlns:{p}="{uri}"' if p else f' xmlns="{uri}"').encode()
+            for p, uri in self.doc.element.nsmap.items()
+        ]
+        self.zf = zipfile.ZipFile(self.out_path, "w", zipfile.ZIP_DEFLATED, allowZip64=True)
+        if self.template_path:
+            with zipfile.ZipFile(self.template_path) as src:
+                self._src_names = set(src.namelist())
+
+    def flush(self) -> int:
+        """Serialise and release every block added since the last flush."""
+        body = self.doc.element.body
+        blocks = [el for el in body if el is not self._sectPr]
+        self._flush_media(blocks)
+        for el in blocks:
+            self._renumber_drawings(el)
+            self._spool.write(self._serialize(el))
+            body.remove(el)
+        self.blocks_written += len(blocks)
+        return len(blocks)
+
+    def close(self, fill: Optional[Dict[str, list]] = None) -> Dict[str, int]:
+        """
+        fill maps a placeholder comment left in the template (<!--name-->) to
+        the elements that replace it in the prefix, e.g. a server-built TOC.
+        """
+        self.flush()
+        for name, elements in (fill or {}).items():
+            marker = f"<!--{name}-->".encode()
+            self._prefix = self._prefix.replace(marker, b"".join(self._serialize(e) for e in elements), 1)
+        zf = self.zf
+        doc_part = self.doc.part
+
+        member = doc_part.partname.membername
+        with zf.open(_entry(member), "w", force_zip64=True) as dst:
+            dst.write(self._prefix)
+            self._spool.seek(0)
+            shutil.copyfileobj(self._spool, dst, 1024 * 1024)
+            dst.write(self._suffix)
+        self._spool.close()
+
+        src = zipfile.ZipFile(self.template_path) if self.template_path else None
+        try:
+            stats = _write_parts(zf, self.doc, src, _dirty_partnames(self.doc),
+                                 skip=self._written | {member})
+        finally:
+            if src is not None:
+                src.close()
+        zf.close()
+        return stats
+
+    def abort(self) -> None:
+        """Drop a half-written output (failed or cancelled merge)."""
+        self._spool.close()
+        if self.zf is not None:
+            self.zf.close()
+            self.zf = None
+            try:
+                os.remove(self.out_path)
+            except OSError:
+                pass
+
+    # ---------- helpers ----------
+    def _serialize(self, el) -> bytes:
+        xml = etree.tostring(el, encoding="UTF-8")
+        # lxml repeats every in-scope namespace on a detached subtree; the
+        # document root in the prefix already declares them identically.
+        end = xml.find(b">")
+        head = xml[:end]
+        for decl in self._ns_decls:
+            head = head.replace(decl, b"", 1)
+        return head + xml[end:]
+
+    def _flush_media(self, blocks: List) -> None:
+        """
+        Write images related since the last flush into the zip and free their
+        blobs. python-docx can't recognise a repeat of a flushed image (nothing
+        left to hash), so the writer keeps the SHA1s and points `blocks` at the
+        copy already written instead of storing it twice.
+        """
+        part = self.doc.part
+        rels = part.rels
+        if len(rels) == self._seen_rels:
+            return
+        for rId, rel in list(rels.items()):
+            if rel.is_external or not isinstance(rel.target_part, ImagePart):
+                continue
+            image = rel.target_part
+            member = image.partname.membername
+            # Template images are copied raw from the template zip on close()
+            if member in self._written or member in self._src_names:
+                continue
+            sha1 = hashlib.sha1(image.blob).hexdigest()
+            first = self._by_sha1.get(sha1)
+            if first is not None:
+                for el in blocks:
+                    for blip in el.iter(_BLIP):
+                        if blip.get(_EMBED) == rId:
+                            blip.set(_EMBED, first)
+                part.drop_rel(rId)
+                continue
+            self._by_sha1[sha1] = rId
+            # Images are already compressed; storing them saves CPU for nothing lost
+            self.zf.writestr(_entry(member, zipfile.ZIP_STORED), image.blob)
+            self._written.add(member)
+            image._blob = b""
+        self._seen_rels = len(rels)
+
+    def _track_ids(self, el) -> None:
+        ids = [int(v) for v in el.xpath(".//@id") if v.isdigit()]
+        if ids:
+            self._max_id = max(self._max_id, max(ids))
+
+    def _renumber_drawings(self, el) -> None:
+        """
+        Drawing ids (wp:docPr/@id) must be unique in the document, but python-docx
+        numbers new ones from the blocks still in the tree; number them here.
+        """
+        for doc_pr in el.iter(_DOC_PR):
+            self._max_id += 1
+            doc_pr.set("id", str(self._max_id))
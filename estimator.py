@@ -0,0 +1,218 @@
+# estimator.py
+"""
+Preflight cost estimate for a conversion job.
+
+A cheap pass over the Markdown (no python-docx involved) collects the things
+that drive render/merge/PDF cost — line count, headings, table cells, images
+and their bytes — and turns them into rough seconds / MB figures.
+
+The coefficients are deliberately simple; every finished job appends
+estimate-vs-actual to estimates.jsonl so they can be re-fitted over time.
+Overrides live under "ESTIMATOR" in config.json.
+"""
+from __future__ import annotations
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+BASE_DIR = Path(__file__).resolve().parent
+CONFIG_FILE = BASE_DIR / "config.json"
+CALIBRATION_LOG = BASE_DIR / "estimates.jsonl"
+
+# Seconds/MB per unit of each feature. PDF time is driven by the page guess.
+COEFFS: Dict[str, float] = {
+    "base_s": 0.5,
+    "per_line_s": 0.0004,
+    "per_table_cell_s": 0.002,
+    "per_image_s": 0.05,
+    "per_image_mb_s": 0.1,
+    "per_page_pdf_s": 0.15,
+    "lines_per_page": 45.0,
+    "images_per_page": 2.0,
+    "base_mb": 80.0,
+    "per_line_mb": 0.002,
+    "per_table_cell_mb": 0.01,
+    "image_mb_factor": 3.0,   # decoded copy + raw docx + merged docx
+}
+
+# Above BACKGROUND_* the job leaves the request thread; above REJECT_* it is refused.
+# Above streaming_memory_mb the merge writes its output incrementally; from
+# parallel_pdf_pages on, the PDF is rendered in Heading 1 chunks side by side.
+THRESHOLDS: Dict[str, float] = {
+    "streaming_memory_mb": 512.0,
+    "parallel_pdf_pages": 150.0,
+    "background_seconds": 30.0,
+    "background_memory_mb": 768.0,
+    "reject_seconds": 900.0,
+    "reject_memory_mb": 3072.0,
+}
+
+_IMG = re.compile(r"!\[(.*?)\]\((.*?)\)")
+_HEADING = re.compile(r"^#{1,6}\s+\S")
+_SEP_CELL = re.compile(r"^\s*:?-{3,}:?\s*$")
+
+_config_loaded = False
+_log_lock = threading.Lock()
+
+
+def _load_config() -> None:
+    global _config_loaded
+    if _config_loaded:
+        return
+    _config_loaded = True
+    if not CONFIG_FILE.exists():
+        return
+    try:
+        data = json.loads(CONFIG_FILE.read_text(encoding="utf-8")).get("ESTIMATOR", {})
+        for key, val in (data.get("coefficients") or {}).items():
+            if key in COEFFS:
+                COEFFS[key] = float(val)
+        for key, val in (data.get("thresholds") or {}).items():
+            if key in THRESHOLDS:
+                THRESHOLDS[key] = float(val)
+    except Exception as e:
+        print("⚠️ Failed to read ESTIMATOR settings from config.json:", e)
+
+
+def scan_markdown(sections: List[Tuple[Path, Optional[Path]]],
+                  image_index: Optional[dict] = None) -> Dict[str, int]:
+    """
+    Collect cost features from (markdown_path, base_dir) pairs.
+    Images are resolved the same way the renderer does so their bytes count.
+    """
+    from parser import _strip_hidden_sections, _resolve_image_path
+
+    feats = {
+        "sections": 0, "lines": 0, "chars": 0, "headings": 0,
+        "table_cells": 0, "images": 0, "image_bytes": 0, "missing_images": 0,
+    }
+    for md_path, base_dir in sections:
+        try:
+            text = _strip_hidden_sections(md_path.read_text(encoding="utf-8"))
+        except Exception:
+            continue
+        feats["sections"] += 1
+        feats["chars"] += len(text)
+        for line in text.splitlines():
+            feats["lines"] += 1
+            if _HEADING.match(line):
+                feats["headings"] += 1
+            elif "|" in line:
+                cells = line.strip().strip("|").split("|")
+                if not all(_SEP_CELL.match(c) for c in cells):
+                    feats["table_cells"] += len(cells)
+            for _alt, path_str in _IMG.findall(line):
+                feats["images"] += 1
+                p = _resolve_image_path(path_str, base_dir or md_path.parent, image_index, verbose=False)
+                try:
+                    feats["image_bytes"] += p.stat().st_size
+                except OSError:
+                    feats["missing_images"] += 1
+    return feats
+
+
+def estimate(feats: Dict[str, int]) -> Dict[str, float]:
+    """Rough wall-clock seconds (render+merge and PDF) and peak memory for a job."""
+    _load_config()
+    c = COEFFS
+    image_mb = feats.get("image_bytes", 0) / (1024 * 1024)
+    pages = max(1.0, feats.get("lines", 0) / c["lines_per_page"]
+                + feats.get("images", 0) / c["images_per_page"])
+    render_s = (c["base_s"]
+                + feats.get("lines", 0) * c["per_line_s"]
+                + feats.get("table_cells", 0) * c["per_table_cell_s"]
+                + feats.get("images", 0) * c["per_image_s"]
+                + image_mb * c["per_image_mb_s"])
+    pdf_s = pages * c["per_page_pdf_s"]
+    memory_mb = (c["base_mb"]
+                 + feats.get("lines", 0) * c["per_line_mb"]
+                 + feats.get("table_cells", 0) * c["per_table_cell_mb"]
+                 + image_mb * c["image_mb_factor"])
+    return {
+        "render_seconds": round(render_s, 2),
+        "pdf_seconds": round(pdf_s, 2),
+        "seconds": round(render_s + pdf_s, 2),
+        "memory_mb": round(memory_mb, 1),
+        "pages": round(pages),
+    }
+
+
+def decide(est: Dict[str, float]) -> Tuple[str, str]:
+    """
+    Returns (route, reason) where route is "inline", "background" or "reject".
+    """
+    _load_config()
+    t = THRESHOLDS
+    if est["seconds"] > t["reject_seconds"] or est["memory_mb"] > t["reject_memory_mb"]:
+        return "reject", (
+            f"This job is too large to convert here (estimated {est['seconds']:.0f}s, "
+            f"{est['memory_mb']:.0f} MB). Split it into smaller uploads."
+        )
+    if est["seconds"] > t["background_seconds"] or est["memory_mb"] > t["background_memory_mb"]:
+        return "background", f"Large job (estimated {est['seconds']:.0f}s) queued for background conversion."
+    return "inline", ""
+
+
+def record(job_id: str, feats: Dict[str, int], est: Dict[str, float],
+           actual: Dict[str, float]) -> None:
+    """Append estimate vs actual for later calibration of COEFFS."""
+    row = {"job": job_id, "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+           "features": feats, "estimate": est, "actual": actual}
+    print(f"📏 Estimate vs actual [{job_id}]: {est['seconds']}s / {actual.get('seconds')}s")
+    try:
+        with _log_lock, CALIBRATION_LOG.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(row) + "\n")
+    except Exception as e:
+        print("⚠️ Failed to write estimator calibration log:", e)
+
+
+def rss_mb() -> Optional[float]:
+    """Resident set size of this process right now, where the platform reports it."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except Exception:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except Exception:
+        return None
+
+
+def measure(fn: Callable[..., Any], *args, sample_s: float = 0.02, **kwargs) -> Tuple[Any, Dict[str, Any]]:
+    """
+    fn(*args, **kwargs) in this process while sampling its RSS. Returns
+    (result, memory) where memory holds rss_before_mb, rss_peak_mb and job_mb,
+    the peak on top of what the process held before (None where RSS can't be
+    read). Meant to run inside the render worker, so the figures are the job's.
+    """
+    before = rss_mb()
+    if before is None:
+        return fn(*args, **kwargs), {"rss_before_mb": None, "rss_peak_mb": None, "job_mb": None}
+    peak = [before]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(sample_s):
+            now = rss_mb()
+            if now is not None and now > peak[0]:
+                peak[0] = now
+
+    sampler = threading.Thread(target=sample, name="rss-sampler", daemon=True)
+    sampler.start()
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        done.set()
+        sampler.join()
+        now = rss_mb()
+        if now is not None and now > peak[0]:
+            peak[0] = now
+    return result, {"rss_before_mb": round(before, 1), "rss_peak_mb": round(peak[0], 1),
+                    "job_mb": round(peak[0] - before, 1)}
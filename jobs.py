@@ -0,0 +1,537 @@
+# jobs.py
+"""
+Plumbing shared by the conversion routes:
+  • Limiter / Overloaded → bounded concurrency with a queue-depth cap
+  • Workspace            → per-job upload/output directories
+  • BackgroundRunner     → off-request execution for jobs too big to run inline
+  • ProgressBoard        → stage events for the SSE endpoint, in-flight dedupe, cancellation
+  • watch_disconnect     → notices a client that hung up while its request is still working
+"""
+from __future__ import annotations
+import json
+import math
+import secrets
+import select
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional
+
+
+# ===================== ADMISSION CONTROL =====================
+
+class Overloaded(Exception):
+    """Raised when a limiter's queue is full; carries a Retry-After hint (seconds)."""
+
+    def __init__(self, stage: str, retry_after: int):
+        super().__init__(f"{stage} queue is full")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+class Limiter:
+    """
+    At most `slots` callers run at once and at most `max_waiting` more may queue.
+    Anyone beyond that (or anyone who waits longer than `wait_timeout_s`) gets
+    Overloaded instead of piling onto an already saturated box.
+    """
+
+    def __init__(self, name: str, slots: int, max_waiting: int, wait_timeout_s: float = 120.0):
+        self.name = name
+        self.slots = max(1, int(slots))
+        self.max_waiting = max(0, int(max_waiting))
+        self.wait_timeout_s = wait_timeout_s
+        self._sem = threading.BoundedSemaphore(self.slots)
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiting = 0
+        self._avg_s = 5.0  # EWMA of time spent holding a slot
+
+    def retry_after(self) -> int:
+        with self._lock:
+            return self._retry_after_locked()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"active": self._active, "waiting": self._waiting,
+                    "slots": self.slots, "max_waiting": self.max_waiting}
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        with self._lock:
+            if self._active >= self.slots and self._waiting >= self.max_waiting:
+                raise Overloaded(self.name, self._retry_after_locked())
+            self._waiting += 1
+        try:
+            got = self._sem.acquire(timeout=self.wait_timeout_s)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        if not got:
+            raise Overloaded(self.name, self.retry_after())
+
+        with self._lock:
+            self._active += 1
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            took = time.perf_counter() - t0
+            with self._lock:
+                self._active -= 1
+                self._avg_s = 0.8 * self._avg_s + 0.2 * took
+            self._sem.release()
+
+    @contextmanager
+    def extra_slots(self, wanted: int) -> Iterator[int]:
+        """
+        For a slot holder that can use more in parallel: up to `wanted` further
+        slots, only ones free right now and only when nobody is queued; yields
+        how many it got (possibly 0).
+        """
+        got = 0
+        with self._lock:
+            if self._waiting == 0:
+                while got < wanted and self._sem.acquire(blocking=False):
+                    got += 1
+            self._active += got
+        try:
+            yield got
+        finally:
+            with self._lock:
+                self._active -= got
+            for _ in range(got):
+                self._sem.release()
+
+    def _retry_after_locked(self) -> int:
+        backlog = self._waiting + 1
+        return max(1, min(120, math.ceil(self._avg_s * backlog / self.slots)))
+
+
+# ===================== WORKSPACES =====================
+
+class Workspace:
+    """
+    Private directories for one job: <upload_root>/<id>/ and <output_root>/<id>/.
+    The id mixes the second-resolution timestamp with random bits, so two jobs
+    started in the same second never share file names.
+    """
+
+    def __init__(self, upload_root: Path, output_root: Path):
+        self.ts = time.strftime("%Y%m%d-%H%M%S")
+        self.id = f"{self.ts}-{secrets.token_hex(4)}"
+        self.uploads = upload_root / self.id
+        self.outputs = output_root / self.id
+        self.published: list = []   # storage keys of files copied out of the workspace
+        self.uploads.mkdir(parents=True, exist_ok=False)
+        self.outputs.mkdir(parents=True, exist_ok=False)
+
+    def output_name(self, path: Path) -> str:
+        """Path of an output relative to the outputs root (used in download URLs)."""
+        return f"{self.id}/{path.name}"
+
+
+# ===================== BACKGROUND JOBS =====================
+
+class BackgroundRunner:
+    """
+    Runs expensive jobs on a small fixed pool instead of the request thread.
+    Job state (queued → running → done | failed) is kept in memory and, when
+    `store` (a storage.Storage) is given, mirrored to outputs/<job_id>/job.json
+    there so that any worker process — or any node sharing the store — can
+    answer for it.
+    """
+
+    def __init__(self, workers: int = 1, max_queued: int = 4, keep_s: float = 6 * 3600,
+                 store=None):
+        self.workers = max(1, int(workers))
+        self.max_queued = max(0, int(max_queued))
+        self.keep_s = keep_s
+        self.store = store
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bg-job")
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+
+    def submit(self, job_id: str, fn: Callable[..., Any], *args, **kwargs) -> None:
+        with self._lock:
+            self._expire_locked()
+            queued = sum(1 for j in self._jobs.values() if j["state"] == "queued")
+            if queued >= self.max_queued:
+                raise Overloaded("background", 60)
+            self._jobs[job_id] = {"state": "queued", "submitted": time.time(),
+                                  "result": None, "error": None}
+            self._persist_locked(job_id)
+        self._pool.submit(self._run, job_id, fn, args, kwargs)
+
+    def _run(self, job_id: str, fn: Callable[..., Any], args, kwargs) -> None:
+        self._set(job_id, state="running", started=time.time())
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            print(f"Background job {job_id} failed:", e)
+            self._set(job_id, state="failed", error=str(e) or e.__class__.__name__, finished=time.time())
+            return
+        self._set(job_id, state="done", result=result, finished=time.time())
+
+    def _set(self, job_id: str, **fields) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+                self._persist_locked(job_id)
+
+    def _state_key(self, job_id: str) -> Optional[str]:
+        if self.store is None or not job_id or "/" in job_id or "\\" in job_id or job_id.startswith("."):
+            return None
+        return f"outputs/{job_id}/job.json"
+
+    def _persist_locked(self, job_id: str) -> None:
+        key = self._state_key(job_id)
+        if key is None:
+            return
+        try:
+            self.store.put_bytes(key, json.dumps(self._jobs[job_id], default=str).encode("utf-8"))
+        except Exception as e:
+            print(f"Could not persist state of job {job_id}:", e)
+
+    def _expire_locked(self) -> None:
+        cutoff = time.time() - self.keep_s
+        for jid in [j for j, v in self._jobs.items() if v.get("finished", time.time()) < cutoff]:
+            del self._jobs[jid]
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        # Submitted by another worker process or node?
+        key = self._state_key(job_id)
+        if key is not None:
+            try:
+                data = self.store.get_bytes(key)
+                return json.loads(data) if data is not None else None
+            except Exception:
+                return None
+        return None
+
+
+# ===================== PROGRESS =====================
+
+class _Channel:
+    def __init__(self):
+        self.job_id: Optional[str] = None     # None until /convert binds it (subscriber came first)
+        self.events: list = []
+        self.counts: Dict[str, Any] = {}
+        self.finished = False
+        self.outcome: Dict[str, Any] = {}
+        self.touched = time.time()
+        self.dedupe_key: Optional[str] = None
+        self.watchers = 0                     # requests still waiting for this job's result
+        self.cancel = threading.Event()      # handed down to render, merge and conversion
+        self.cond = threading.Condition()
+
+
+class ProgressBoard:
+    """
+    Stage transitions of running jobs ("rendering", "merged", "converting" …
+    plus counts such as sections and inserted images), replayed to SSE
+    subscribers. A channel is reachable by the job id and by an alias the
+    browser picks before uploading, so it can subscribe while its POST is
+    still in flight.
+
+    Jobs also register a dedupe key (hash of inputs + options): an identical
+    submission made while the first is running gets the first job's id back
+    instead of starting a second render.
+
+    Each job carries a cancel event. Every submission folded into it counts as
+    a watcher; release() (explicit cancel, client gone) drops one, and the
+    event is set once nobody is left waiting for the result.
+
+    With `store`, the latest snapshot of each channel is mirrored to
+    progress/<key>.json so a subscriber on another worker process or node
+    can follow by polling, and cancel() of a job running elsewhere leaves a
+    progress/<key>.cancel flag that the owning process polls for. Dedupe keys
+    are per process: an identical job on another worker simply runs again.
+    """
+
+    def __init__(self, keep_s: float = 3600, max_channels: int = 1000, store=None,
+                 cancel_poll_s: float = 1.0):
+        self.keep_s = keep_s
+        self.max_channels = max_channels
+        self.store = store
+        self.cancel_poll_s = cancel_poll_s
+        self._lock = threading.Lock()
+        self._channels: Dict[str, _Channel] = {}
+        self._inflight: Dict[str, str] = {}    # dedupe key → job id
+        self._cancel_watch: Optional[threading.Thread] = None
+
+    def open(self, job_id: str, alias: Optional[str] = None, dedupe_key: Optional[str] = None) -> Optional[str]:
+        """
+        Start the channel of a new job. Returns the id of an identical job still
+        in flight (the alias then follows that job) or None when job_id should run.
+        """
+        with self._lock:
+            self._expire_locked()
+            running = self._inflight.get(dedupe_key) if dedupe_key else None
+            if running is not None and running in self._channels:
+                self._channels[running].watchers += 1
+                if alias:
+                    self._adopt_locked(alias, self._channels[running])
+                return running
+            ch = self._channels.get(alias) if alias else None
+            if ch is None or ch.job_id is not None:
+                ch = _Channel()
+            ch.job_id = job_id
+            ch.watchers = 1
+            self._channels[job_id] = ch
+            if alias:
+                self._channels[alias] = ch
+            if dedupe_key:
+                self._inflight[dedupe_key] = job_id
+            ch.dedupe_key = dedupe_key
+            self._watch_cancels_locked()
+        return None
+
+    def _adopt_locked(self, alias: str, ch: _Channel) -> None:
+        # Wake a subscriber already waiting on a placeholder under this alias; follow() re-resolves it
+        old = self._channels.get(alias)
+        self._channels[alias] = ch
+        if old is not None and old is not ch:
+            with old.cond:
+                old.cond.notify_all()
+
+    def emit(self, job_id: str, stage: str, **counts) -> None:
+        with self._lock:
+            ch = self._channels.get(job_id)
+        if ch is None or ch.finished:
+            return
+        with ch.cond:
+            ch.counts.update(counts)
+            event = {"seq": len(ch.events) + 1, "job_id": ch.job_id, "stage": stage,
+                     "state": "running", "counts": dict(ch.counts), "t": round(time.time(), 3)}
+            ch.events.append(event)
+            ch.touched = time.time()
+            ch.cond.notify_all()
+        self._persist(ch, event)
+
+    def finish(self, job_id: str, state: str, result: Any = None, error: Optional[str] = None) -> None:
+        """state is "done", "failed" or "cancelled"; `result` is handed to anyone waiting in wait()."""
+        with self._lock:
+            ch = self._channels.get(job_id)
+            if ch is None or ch.finished:
+                return
+            if ch.dedupe_key and self._inflight.get(ch.dedupe_key) == job_id:
+                del self._inflight[ch.dedupe_key]
+        with ch.cond:
+            event = {"seq": len(ch.events) + 1, "job_id": ch.job_id, "stage": state,
+                     "state": state, "counts": dict(ch.counts), "t": round(time.time(), 3)}
+            if error:
+                event["error"] = error
+            ch.events.append(event)
+            ch.outcome = {"state": state, "result": result, "error": error}
+            ch.finished = True
+            ch.touched = time.time()
+            ch.cond.notify_all()
+        self._persist(ch, event)
+        if self.store is not None:
+            for key in self._keys_of(ch):
+                self._clear_cancel_flag(key)
+
+    def cancel_event(self, job_id: str) -> Optional[threading.Event]:
+        with self._lock:
+            ch = self._channels.get(job_id)
+        return ch.cancel if ch is not None else None
+
+    def release(self, key: str, reason: str) -> bool:
+        """One watcher of the job (by id or alias) gave up; True if that cancelled it."""
+        with self._lock:
+            ch = self._channels.get(key)
+            if ch is None or ch.job_id is None or ch.finished or ch.cancel.is_set():
+                return False
+            ch.watchers -= 1
+            if ch.watchers > 0:
+                return False
+            ch.cancel.set()
+            job_id = ch.job_id
+        print(f"🛑 Cancelling job {job_id}: {reason}")
+        self.emit(job_id, "cancelling", reason=reason)
+        return True
+
+    def cancel(self, key: str, reason: str) -> bool:
+        """
+        Explicit cancel by job id or alias. A job this process doesn't run but
+        whose mirrored snapshot says it is running gets a cancel flag instead;
+        True if the job was cancelled or the flag was left.
+        """
+        with self._lock:
+            ch = self._channels.get(key)
+            here = ch is not None and ch.job_id is not None
+        if here or self.store is None:
+            return self.release(key, reason)
+        snap = self._load(key)
+        if not snap or snap.get("state") != "running":
+            return False
+        try:
+            self.store.put_bytes(f"progress/{key}.cancel", reason.encode("utf-8"))
+        except Exception as e:
+            print(f"Could not flag {key} for cancelling:", e)
+            return False
+        print(f"🛑 Job behind {key} runs on another worker; cancel flag left")
+        return True
+
+    def _watch_cancels_locked(self) -> None:
+        if self.store is None or (self._cancel_watch is not None and self._cancel_watch.is_alive()):
+            return
+        self._cancel_watch = threading.Thread(target=self._poll_cancel_flags, name="cancel-watch", daemon=True)
+        self._cancel_watch.start()
+
+    def _poll_cancel_flags(self) -> None:
+        """While this process runs jobs, turn progress/<key>.cancel flags into release()."""
+        while True:
+            time.sleep(self.cancel_poll_s)
+            with self._lock:
+                keys = [k for k, ch in self._channels.items()
+                        if ch.job_id is not None and not ch.finished and not ch.cancel.is_set()]
+                if not keys:
+                    self._cancel_watch = None
+                    return
+            for key in keys:
+                try:
+                    reason = self.store.get_bytes(f"progress/{key}.cancel")
+                except Exception:
+                    continue
+                if reason is not None:
+                    # One flag = one watcher giving up, as with a local cancel
+                    self._clear_cancel_flag(key)
+                    self.release(key, reason.decode("utf-8", "replace") or "cancelled")
+
+    def _clear_cancel_flag(self, key: str) -> None:
+        try:
+            self.store.delete(f"progress/{key}.cancel")
+        except Exception:
+            pass
+
+    def wait(self, job_id: str, timeout_s: float) -> Optional[Dict[str, Any]]:
+        """Block until the job finishes → {"state", "result", "error"}; None on timeout."""
+        with self._lock:
+            ch = self._channels.get(job_id)
+        if ch is None:
+            return None
+        with ch.cond:
+            if not ch.cond.wait_for(lambda: ch.finished, timeout=timeout_s):
+                return None
+            return dict(ch.outcome)
+
+    def follow(self, key: str, after: int = 0, timeout_s: float = 1800,
+               heartbeat_s: float = 15.0) -> Iterator[Optional[Dict[str, Any]]]:
+        """Events after seq `after` as they happen; None marks a heartbeat. Ends when the job does."""
+        ch = self._subscribe(key)
+        if ch is None:
+            return
+        deadline = time.time() + timeout_s
+        last_beat = time.time()
+        while time.time() < deadline:
+            with self._lock:
+                current = self._channels.get(key)
+            if current is not None and current is not ch:
+                # The alias now points at an identical job that was already running
+                ch, after = current, 0
+            with ch.cond:
+                if not ch.finished and not any(e["seq"] > after for e in ch.events):
+                    ch.cond.wait(timeout=1.0)
+                pending = [e for e in ch.events if e["seq"] > after]
+                done = ch.finished
+                unbound = ch.job_id is None
+            if unbound and not pending and self.store is not None:
+                # Maybe the job runs on another process: follow its mirrored snapshot
+                snap = self._load(key)
+                if snap and snap["seq"] > after:
+                    pending, done = [snap], snap["state"] != "running"
+            for event in pending:
+                after = event["seq"]
+                yield event
+            if done:
+                return
+            if time.time() - last_beat >= heartbeat_s:
+                last_beat = time.time()
+                yield None
+
+    def _subscribe(self, key: str) -> Optional[_Channel]:
+        with self._lock:
+            ch = self._channels.get(key)
+            if ch is None:
+                self._expire_locked()
+                if len(self._channels) >= self.max_channels:
+                    return None
+                ch = self._channels[key] = _Channel()
+            ch.touched = time.time()
+            return ch
+
+    def _expire_locked(self) -> None:
+        now = time.time()
+        for key in [k for k, ch in self._channels.items()
+                    if (ch.finished or ch.job_id is None) and ch.touched < now - self.keep_s]:
+            del self._channels[key]
+
+    def _persist(self, ch: _Channel, event: Dict[str, Any]) -> None:
+        if self.store is None:
+            return
+        data = json.dumps(event).encode("utf-8")
+        for key in self._keys_of(ch):
+            try:
+                self.store.put_bytes(f"progress/{key}.json", data)
+            except Exception as e:
+                print(f"Could not persist progress of {key}:", e)
+
+    def _keys_of(self, ch: _Channel) -> list:
+        with self._lock:
+            return [k for k, c in self._channels.items() if c is ch]
+
+    def _load(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            data = self.store.get_bytes(f"progress/{key}.json")
+            return json.loads(data) if data is not None else None
+        except Exception:
+            return None
+
+
+# ===================== CLIENT DISCONNECTS =====================
+
+@contextmanager
+def watch_disconnect(environ: dict, on_disconnect: Callable[[], Any], interval_s: float = 1.0) -> Iterator[None]:
+    """
+    While the block runs, check every `interval_s` whether the client closed its
+    connection and call on_disconnect() once if it did. Only used after the
+    request body has been read, so a readable socket that yields no bytes is
+    the peer's FIN. Needs the raw socket in the WSGI environ (Werkzeug's
+    server and gunicorn provide it); otherwise, or behind TLS, this is a no-op.
+    """
+    sock = environ.get("werkzeug.socket") or environ.get("gunicorn.socket")
+    if not isinstance(sock, socket.socket) or hasattr(sock, "getpeercert"):
+        yield
+        return
+    done = threading.Event()
+
+    def watch():
+        while not done.wait(interval_s):
+            try:
+                readable, _, _ = select.select([sock], [], [], 0)
+                if not readable:
+                    continue
+                if sock.recv(1, socket.MSG_PEEK) == b"":
+                    on_disconnect()
+                return   # gone, or a pipelined request is waiting: nothing more to learn
+            except ConnectionError:
+                on_disconnect()
+                return
+            except (OSError, ValueError):
+                return
+
+    threading.Thread(target=watch, name="disconnect-watch", daemon=True).start()
+    try:
+        yield
+    finally:
+        done.set()
@@ -1,20 +1,30 @@
 # merge.py
 from __future__ import annotations
-import os, re
+import copy, hashlib, os, re, threading
+from collections import OrderedDict
 from io import BytesIO
 from pathlib import Path
 from typing import Dict, Optional, List, Tuple, Union
 
 from docx import Document
+from docx.enum.style import WD_STYLE_TYPE
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.image.exceptions import UnrecognizedImageError
 from docx.oxml import OxmlElement, parse_xml
 from docx.oxml.ns import qn, nsdecls
 from docx.shared import Cm, Emu
+from docx.styles import BabelFish
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
 from docx.table import _Cell, Table
+from docx.text.hyperlink import Hyperlink
+from docx.text.paragraph import Paragraph
+from docx.text.run import Run
 
 # Markdown → DOCX bridge
-from parser import md_file_to_docx
+from parser import check_cancel, md_file_to_docx
+from docx_writer import StreamingDocxWriter, save_document
+from toc import TOC_PLACEHOLDER, ServerToc
+from compact import Compactor
 
 # ===================== STYLE MAP (match your template) =====================
 
@@ -65,10 +75,46 @@ SUPPORTED_IMG_MIMES = {
     "image/png","image/jpeg","image/jpg","image/gif","image/bmp","image/tiff",
 }
 
-try:
-    from PIL import Image  # optional
-except Exception:
-    Image = None
+# Pillow is optional; imported on first use so scripts that never touch images skip it
+_PIL_IMAGE = None
+
+def _pil_image():
+    global _PIL_IMAGE
+    if _PIL_IMAGE is None:
+        try:
+            from PIL import Image
+            _PIL_IMAGE = Image
+        except Exception:
+            _PIL_IMAGE = False
+    return _PIL_IMAGE or None
+
+# ===================== TEMPLATE CACHE =====================
+
+# Parsed templates keyed by content hash. Every upload gets a fresh file name,
+# so the path is useless as a key; the bytes are cheap to hash next to a parse.
+_TEMPLATE_CACHE: "OrderedDict[str, Document]" = OrderedDict()
+_TEMPLATE_CACHE_MAX = 8
+_TEMPLATE_LOCK = threading.Lock()
+
+def _load_template(template_path: str) -> Document:
+    """Return a private, mutable copy of the template (deep-copied from cache)."""
+    data = Path(template_path).read_bytes()
+    key = hashlib.sha1(data).hexdigest()
+    with _TEMPLATE_LOCK:
+        cached = _TEMPLATE_CACHE.get(key)
+        if cached is not None:
+            _TEMPLATE_CACHE.move_to_end(key)
+            return copy.deepcopy(cached)
+    parsed = Document(BytesIO(data))
+    with _TEMPLATE_LOCK:
+        _TEMPLATE_CACHE[key] = parsed
+        while len(_TEMPLATE_CACHE) > _TEMPLATE_CACHE_MAX:
+            _TEMPLATE_CACHE.popitem(last=False)
+    return copy.deepcopy(parsed)
+
+def preload_template(template_path: str) -> None:
+    """Parse a template into the cache ahead of the first request."""
+    _load_template(template_path)
 
 # ===================== SETTINGS / UTILITIES =====================
 
@@ -122,10 +168,69 @@ def _looks_like_procedure(raw_para) -> bool:
         return True
     return False
 
+class _StyleIndex:
+    """
+    A document's styles, indexed in one pass. python-docx walks every style
+    (and, for paragraphs without pStyle, looks for the default) on each
+    lookup, which made style resolution most of the merge time on templates
+    with a few hundred styles.
+    """
+
+    def __init__(self, styles):
+        self.ids: Dict[str, Tuple[str, object]] = {}   # internal name → (styleId, type)
+        self.names: Dict[str, Optional[str]] = {}     # paragraph styleId → UI name
+        self.default_id: Optional[str] = None
+        for st in styles.element.style_lst:
+            if st.name_val is not None:
+                self.ids.setdefault(st.name_val, (st.styleId, st.type))
+            if st.type == WD_STYLE_TYPE.PARAGRAPH:
+                self.names.setdefault(st.styleId, BabelFish.internal2ui(st.name_val) if st.name_val else None)
+                if st.default:
+                    self.default_id = st.styleId    # python-docx takes the last default
+
+    def __contains__(self, name: str) -> bool:
+        return BabelFish.ui2internal(name) in self.ids
+
+    def name_of(self, para) -> str:
+        """Same as para.style.name (or "")."""
+        sid = para._p.style
+        if sid is None or sid not in self.names:
+            sid = self.default_id
+        return self.names.get(sid) or ""
+
+    def apply(self, para, name: str) -> bool:
+        """Give para the named paragraph style; False when python-docx should handle it."""
+        hit = self.ids.get(BabelFish.ui2internal(name))
+        if hit is None or hit[1] != WD_STYLE_TYPE.PARAGRAPH:
+            return False
+        para._p.style = None if hit[0] == self.default_id else hit[0]
+        return True
+
+
+def _styles(doc: Document) -> _StyleIndex:
+    # Kept on the document part (Document objects are rebuilt on every
+    # part.document access); styles aren't added while a merge runs
+    part = doc.part
+    index = part.__dict__.get("_style_index")
+    if index is None:
+        index = part.__dict__["_style_index"] = _StyleIndex(part.styles)
+    return index
+
+
+def _set_style(doc: Document, para, name: str) -> None:
+    if _styles(doc).apply(para, name):
+        return
+    try:
+        para.style = doc.styles[name]
+    except Exception:
+        para.style = name
+
+
 def _first_existing_style(doc: Document, names: List[str]) -> Optional[str]:
+    styles = _styles(doc)
     for name in names:
         try:
-            if name in doc.styles:  # python-docx implements membership check
+            if name in styles:
                 return name
         except Exception:
             pass
@@ -136,8 +241,9 @@ def _choose_style_for_paragraph(tpl: Document, raw_para) -> str:
     Decide template style for this paragraph.
     Critical rule: if the source is a bullet/list, NEVER turn it into Step 1.
     """
-    raw_name = (raw_para.style.name or "").strip()
+    raw_name = _styles(raw_para.part.document).name_of(raw_para).strip()
     text     = (raw_para.text or "").strip()
+    styles   = _styles(tpl)
 
     # --- 1) If it’s a bullet/numbered list, choose a bullet style with fallbacks
     if raw_name in ("List Bullet", "List Bullet 2", "Bullet Point 1", "Bullet Point 2") or _get_ilvl(raw_para) is not None:
@@ -149,16 +255,16 @@ def _choose_style_for_paragraph(tpl: Document, raw_para) -> str:
             return bullet_choice
 
     # --- 2) Direct style mapping if present and exists
-    if raw_name in STYLE_MAP and STYLE_MAP[raw_name] in tpl.styles:
+    if raw_name in STYLE_MAP and STYLE_MAP[raw_name] in styles:
         return STYLE_MAP[raw_name]
 
     # --- 3) Numeric heading detection like "2.", "2.1" …
     tag = _looks_like_heading(text)
-    if tag and LEVEL_TAG_TO_STYLE.get(tag) in tpl.styles:
+    if tag and LEVEL_TAG_TO_STYLE.get(tag) in styles:
         return LEVEL_TAG_TO_STYLE[tag]
 
     # --- 4) Otherwise, plain paragraphs become Step 1 (procedure)
-    if text and STEP_STYLE_NAME in tpl.styles:
+    if text and STEP_STYLE_NAME in styles:
         return STEP_STYLE_NAME
 
     # --- 5) Fallback to body
@@ -208,6 +314,7 @@ def _extract_inline_images_from_run(raw_doc: Document, run) -> List[Tuple[bytes,
     return results
 
 def _maybe_convert_with_pillow(blob: bytes, _mime: str) -> Optional[bytes]:
+    Image = _pil_image()
     if Image is None:
         return None
     try:
@@ -222,6 +329,7 @@ def _compute_target_width_emu(cx: Optional[int], blob: bytes) -> Emu:
     if cx:
         width_cm = cx / 360000.0
         return Emu(Cm(SMALL_WIDTH_CM if width_cm < SMALL_SOURCE_THRESHOLD_CM else NORMAL_WIDTH_CM))
+    Image = _pil_image()
     if Image is not None:
         try:
             with Image.open(BytesIO(blob)) as im:
@@ -326,23 +434,54 @@ def _insert_images_after_paragraph(container: Union[Document, _Cell],
 
 # ===================== COPY HELPERS =====================
 
+def _copy_run_format(dst_run, src_run) -> None:
+    # Only explicit values: assigning None would still leave an empty <w:rPr/>
+    for attr in ("bold", "italic", "underline"):
+        val = getattr(src_run, attr)
+        if val is not None:
+            setattr(dst_run, attr, val)
+    if src_run.font.name:   # inline `code`
+        dst_run.font.name = src_run.font.name
+
+def _copy_hyperlink(dst_para, src_link: Hyperlink) -> None:
+    link = OxmlElement('w:hyperlink')
+    if src_link.address:
+        link.set(qn('r:id'), dst_para.part.relate_to(src_link.address, RT.HYPERLINK, is_external=True))
+    if src_link.fragment:
+        link.set(qn('w:anchor'), src_link.fragment)
+    link.set(qn('w:history'), '1')
+    dst_para._p.append(link)
+
+    try:
+        link_style = dst_para.part.document.styles['Hyperlink']
+    except KeyError:
+        link_style = None
+    for r in src_link.runs:
+        nr = Run(OxmlElement('w:r'), dst_para)
+        link.append(nr._r)
+        nr.text = r.text
+        _copy_run_format(nr, r)
+        if link_style is not None:
+            nr.style = link_style
+        else:
+            nr.font.color.rgb = r.font.color.rgb if r.font.color.type else None
+
 def _copy_runs(dst_para, src_para) -> None:
-    if src_para.runs:
-        for r in src_para.runs:
-            nr = dst_para.add_run(r.text)
-            nr.bold = r.bold
-            nr.italic = r.italic
-            nr.underline = r.underline
-    else:
+    content = list(src_para.iter_inner_content())
+    if not content:
         dst_para.add_run("")
+        return
+    for item in content:
+        if isinstance(item, Hyperlink):
+            _copy_hyperlink(dst_para, item)
+        else:
+            nr = dst_para.add_run(item.text)
+            _copy_run_format(nr, item)
 
 def _copy_paragraph(dst_doc: Document, src_para, style_name: str,
                     raw_doc: Document, figure_counter: List[int]) -> Tuple[int, int]:
     p = dst_doc.add_paragraph()
-    try:
-        p.style = dst_doc.styles[style_name]
-    except Exception:
-        p.style = style_name
+    _set_style(dst_doc, p, style_name)
     _copy_runs(p, src_para)
 
     inserted = skipped = 0
@@ -364,10 +503,7 @@ def _copy_cell(dst_cell: _Cell, src_cell: _Cell, tpl: Document,
     for p in src_cell.paragraphs:
         style_name = _choose_style_for_paragraph(tpl, p)
         new_p = dst_cell.add_paragraph()
-        try:
-            new_p.style = tpl.styles[style_name]
-        except Exception:
-            new_p.style = style_name
+        _set_style(tpl, new_p, style_name)
         _copy_runs(new_p, p)
 
         for run in p.runs:
@@ -399,50 +535,108 @@ def _copy_table(dst_doc: Document, src_table: Table, tpl: Document,
 
 # ===================== PUBLIC API =====================
 
-def merge_into_template(template_path: str, raw_docx_path: str, out_path: str) -> Dict[str, int]:
+def _new_blocks(body, mark: int) -> list:
+    """Body children appended since len(body) was `mark` (the final sectPr excluded)."""
+    return [el for el in body[mark:] if el.tag != qn('w:sectPr')]
+
+def merge_into_template(template_path: str, raw_docx_path: Union[str, Document, List], out_path: str,
+                        streaming: bool = False, toc_mode: str = "field",
+                        compact: bool = True, cancel: Optional[threading.Event] = None) -> Dict[str, int]:
     """
     Merge raw_docx into template and save to out_path.
     Returns a dict with inserted/skipped image counts:
       { "inserted_images": int, "skipped_images": int }
+    plus, with compact=True, "compaction": element counts before/after the
+    compaction pass (see compact.Compactor). compact=False copies blocks
+    exactly as rendered.
+
+    raw_docx_path may also be an open Document, or a list of paths/Documents
+    merged one after another (watch mode keeps rendered sections in memory
+    and passes them this way). Documents passed in are only read.
+
+    streaming=True writes each block to out_path as soon as it is copied and
+    releases it (see docx_writer.StreamingDocxWriter), so peak memory follows
+    the largest block instead of the whole document.
+
+    Either way, template parts the merge doesn't touch are copied into the
+    output zip byte-for-byte rather than re-serialised.
+
+    toc_mode="field" keeps the template's TOC field and asks Word to update
+    fields on open; "server" writes the TOC entries here (see toc.ServerToc)
+    and leaves updateFields off, so opening is fast and PDFs need no refresh.
+
+    Setting `cancel` stops the merge with parser.Cancelled before the next block.
     """
     if not os.path.exists(template_path):
         raise FileNotFoundError(f"Template not found: {template_path}")
-    if not os.path.exists(raw_docx_path):
-        raise FileNotFoundError(f"Raw DOCX not found: {raw_docx_path}")
+    sources = list(raw_docx_path) if isinstance(raw_docx_path, (list, tuple)) else [raw_docx_path]
+    for src in sources:
+        if isinstance(src, (str, os.PathLike)) and not os.path.exists(src):
+            raise FileNotFoundError(f"Raw DOCX not found: {src}")
 
-    tpl = Document(template_path)
-    raw = Document(raw_docx_path)
+    tpl = _load_template(template_path)
 
     _append_page_break(tpl)
 
+    toc = ServerToc(tpl) if toc_mode == "server" else None
+    compactor = Compactor(tpl.styles.element) if compact else None
+    body = tpl.element.body
+
+    writer = None
+    if streaming:
+        writer = StreamingDocxWriter(tpl, out_path, template_path=template_path)
+        writer.start()
+
     figure_counter = [0]
     skipped_images = 0
     inserted_total = 0
 
-    for element in raw.element.body:
-        if element.tag == qn('w:p'):
-            para = next((p for p in raw.paragraphs if p._p is element), None)
-            if para is None:
-                continue
-            try:
-                if para.paragraph_format.page_break_before:
-                    _append_page_break(tpl)
-            except Exception:
-                pass
-
-            style_name = _choose_style_for_paragraph(tpl, para)
-            i, skipped = _copy_paragraph(tpl, para, style_name, raw, figure_counter)
-            inserted_total += i
-            skipped_images += skipped
-
-        elif element.tag == qn('w:tbl'):
-            src_table = next((t for t in raw.tables if t._tbl is element), None)
-            if src_table is not None:
-                i, skipped = _copy_table(tpl, src_table, tpl, raw, figure_counter)
-                inserted_total += i
-                skipped_images += skipped
-
-    _set_update_fields_on_open(tpl)
+    try:
+        for src in sources:
+            # Opened one at a time, so a list of paths never holds every source in memory
+            owned = isinstance(src, (str, os.PathLike))
+            raw = Document(src) if owned else src
+            raw_body = raw.element.body
+            for element in list(raw_body):
+                check_cancel(cancel)
+                mark = len(body) - 1
+                if element.tag == qn('w:p'):
+                    para = Paragraph(element, raw._body)
+                    try:
+                        if para.paragraph_format.page_break_before:
+                            _append_page_break(tpl)
+                    except Exception:
+                        pass
+
+                    style_name = _choose_style_for_paragraph(tpl, para)
+                    i, skipped = _copy_paragraph(tpl, para, style_name, raw, figure_counter)
+                    inserted_total += i
+                    skipped_images += skipped
+
+                elif element.tag == qn('w:tbl'):
+                    src_table = Table(element, raw._body)
+                    i, skipped = _copy_table(tpl, src_table, tpl, raw, figure_counter)
+                    inserted_total += i
+                    skipped_images += skipped
+
+                if compactor is not None:
+                    compactor.feed(_new_blocks(body, mark))
+                if toc is not None:
+                    toc.scan(_new_blocks(body, mark))
+
+                if writer is not None:
+                    writer.flush()
+                    # the source block is done with, too (unless the caller still owns it)
+                    if owned:
+                        raw_body.remove(element)
+        check_cancel(cancel)
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+
+    if toc is None:
+        _set_update_fields_on_open(tpl)
 
     if skipped_images:
         note = tpl.add_paragraph(f"[note] {skipped_images} unsupported image(s) were skipped.")
@@ -451,12 +645,27 @@ def merge_into_template(template_path: str, raw_docx_path: str, out_path: str) -
         except Exception:
             pass
 
-    tpl.save(out_path)
-
-    return {"inserted_images": inserted_total, "skipped_images": skipped_images}
+    if writer is not None:
+        writer.close(fill={TOC_PLACEHOLDER: toc.entries()} if toc is not None else None)
+    else:
+        if toc is not None:
+            toc.fill()
+        save_document(tpl, out_path, template_path=template_path)
+
+    stats = {"inserted_images": inserted_total, "skipped_images": skipped_images}
+    if compactor is not None:
+        c = compactor.stats
+        print(f"🧹 Compaction: {c['elements_before']} → {c['elements_after']} elements "
+              f"({c['paragraphs_removed']} empty paragraphs, {c['runs_removed']} empty runs, "
+              f"{c['runs_merged']} merged runs, {c['props_stripped']} empty properties, "
+              f"{c['props_redundant']} redundant properties)")
+        stats["compaction"] = dict(c)
+    return stats
 
 
-def merge_from_any(template_path: str, raw_path: str, out_docx: str) -> Dict[str, int]:
+def merge_from_any(template_path: str, raw_path: str, out_docx: str,
+                   streaming: bool = False, toc_mode: str = "field", compact: bool = True,
+                   cancel: Optional[threading.Event] = None) -> Dict[str, int]:
     """
     Accepts .docx or .md
       - .md  → temporary .docx via parser.md_file_to_docx(), then merge
@@ -468,8 +677,9 @@ def merge_from_any(template_path: str, raw_path: str, out_docx: str) -> Dict[str
     ext = Path(raw_path).suffix.lower()
     if ext in {".md", ".markdown", ".mdx"}:
         tmp_docx = str(Path(out_docx).with_name(Path(out_docx).stem + "_from_md.docx"))
-        md_file_to_docx(raw_path, tmp_docx)
+        md_file_to_docx(raw_path, tmp_docx, cancel=cancel)
         src = tmp_docx
 
-    stats = merge_into_template(template_path, src, out_docx)
+    stats = merge_into_template(template_path, src, out_docx, streaming=streaming, toc_mode=toc_mode,
+                                compact=compact, cancel=cancel)
     return stats
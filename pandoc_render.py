@@ -0,0 +1,263 @@
+# pandoc_render.py
+"""
+Markdown → raw DOCX through pandoc (pypandoc), as an alternative to the
+built-in renderer in parser.py. Both produce the raw DOCX that merge.py pours
+into the template, and the pandoc output is normalised so the merge sees the
+same thing:
+
+  • the text goes through parser._strip_hidden_sections first;
+  • it is then split into blocks the way parser.py's line-based reader does
+    (indented lines are not nested, "1." and ":::" stay literal text) and
+    re-emitted one block per paragraph, bullets as custom-style divs, so pandoc
+    only handles inline markup, tables and writing the DOCX;
+  • image lines become placeholder paragraphs that are filled afterwards by
+    parser._resolve_image_path + parser._insert_image (same lookup, width,
+    border/shadow and caption as the built-in renderer);
+  • pandoc's body styles (First Paragraph/Body Text/Compact) and any style
+    python-docx's default document lacks become Normal, as in parser.py
+    (its image captions, say), and table header runs are bold.
+
+The template is passed as pandoc's --reference-doc, so the raw DOCX already
+carries its styles. Pick the engine per deployment with "MD_ENGINE" in
+config.json or DOC_COMPOSER_MD_ENGINE ("native" | "pandoc"); pandoc needs
+`pip install pypandoc` and a pandoc binary (or pypandoc_binary).
+bench_renderers.py compares the two on speed and structure.
+"""
+from __future__ import annotations
+import json
+import os
+import re
+import tempfile
+import threading
+from pathlib import Path
+from typing import Optional, Tuple
+
+from parser import (B_BULLET, H_HEADING, IMG, _insert_image, _is_table_separator_row, _resolve_image_path,
+                    _strip_hidden_sections, check_cancel, md_file_to_docx)
+
+ENGINES = ("native", "pandoc")
+# pandoc's Markdown (fenced divs carry custom-style) minus the syntax parser.py
+# leaves as literal text: smart quotes, $math$, ^sup^/~sub~, @citations, raw HTML/TeX
+PANDOC_FORMAT = "markdown" + "".join(f"-{ext}" for ext in (
+    "smart", "tex_math_dollars", "superscript", "subscript", "citations", "raw_html", "raw_tex",
+    "implicit_figures", "footnotes", "inline_notes", "fancy_lists", "example_lists", "definition_lists",
+    "line_blocks", "native_spans", "bracketed_spans", "link_attributes", "strikeout", "task_lists"))
+
+_PLACEHOLDER = "DCIMGPLACEHOLDER{:05d}"
+_PLACEHOLDER_RE = re.compile(r"^DCIMGPLACEHOLDER(\d{5})$")
+
+# pandoc style name → the name parser.py would have used
+_STYLE_RENAMES = {
+    "First Paragraph": "Normal",
+    "Body Text": "Normal",
+    "Compact": "Normal",
+}
+
+_PANDOC: dict = {}   # "ok", "detail" once probed
+_NATIVE_STYLES: set = set()
+
+
+def pandoc_available() -> Tuple[bool, str]:
+    """(available, detail) — probed once."""
+    if not _PANDOC:
+        try:
+            import pypandoc
+            _PANDOC.update(ok=True, detail=f"pandoc {pypandoc.get_pandoc_version()}")
+        except ImportError:
+            _PANDOC.update(ok=False, detail="pypandoc is not installed")
+        except OSError as e:
+            _PANDOC.update(ok=False, detail=str(e).splitlines()[0] if str(e) else "pandoc binary not found")
+    return _PANDOC["ok"], _PANDOC["detail"]
+
+
+def configured_engine(config_file: Optional[Path] = None) -> str:
+    """DOC_COMPOSER_MD_ENGINE, else "MD_ENGINE" from config.json, else "native"."""
+    engine = os.environ.get("DOC_COMPOSER_MD_ENGINE", "")
+    if not engine and config_file is not None and config_file.exists():
+        try:
+            engine = json.loads(config_file.read_text(encoding="utf-8")).get("MD_ENGINE", "") or ""
+        except Exception as e:
+            print("⚠️ Failed to read MD_ENGINE from config.json:", e)
+    engine = engine.strip().lower() or "native"
+    if engine not in ENGINES:
+        print(f"⚠️ Unknown Markdown engine {engine!r}; using native")
+        return "native"
+    return engine
+
+
+# ===================== PRE / POST PROCESSING =====================
+
+_LEADING_MARKUP = re.compile(r"^(?:\d+(?=[.)]\s)|[*+\-](?=\s)|#|>|:|\||```|~~~)")
+
+
+def _escape_block(text: str) -> str:
+    """Backslash the leading character(s) pandoc would read as block syntax (lists, fences, quotes…)."""
+    m = _LEADING_MARKUP.match(text)
+    if not m:
+        return text
+    if m.group().isdigit():
+        # "1. step" stays literal text, as in parser.py
+        return text[:m.end()] + "\\" + text[m.end():]
+    return "\\" + text
+
+
+def _to_pandoc_markdown(md_text: str) -> Tuple[str, list]:
+    """
+    Re-emit (already stripped) Markdown block by block as parser.py splits it:
+    headings, "- " bullets (any indent ≥ 1 → List Bullet 2), pipe tables,
+    image lines and paragraphs of consecutive text lines. Each block is
+    dedented and separated by a blank line so pandoc can't nest or merge
+    them; bullets become custom-style divs. Image lines become placeholder
+    paragraphs; returns the text and [(alt, path_str)] per placeholder.
+    """
+    lines = md_text.splitlines()
+    blocks, images, para, i = [], [], [], 0
+
+    def flush_para():
+        if para:
+            blocks.append(_escape_block(" ".join(s.strip() for s in para).strip()))
+            para.clear()
+
+    while i < len(lines):
+        line = lines[i]
+        if line.strip() == "":
+            flush_para()
+            i += 1
+            continue
+        m = H_HEADING.match(line)
+        if m:
+            flush_para()
+            hashes, txt = m.groups()
+            blocks.append("#" * min(len(hashes), 4) + " " + txt)
+            i += 1
+            continue
+        m = B_BULLET.match(line)
+        if m:
+            flush_para()
+            style = "List Bullet 2" if m.group("indent") else "List Bullet"
+            blocks.append(f'::: {{custom-style="{style}"}}\n{_escape_block(m.group("text"))}\n:::')
+            i += 1
+            continue
+        if "|" in line and i + 1 < len(lines) and _is_table_separator_row(lines[i + 1]):
+            flush_para()
+            rows = [line.strip(), lines[i + 1].strip()]
+            i += 2
+            while i < len(lines) and lines[i].strip() and "|" in lines[i]:
+                rows.append(lines[i].strip())
+                i += 1
+            blocks.append("\n".join(rows))
+            continue
+        m = IMG.search(line)
+        if m:
+            flush_para()
+            blocks.append(_PLACEHOLDER.format(len(images)))
+            images.append(m.groups())
+            i += 1
+            continue
+        para.append(line)
+        i += 1
+    flush_para()
+    return "\n\n".join(blocks) + "\n", images
+
+
+def _native_styles() -> set:
+    """Style names parser.py can use: those of python-docx's default document."""
+    if not _NATIVE_STYLES:
+        from docx import Document
+        _NATIVE_STYLES.update(s.name for s in Document().styles)
+    return _NATIVE_STYLES
+
+
+def _normalise(doc) -> None:
+    """Rename pandoc's paragraph styles to parser.py's and bold table header rows."""
+    from docx.oxml.ns import qn
+    from docx.text.paragraph import Paragraph
+
+    native = _native_styles()
+    names = {s.style_id: s.name for s in doc.styles}
+    body = doc.element.body
+    for p_el in body.iter(qn("w:p")):
+        para = Paragraph(p_el, None)
+        name = names.get(p_el.style) if p_el.style else None
+        target = _STYLE_RENAMES.get(name)
+        if target is None and name is not None and name not in native:
+            target = "Normal"
+        if target == "Normal":
+            p_el.style = None
+        # pandoc marks header rows instead of bolding them
+        tr = next(p_el.iterancestors(qn("w:tr")), None)
+        if tr is not None and tr.xpath("./w:trPr/w:tblHeader"):
+            for run in para.runs:
+                run.bold = True
+
+
+def _fill_images(doc, images: list, base_dir: Optional[Path], style_images: bool,
+                 image_index: Optional[dict]) -> None:
+    """Put each image (+ caption) where its placeholder paragraph is."""
+    from docx.oxml.ns import qn
+
+    body = doc.element.body
+    found = []
+    for p_el in body.iter(qn("w:p")):
+        m = _PLACEHOLDER_RE.match("".join(p_el.xpath("./w:r/w:t/text()")).strip())
+        if m:
+            found.append((p_el, images[int(m.group(1))]))
+    for p_el, (alt, path_str) in found:
+        # _insert_image appends at the end of the body (before sectPr); move what it adds
+        tail = 1 if len(body) and body[-1].tag == qn("w:sectPr") else 0
+        start = len(body) - tail
+        _insert_image(doc, _resolve_image_path(path_str, base_dir, image_index), alt, style_images)
+        for el in list(body)[start:len(body) - tail]:
+            p_el.addprevious(el)
+        p_el.getparent().remove(p_el)
+
+
+# ===================== RENDERING =====================
+
+def md_file_to_docx_pandoc(
+    md_path: str,
+    out_docx: str,
+    base_dir: Path | None = None,
+    style_images: bool = True,
+    debug: bool = False,
+    image_index: dict | None = None,
+    cancel: threading.Event | None = None,
+    reference_doc: str | None = None,
+) -> None:
+    """parser.md_file_to_docx with pandoc doing the Markdown; reference_doc supplies the styles."""
+    import pypandoc
+    from docx import Document
+
+    md_file = Path(md_path)
+    text = _strip_hidden_sections(md_file.read_text(encoding="utf-8"))
+    text, images = _to_pandoc_markdown(text)
+    check_cancel(cancel)
+
+    extra = [f"--reference-doc={reference_doc}"] if reference_doc else []
+    fd, tmp = tempfile.mkstemp(suffix=".docx", dir=Path(out_docx).parent)
+    os.close(fd)
+    try:
+        pypandoc.convert_text(text, "docx", format=PANDOC_FORMAT, outputfile=tmp, extra_args=extra)
+        check_cancel(cancel)
+        doc = Document(tmp)
+    finally:
+        Path(tmp).unlink(missing_ok=True)
+
+    _fill_images(doc, images, base_dir or md_file.parent, style_images, image_index)
+    _normalise(doc)
+    check_cancel(cancel)
+    doc.save(out_docx)
+    if debug:
+        print(f"✅ Saved (pandoc): {out_docx}")
+
+
+def md_to_docx(engine: str, md_path: str, out_docx: str, reference_doc: str | None = None, **kwargs) -> None:
+    """Render with the chosen engine; "pandoc" falls back to the built-in renderer when pandoc is missing."""
+    if engine == "pandoc":
+        ok, detail = pandoc_available()
+        if ok:
+            return md_file_to_docx_pandoc(md_path, out_docx, reference_doc=reference_doc, **kwargs)
+        print(f"⚠️ Pandoc engine unavailable ({detail}); using the built-in renderer")
+    elif engine != "native":
+        raise ValueError(f"unknown Markdown engine: {engine!r}")
+    md_file_to_docx(md_path, out_docx, **kwargs)
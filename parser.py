@@ -1,7 +1,7 @@
 """
 Markdown → python-docx:
   • #, ##, ###, ####  → Word Heading 1..4
-  • **bold**          → real bold runs
+  • **bold**, *italic*, `code`, [text](url) → minimal runs / hyperlinks
   • - item            → List Bullet / List Bullet 2
   • Pipe tables with header separator → Word tables
   • ![alt](path)      → Embedded image with caption (if meaningful)
@@ -16,52 +16,252 @@ before parsing so they do not appear in the output DOCX/PDF.
 
 from __future__ import annotations
 import re, json
+import posixpath
+import threading
+import time
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional, Tuple
 import os
 
 from docx import Document
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.shared import Cm, Emu
 from docx.table import _Cell
-from docx.oxml import parse_xml
-from docx.oxml.ns import nsdecls
-
-try:
-    from PIL import Image
-except Exception:
-    Image = None
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml import OxmlElement, parse_xml
+from docx.oxml.ns import nsdecls, qn
+from docx.shared import RGBColor
+from docx.text.run import Run
+
+# Pillow is optional and only needed once an image is sized; import on first use.
+_PIL_IMAGE = None
+
+def _pil_image():
+    global _PIL_IMAGE
+    if _PIL_IMAGE is None:
+        try:
+            from PIL import Image
+            _PIL_IMAGE = Image
+        except Exception:
+            _PIL_IMAGE = False
+    return _PIL_IMAGE or None
 
 
 # -------- Load config.json --------
+# Read lazily (first image lookup) so importing this module stays side-effect free.
 CONFIG_FILE = Path(__file__).parent / "config.json"
 GLOBAL_IMAGE_DIRS: List[Path] = []
+_CONFIG_LOADED = False
 
-if CONFIG_FILE.exists():
-    try:
-        with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            dirs = data.get("GLOBAL_IMAGE_DIRS", [])
-            GLOBAL_IMAGE_DIRS = [Path(d).resolve() for d in dirs if d.strip()]
-    except Exception as e:
-        print("⚠️ Failed to read config.json:", e)
+def _load_config() -> None:
+    global GLOBAL_IMAGE_DIRS, _CONFIG_LOADED
+    if _CONFIG_LOADED:
+        return
+    _CONFIG_LOADED = True
+    if CONFIG_FILE.exists():
+        try:
+            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
+                data = json.load(f)
+                dirs = data.get("GLOBAL_IMAGE_DIRS", [])
+                GLOBAL_IMAGE_DIRS = [Path(d).resolve() for d in dirs if d.strip()]
+        except Exception as e:
+            print("⚠️ Failed to read config.json:", e)
+
+# -------- inline formatting --------
+# One pass over the text produces spans of (text, bold, italic, code, url);
+# adjacent spans with the same formatting become a single w:r.
+CODE_FONT = "Consolas"
+HYPERLINK_COLOR = RGBColor(0x05, 0x63, 0xC1)
+
+_ESCAPABLE = set("\\`*_[]()#+-.!|")
+_LINK = re.compile(r"\[([^\]]+)\]\(\s*<?([^)\s>]+)>?(?:\s+\"[^\"]*\")?\s*\)")
+# An image that shares its line with text can't be placed inline; it stays literal text
+_INLINE_IMG = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+
+
+def _scan_inline(text: str) -> List[list]:
+    """
+    Tokens: ["text", s] · ["code", s] · ["delim", run of 1-3 "*" or "_", can_open, can_close]
+    · ["link", url] … ["/link"]. Delimiters are paired later.
+    """
+    toks: List[list] = []
+    buf: List[str] = []
+    n = len(text)
+    i = 0
+
+    def flush():
+        if buf:
+            toks.append(["text", "".join(buf)])
+            buf.clear()
+
+    while i < n:
+        c = text[i]
+        if c == "\\" and i + 1 < n and text[i + 1] in _ESCAPABLE:
+            buf.append(text[i + 1])
+            i += 2
+        elif c == "`":
+            j = i
+            while j < n and text[j] == "`":
+                j += 1
+            ticks = text[i:j]
+            close = text.find(ticks, j)
+            if close == -1:
+                buf.append(ticks)
+                i = j
+            else:
+                flush()
+                toks.append(["code", text[j:close].strip() or text[j:close]])
+                i = close + len(ticks)
+        elif c == "!" and text.startswith("![", i):
+            m = _INLINE_IMG.match(text, i)
+            end = m.end() if m else i + 1
+            buf.append(text[i:end])
+            i = end
+        elif c == "[":
+            m = _LINK.match(text, i)
+            if m:
+                flush()
+                toks.append(["link", m.group(2)])
+                toks.extend(_scan_inline(m.group(1)))
+                toks.append(["/link"])
+                i = m.end()
+            else:
+                buf.append(c)
+                i += 1
+        elif c in "*_":
+            j = i
+            while j < n and text[j] == c:
+                j += 1
+            before = text[i - 1] if i > 0 else " "
+            after = text[j] if j < n else " "
+            can_open = not after.isspace()
+            can_close = not before.isspace()
+            if c == "_" and before.isalnum() and after.isalnum():
+                can_open = can_close = False          # snake_case stays literal
+            run = j - i
+            if not (can_open or can_close) or run > 3:
+                buf.append(text[i:j])
+            else:
+                flush()
+                toks.append(["delim", text[i:j], can_open, can_close])
+            i = j
+        else:
+            buf.append(c)
+            i += 1
+    flush()
+    return toks
 
-# -------- inline **bold** --------
-BOLD = re.compile(r"\*\*(.+?)\*\*", re.DOTALL)
 
-def _emit_bold_runs(p, text: str) -> None:
+def _pair_delims(toks: List[list]) -> None:
+    """
+    Match emphasis delimiter runs the CommonMark way: a closer takes two
+    characters from the nearest opener of its kind when both have two, else
+    one, so "***a** b*" nests as italic(bold(a) b). Matched pieces become
+    ["delim", "**"|"*"|"__"|"_"] in nesting order; leftovers turn back into text.
+    """
+    left: Dict[int, int] = {}
+    opens: Dict[int, List[str]] = {}
+    closes: Dict[int, List[str]] = {}
+    stack: List[int] = []
+    for k, t in enumerate(toks):
+        if t[0] != "delim":
+            continue
+        _, run, can_open, can_close = t
+        c = run[0]
+        left[k], opens[k], closes[k] = len(run), [], []
+        while can_close and left[k]:
+            x = next((x for x in range(len(stack) - 1, -1, -1) if toks[stack[x]][1][0] == c), None)
+            if x is None:
+                break
+            o = stack[x]
+            used = 2 if left[o] >= 2 and left[k] >= 2 else 1
+            opens[o].insert(0, c * used)   # the opener's innermost characters go first
+            closes[k].append(c * used)
+            left[o] -= used
+            left[k] -= used
+            del stack[x + 1:]              # openers inside the span stay literal
+            if not left[o]:
+                stack.pop()
+        if can_open and left[k]:
+            stack.append(k)
+
+    out: List[list] = []
+    for k, t in enumerate(toks):
+        if t[0] != "delim":
+            out.append(t)
+            continue
+        out.extend(["delim", d] for d in closes[k])
+        if left[k]:
+            out.append(["text", t[1][0] * left[k]])
+        out.extend(["delim", d] for d in opens[k])
+    toks[:] = out
+
+
+def inline_spans(text: str) -> List[Tuple[str, bool, bool, bool, Optional[str]]]:
+    """Markdown inline text → merged (text, bold, italic, code, url) spans."""
+    toks = _scan_inline(text)
+    _pair_delims(toks)
+    spans: List[list] = []
+    bold = italic = False
+    url: Optional[str] = None
+    for t in toks:
+        kind = t[0]
+        if kind == "delim":
+            if len(t[1]) == 2:
+                bold = not bold
+            else:
+                italic = not italic
+            continue
+        if kind == "link":
+            url = t[1]
+            continue
+        if kind == "/link":
+            url = None
+            continue
+        fmt = (bold, italic, kind == "code", url)
+        if spans and tuple(spans[-1][1:]) == fmt:
+            spans[-1][0] += t[1]
+        else:
+            spans.append([t[1], *fmt])
+    return [tuple(sp) for sp in spans if sp[0]]
+
+
+def _add_hyperlink(p, url: str):
+    """Empty w:hyperlink appended to paragraph p: "#name" → bookmark anchor, else an external URL."""
+    link = OxmlElement("w:hyperlink")
+    if url.startswith("#"):
+        link.set(qn("w:anchor"), url[1:])
+    else:
+        link.set(qn("r:id"), p.part.relate_to(url, RT.HYPERLINK, is_external=True))
+    link.set(qn("w:history"), "1")
+    p._p.append(link)
+    return link
+
+
+def _emit_inline_runs(p, text: str) -> None:
     if not text:
         p.add_run("")
         return
-    i = 0
-    for m in BOLD.finditer(text):
-        if m.start() > i:
-            p.add_run(text[i:m.start()])
-        r = p.add_run(m.group(1))
-        r.bold = True
-        i = m.end()
-    if i < len(text):
-        p.add_run(text[i:])
+    link_el = None
+    link_url = None
+    for chunk, bold, italic, code, url in inline_spans(text):
+        if url is None:
+            link_el = link_url = None
+            r = p.add_run(chunk)
+        else:
+            if link_el is None or url != link_url:
+                link_el, link_url = _add_hyperlink(p, url), url
+            r = Run(OxmlElement("w:r"), p)
+            r.text = chunk
+            link_el.append(r._r)
+            r.font.color.rgb = HYPERLINK_COLOR
+            r.font.underline = True
+        if bold:
+            r.bold = True
+        if italic:
+            r.italic = True
+        if code:
+            r.font.name = CODE_FONT
 
 # -------- Hidden / comment stripping --------
 # 1) YAML front matter at the top: --- ... ---
@@ -150,7 +350,7 @@ def _render_table(doc: Document, header_line: str, sep_line: str, body_lines: Li
     for j in range(n_cols):
         cell = tbl.cell(0, j)
         txt = hdr[j] if j < len(hdr) else ""
-        _emit_bold_runs(cell.paragraphs[0], txt)
+        _emit_inline_runs(cell.paragraphs[0], txt)
         for run in cell.paragraphs[0].runs:
             run.bold = True
         if j < len(aligns):
@@ -161,7 +361,7 @@ def _render_table(doc: Document, header_line: str, sep_line: str, body_lines: Li
         for j in range(n_cols):
             cell = tbl.cell(i, j)
             txt = row[j] if j < len(row) else ""
-            _emit_bold_runs(cell.paragraphs[0], txt)
+            _emit_inline_runs(cell.paragraphs[0], txt)
             if j < len(aligns):
                 _align_cell(cell, aligns[j])
 
@@ -176,14 +376,28 @@ SMALL_SOURCE_THRESHOLD_CM = 10.0
 
 ALLOWED_EXTENSIONS = {".png", ".jpg", ".jpeg", ".svg", ".gif", ".ico", ".bmp", ".tiff"}
 
+# (path, mtime_ns, size) → width; the same screenshots recur across sections and jobs
+_WIDTH_CACHE: dict = {}
+_WIDTH_CACHE_MAX = 4096
+
 def _compute_width(path: Path) -> Emu:
+    Image = _pil_image()
     if Image is not None and path.exists() and path.suffix.lower() in {".png", ".jpg", ".jpeg", ".bmp", ".tiff"}:
         try:
+            st = path.stat()
+            key = (str(path), st.st_mtime_ns, st.st_size)
+            width = _WIDTH_CACHE.get(key)
+            if width is not None:
+                return width
             with Image.open(path) as im:
                 px_w = im.width
                 dpi = im.info.get("dpi", (96, 96))[0] or 96
                 width_cm = (px_w / dpi) * 2.54
-                return Emu(Cm(SMALL_WIDTH_CM if width_cm < SMALL_SOURCE_THRESHOLD_CM else NORMAL_WIDTH_CM))
+                width = Emu(Cm(SMALL_WIDTH_CM if width_cm < SMALL_SOURCE_THRESHOLD_CM else NORMAL_WIDTH_CM))
+            if len(_WIDTH_CACHE) >= _WIDTH_CACHE_MAX:
+                _WIDTH_CACHE.clear()
+            _WIDTH_CACHE[key] = width
+            return width
         except Exception:
             pass
     return Emu(Cm(NORMAL_WIDTH_CM))
@@ -216,17 +430,81 @@ def _apply_border_and_shadow_to_pic(pic_el) -> None:
     spPr.append(parse_xml(shdw_xml))
 
 
+# -------- Global image index --------
+# name.lower() → first matching path under GLOBAL_IMAGE_DIRS. Built once (at
+# warm-up or first miss) instead of an rglob per unresolved image; a miss on
+# an index older than IMAGE_INDEX_TTL_S triggers one rebuild to pick up new files.
+IMAGE_INDEX_TTL_S = 60.0
+_IMAGE_INDEX: dict = {}
+_IMAGE_INDEX_BUILT = 0.0
+_IMAGE_INDEX_LOCK = threading.Lock()
+
+def build_image_index() -> int:
+    """(Re)scan GLOBAL_IMAGE_DIRS; returns the number of indexed images."""
+    global _IMAGE_INDEX, _IMAGE_INDEX_BUILT
+    _load_config()
+    index: dict = {}
+    for gdir in GLOBAL_IMAGE_DIRS:
+        if gdir.exists():
+            for p in gdir.rglob("*"):
+                if p.suffix.lower() in ALLOWED_EXTENSIONS:
+                    index.setdefault(p.name.lower(), p)
+    with _IMAGE_INDEX_LOCK:
+        _IMAGE_INDEX = index
+        _IMAGE_INDEX_BUILT = time.monotonic()
+    return len(index)
+
+def _lookup_global_image(name: str) -> Path | None:
+    if not GLOBAL_IMAGE_DIRS:
+        return None
+    if not _IMAGE_INDEX_BUILT:
+        build_image_index()
+    key = name.lower()
+    hit = _IMAGE_INDEX.get(key)
+    if hit is None and time.monotonic() - _IMAGE_INDEX_BUILT > IMAGE_INDEX_TTL_S:
+        build_image_index()
+        hit = _IMAGE_INDEX.get(key)
+    return hit
+
+
+def _lookup_index_image(index: dict, path_str: str) -> Path | None:
+    """
+    Match an image reference against an uploaded archive's index
+    (archive.build_archive_image_index: relative path / bare name → file).
+    """
+    ref = posixpath.normpath(path_str).lower()
+    hit = index.get(ref)
+    if hit is None:
+        # "../images/x.png" written from a nested section
+        while ref.startswith("../"):
+            ref = ref[3:]
+        hit = index.get(ref) or index.get(posixpath.basename(ref))
+    return hit
+
+
 # -------- Path Normalization + Config + Recursive --------
-def _resolve_image_path(path_str: str, base_dir: Path | None) -> Path:
+def _resolve_image_path(path_str: str, base_dir: Path | None, image_index: dict | None = None,
+                        verbose: bool = True) -> Path:
     """
     Resolve image path with guaranteed recursive search in GLOBAL_IMAGE_DIRS.
+    An uploaded archive's image index, when given, is consulted first.
+    verbose=False skips the per-candidate log (preflight scans).
     """
+    _load_config()
+    say = print if verbose else (lambda *a, **k: None)
     path_str = path_str.strip().replace("\\", "/")
     while path_str.startswith("/"):
         path_str = path_str.lstrip("/")
 
     img_path = Path(path_str)
-    print(f"\n🔍 Resolving image: {path_str}")
+    say(f"\n🔍 Resolving image: {path_str}")
+
+    # --- Step 0: Images shipped in the uploaded archive ---
+    if image_index:
+        p = _lookup_index_image(image_index, path_str)
+        if p is not None:
+            say("📦 Archive match:", p)
+            return p
 
     candidates = []
 
@@ -249,23 +527,22 @@ def _resolve_image_path(path_str: str, base_dir: Path | None) -> Path:
         candidates.append((gdir / "static" / "img" / img_path.name).resolve())
 
     # Check candidates first
-    for c in candidates:
-        print("   checking:", c, "✅" if c.exists() else "❌")
+    if verbose:
+        for c in candidates:
+            print("   checking:", c, "✅" if c.exists() else "❌")
     for c in candidates:
         if c.exists():
-            print("👉 Found:", c)
+            say("👉 Found:", c)
             return c
 
-    # --- Step 4: Always do global recursive search ---
-    for gdir in GLOBAL_IMAGE_DIRS:
-        if gdir.exists():
-            for p in gdir.rglob("*"):
-                if p.suffix.lower() in ALLOWED_EXTENSIONS and p.name.lower() == img_path.name.lower():
-                    print("🔎 Recursive match (global):", p)
-                    return p
+    # --- Step 4: Global recursive search (via the image index) ---
+    p = _lookup_global_image(img_path.name)
+    if p is not None:
+        say("🔎 Recursive match (global):", p)
+        return p
 
     # Nothing found
-    print("⚠️ Not found, returning raw path:", img_path.resolve())
+    say("⚠️ Not found, returning raw path:", img_path.resolve())
     return img_path
 
 
@@ -301,13 +578,24 @@ def _insert_image(doc: Document, path: Path, alt: str, style_images: bool) -> No
 
 
 # -------- block parsing --------
+class Cancelled(Exception):
+    """Raised by the renderer and the merge once the job's cancel event is set."""
+
+
+def check_cancel(cancel) -> None:
+    if cancel is not None and cancel.is_set():
+        raise Cancelled("Conversion cancelled.")
+
+
 H_HEADING = re.compile(r"^(#{1,6})\s+(.*\S)\s*$")
 B_BULLET  = re.compile(r"^(?P<indent>\s*)-\s+(?P<text>.*\S)\s*$")
 
 def render_markdown_into(
     doc: Document, md_text: str, base_dir: Path | None = None,
-    style_images: bool = True
+    style_images: bool = True, image_index: dict | None = None,
+    cancel: threading.Event | None = None, used_images: list | None = None
 ) -> Document:
+    # used_images, when given, collects every resolved image path (watch mode tracks them)
     # Preprocess: strip hidden/internal sections, YAML front matter and HTML comments
     md_text = _strip_hidden_sections(md_text)
 
@@ -321,10 +609,11 @@ def render_markdown_into(
             return
         text = " ".join(s.strip() for s in para_buf).strip()
         p = doc.add_paragraph()
-        _emit_bold_runs(p, text)
+        _emit_inline_runs(p, text)
         para_buf = []
 
     while i < len(lines):
+        check_cancel(cancel)
         line = lines[i]
 
         if line.strip() == "":
@@ -344,7 +633,7 @@ def render_markdown_into(
                 p.style = f"Heading {level}"
             except Exception:
                 pass
-            _emit_bold_runs(p, txt)
+            _emit_inline_runs(p, txt)
             i += 1
             continue
 
@@ -363,7 +652,7 @@ def render_markdown_into(
                     bp.style = "List Bullet 2" if indent >= 1 else "List Bullet"
                 except Exception:
                     pass
-                _emit_bold_runs(bp, text)
+                _emit_inline_runs(bp, text)
                 i += 1
             continue
 
@@ -388,7 +677,9 @@ def render_markdown_into(
         if m:
             flush_para()
             alt, path_str = m.groups()
-            img_path = _resolve_image_path(path_str, base_dir)
+            img_path = _resolve_image_path(path_str, base_dir, image_index)
+            if used_images is not None:
+                used_images.append(img_path)
             _insert_image(doc, img_path, alt, style_images)
             i += 1
             continue
@@ -406,7 +697,9 @@ def md_file_to_docx(
     out_docx: str,
     base_dir: Path | None = None,
     style_images: bool = True,
-    debug: bool = False
+    debug: bool = False,
+    image_index: dict | None = None,
+    cancel: threading.Event | None = None
 ) -> None:
     md_file = Path(md_path)
     text = md_file.read_text(encoding="utf-8")
@@ -417,8 +710,11 @@ def md_file_to_docx(
         doc,
         text,
         base_dir or md_file.parent,
-        style_images=style_images
+        style_images=style_images,
+        image_index=image_index,
+        cancel=cancel
     )
+    check_cancel(cancel)
     doc.save(out_docx)
     if debug:
         print(f"✅ Saved: {out_docx}")
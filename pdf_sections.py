@@ -0,0 +1,570 @@
+# pdf_sections.py
+"""
+Section-parallel PDF export for long documents.
+
+A single soffice lays out every page in turn. docx_to_pdf_sections() instead:
+  • splits the merged DOCX at the Heading 1 paragraphs of its last section into
+    `workers` chunks of similar size (the template's earlier sections — cover,
+    TOC — become a chunk of their own),
+  • converts the chunks concurrently, each soffice with its own profile,
+  • re-renders the chunks whose first page number was only a guess once the
+    real page counts are known (w:pgNumType w:start on the chunk's sectPr),
+  • concatenates the chunk PDFs with pypdf, keeping every chunk's outline.
+
+References between chunks are rewritten in the chunk DOCX first: a hyperlink
+to a bookmark in another chunk becomes an external link to
+"docx-xref:<bookmark>", re-pointed to the right page after concatenation;
+a PAGEREF field to another chunk becomes literal text that the next pass
+fills with the real page number.
+
+Falls back to plain docx_to_pdf() when the engine isn't LibreOffice, the
+document doesn't split into at least two chunks, or it uses NUMPAGES /
+SECTIONPAGES (they would count the chunk, not the document).
+"""
+from __future__ import annotations
+import os
+import posixpath
+import re
+import shutil
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from lxml import etree
+from docx.oxml.ns import qn
+
+from compact import _is_empty_paragraph
+from converters import (CANCELLED, _DETECTED, _convert_with_libreoffice, detect_pdf_engine, docx_to_pdf,
+                        lo_worker_profile)
+from docx_writer import _copy_raw_member, _entry
+from toc import CHARS_PER_IMAGE, CHARS_PER_PAGE, CHARS_PER_TABLE_ROW
+
+DOCUMENT_PART = "word/document.xml"
+DOCUMENT_RELS = "word/_rels/document.xml.rels"
+XREF_SCHEME = "docx-xref:"
+MAX_WORKERS = 8
+# Chunk 0's page count can shift once its PAGEREFs get real numbers
+MAX_PASSES = 3
+
+# Word bookmarks become named destinations, so links between chunks can be re-pointed
+EXPORT_FILTER = 'pdf:writer_pdf_Export:{"ExportBookmarksToPDFDestination":{"type":"boolean","value":"true"}}'
+
+_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+_RT_HYPERLINK = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/hyperlink"
+_RT_IMAGE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/image"
+_R_ATTRS = tuple(f"{{http://schemas.openxmlformats.org/officeDocument/2006/relationships}}{a}"
+                 for a in ("id", "embed", "link"))
+
+_P = qn("w:p")
+_R = qn("w:r")
+_T = qn("w:t")
+_PPR = qn("w:pPr")
+_SECTPR = qn("w:sectPr")
+_INSTR = qn("w:instrText")
+_FLDCHAR = qn("w:fldChar")
+_FLDSIMPLE = qn("w:fldSimple")
+_HYPERLINK = qn("w:hyperlink")
+_BOOKMARK = qn("w:bookmarkStart")
+_PGNUMTYPE = qn("w:pgNumType")
+# sectPr children that come after w:pgNumType in schema order
+_AFTER_PGNUMTYPE = {qn(t) for t in (
+    "w:cols", "w:formProt", "w:vAlign", "w:noEndnote", "w:titlePg", "w:textDirection",
+    "w:bidi", "w:rtlGutter", "w:docGrid", "w:printerSettings", "w:sectPrChange",
+)}
+
+_PAGEREF = re.compile(r"^\s*PAGEREF\s+(\S+)", re.IGNORECASE)
+_PAGE_TOTALS = re.compile(rb"\b(NUMPAGES|SECTIONPAGES)\b")
+_HEADING1 = re.compile(r"^heading 1$", re.IGNORECASE)
+
+
+def _fld_type(r) -> Optional[str]:
+    fc = r.find(_FLDCHAR)
+    return fc.get(qn("w:fldCharType")) if fc is not None else None
+
+
+def _text(el) -> str:
+    return "".join(t.text or "" for t in el.iter(_T))
+
+
+def _weight(block) -> int:
+    """Rough size in characters, on the same scale as the TOC page estimate."""
+    w = len(_text(block))
+    w += CHARS_PER_IMAGE * sum(1 for _ in block.iter(qn("w:drawing")))
+    w += CHARS_PER_TABLE_ROW * sum(1 for _ in block.iter(qn("w:tr")))
+    return w
+
+
+def _heading1_ids(src: zipfile.ZipFile) -> Set[str]:
+    try:
+        styles = etree.fromstring(src.read("word/styles.xml"))
+    except KeyError:
+        return set()
+    ids = set()
+    for st in styles.iter(qn("w:style")):
+        name = st.find(qn("w:name"))
+        if name is not None and _HEADING1.match(name.get(qn("w:val"), "")):
+            ids.add(st.get(qn("w:styleId")))
+    return ids
+
+
+def _is_heading1(block, ids: Set[str]) -> bool:
+    if block.tag != _P:
+        return False
+    ps = block.find(_PPR + "/" + qn("w:pStyle"))
+    return ps is not None and ps.get(qn("w:val")) in ids
+
+
+def _set_page_start(sectpr, start: int) -> None:
+    pg = sectpr.find(_PGNUMTYPE)
+    if pg is None:
+        pg = etree.SubElement(sectpr, _PGNUMTYPE)
+        for child in sectpr:
+            if child.tag in _AFTER_PGNUMTYPE:
+                child.addprevious(pg)
+                break
+    pg.set(qn("w:start"), str(start))
+
+
+def _literal_pageref(instr) -> Optional[etree._Element]:
+    """
+    Turn the complex PAGEREF field holding `instr` into plain result runs.
+    Returns the w:t that now carries the page number (None if left alone).
+    """
+    p = instr.getparent()
+    while p is not None and p.tag != _P:
+        p = p.getparent()
+    if p is None:
+        return None
+    runs = list(p.iter(_R))
+    i = runs.index(instr.getparent())
+    begin = i - 1
+    while begin >= 0 and _fld_type(runs[begin]) != "begin":
+        begin -= 1
+    if begin < 0:
+        return None
+    depth, sep, end = 0, None, None
+    for j in range(begin, len(runs)):
+        kind = _fld_type(runs[j])
+        if kind == "begin":
+            depth += 1
+        elif kind == "separate" and depth == 1 and sep is None:
+            sep = j
+        elif kind == "end":
+            depth -= 1
+            if depth == 0:
+                end = j
+                break
+    if end is None:
+        return None
+
+    result = runs[sep + 1:end] if sep is not None else []
+    t_out = None
+    for r in result:
+        for t in r.iter(_T):
+            if t_out is None:
+                t_out = t
+            else:
+                t.text = ""
+    if t_out is None:
+        r = etree.Element(_R)
+        t_out = etree.SubElement(r, _T)
+        runs[end].addprevious(r)
+    code = runs[begin:sep + 1] + [runs[end]] if sep is not None else runs[begin:end + 1]
+    for r in code:
+        r.getparent().remove(r)
+    return t_out
+
+
+def _literal_fldsimple(fld) -> etree._Element:
+    t_out = None
+    for t in fld.iter(_T):
+        if t_out is None:
+            t_out = t
+        else:
+            t.text = ""
+    if t_out is None:
+        r = etree.SubElement(fld, _R)
+        t_out = etree.SubElement(r, _T)
+    for child in list(fld):
+        fld.addprevious(child)
+    fld.getparent().remove(fld)
+    return t_out
+
+
+class _Chunk:
+    def __init__(self, index: int, blocks: list, sectpr, front: bool):
+        self.index = index
+        self.blocks = blocks
+        self.sectpr = sectpr
+        self.front = front                      # the template's earlier sections
+        self.set_start = False                  # write w:pgNumType w:start
+        self.start = 1
+        self.est_pages = max(1, sum(_weight(b) for b in blocks) // CHARS_PER_PAGE)
+        self.bookmarks: Dict[str, str] = {}     # name → text of its paragraph
+        self.fields: List[Tuple[etree._Element, str]] = []   # literal PAGEREF w:t, bookmark
+        self.links: List[Tuple[str, str]] = []  # rel id, bookmark
+        self.pages: Optional[int] = None
+        self.anchors: Dict[str, Tuple[int, Optional[float]]] = {}   # bookmark → page index, top
+        self.docx: Optional[Path] = None
+        self.pdf: Optional[Path] = None
+        self.rendered = None
+
+        for bm in (b for block in blocks for b in block.iter(_BOOKMARK)):
+            p = bm.getparent()
+            self.bookmarks[bm.get(qn("w:name"))] = " ".join(_text(p).split()) if p is not None and p.tag == _P else ""
+
+    def key(self):
+        return self.start if self.set_start else None, tuple(t.text for t, _ in self.fields)
+
+
+class _SectionPlan:
+    """The parsed document split into chunks, plus everything needed to write them out."""
+
+    def __init__(self, src: zipfile.ZipFile, doc_xml: bytes, workers: int):
+        parser = etree.XMLParser(resolve_entities=False, huge_tree=True)
+        self.root = etree.fromstring(doc_xml, parser)
+        self.body = self.root.find(qn("w:body"))
+        try:
+            self.rels = etree.fromstring(src.read(DOCUMENT_RELS), parser)
+        except KeyError:
+            self.rels = None
+        self.chunks: List[_Chunk] = []
+        self.main_chunks = 0
+        self.page_start: Optional[int] = None
+
+        blocks = list(self.body)
+        for b in blocks:
+            self.body.remove(b)
+        if not blocks or blocks[-1].tag != _SECTPR:
+            return
+        final = blocks.pop()
+        pg = final.find(_PGNUMTYPE)
+        if pg is not None and pg.get(qn("w:start"), "").isdigit():
+            self.page_start = int(pg.get(qn("w:start")))
+
+        # Everything up to the last inner section break keeps its own sections
+        front_end = 0
+        for i, b in enumerate(blocks):
+            if b.tag == _P and b.find(_PPR + "/" + _SECTPR) is not None:
+                front_end = i + 1
+        if front_end:
+            last = blocks[front_end - 1]
+            front_sectpr = last.find(_PPR + "/" + _SECTPR)
+            front_sectpr.getparent().remove(front_sectpr)
+            front = blocks[:front_end]
+            if _is_empty_paragraph(last):
+                front.pop()
+            self.chunks.append(_Chunk(0, front, front_sectpr, front=True))
+
+        # The front chunk is short; it takes a worker of its own all the same
+        n_main = max(2, workers - len(self.chunks))
+        h1 = _heading1_ids(src)
+        main = blocks[front_end:]
+        weights = [_weight(b) for b in main]
+        target = max(1, sum(weights) // n_main)
+        cuts, acc = [0], 0
+        for i, (b, w) in enumerate(zip(main, weights)):
+            if (i and acc >= target * len(cuts) and len(cuts) < n_main
+                    and _is_heading1(b, h1)):
+                cuts.append(i)
+            acc += w
+        cuts.append(len(main))
+        for n, (lo, hi) in enumerate(zip(cuts, cuts[1:])):
+            chunk = _Chunk(len(self.chunks), main[lo:hi], deepcopy(final), front=False)
+            if n:
+                chunk.set_start = True
+                # Only the section's real first page gets the "first page" header
+                for tp in chunk.sectpr.findall(qn("w:titlePg")):
+                    chunk.sectpr.remove(tp)
+            self.chunks.append(chunk)
+
+        self.main_chunks = len(cuts) - 1
+        self.owner = {name: c for c in self.chunks for name in c.bookmarks}
+        self.targets: Set[str] = set()
+        self._rewrite_xrefs()
+        self._image_members = self._unshared_images(src)
+        self.update()
+
+    # ---------- references between chunks ----------
+    def _foreign(self, chunk: _Chunk, name: Optional[str]) -> bool:
+        owner = self.owner.get(name or "")
+        return owner is not None and owner is not chunk
+
+    def _rewrite_xrefs(self) -> None:
+        for c in self.chunks:
+            for block in c.blocks:
+                for link in list(block.iter(_HYPERLINK)):
+                    name = link.get(qn("w:anchor"))
+                    if self._foreign(c, name) and self.rels is not None:
+                        rid = f"rIdXref{len(c.links) + 1}"
+                        del link.attrib[qn("w:anchor")]
+                        link.set(_R_ATTRS[0], rid)
+                        c.links.append((rid, name))
+                        self.targets.add(name)
+                for instr in list(block.iter(_INSTR)):
+                    m = _PAGEREF.match(instr.text or "")
+                    if m and self._foreign(c, m.group(1)):
+                        t = _literal_pageref(instr)
+                        if t is not None:
+                            c.fields.append((t, m.group(1)))
+                            self.targets.add(m.group(1))
+                for fld in list(block.iter(_FLDSIMPLE)):
+                    m = _PAGEREF.match(fld.get(qn("w:instr"), ""))
+                    if m and self._foreign(c, m.group(1)):
+                        c.fields.append((_literal_fldsimple(fld), m.group(1)))
+                        self.targets.add(m.group(1))
+
+    def update(self) -> None:
+        """Page starts from the page counts known so far (estimates otherwise)."""
+        page = 1
+        for c in self.chunks:
+            if not c.front and not c.set_start and self.page_start is not None:
+                page = self.page_start
+            c.start = page
+            page += c.pages if c.pages is not None else c.est_pages
+        for c in self.chunks:
+            for t, name in c.fields:
+                owner = self.owner[name]
+                if name in owner.anchors:
+                    t.text = str(owner.start + owner.anchors[name][0])
+
+    def pending(self) -> List[_Chunk]:
+        return [c for c in self.chunks if c.rendered != c.key()]
+
+    # ---------- chunk files ----------
+    def _unshared_images(self, src: zipfile.ZipFile) -> Dict[str, str]:
+        """rId → media member for document images no other part refers to."""
+        if self.rels is None:
+            return {}
+        elsewhere = set()
+        for name in src.namelist():
+            if name.endswith(".rels") and name != DOCUMENT_RELS:
+                base = posixpath.dirname(posixpath.dirname(name))
+                for rel in etree.fromstring(src.read(name)).iter(f"{{{_REL_NS}}}Relationship"):
+                    elsewhere.add(posixpath.normpath(posixpath.join(base, rel.get("Target", ""))))
+        images = {}
+        for rel in self.rels.iter(f"{{{_REL_NS}}}Relationship"):
+            if rel.get("Type") == _RT_IMAGE and rel.get("TargetMode") != "External":
+                member = posixpath.normpath(posixpath.join("word", rel.get("Target", "")))
+                if member not in elsewhere:
+                    images[rel.get("Id")] = member
+        return images
+
+    def _chunk_rels(self, c: _Chunk) -> Tuple[Optional[bytes], Set[str]]:
+        """The chunk's document rels (None = unchanged) and the media members it can drop."""
+        if self.rels is None:
+            return None, set()
+        used = {el.get(a) for b in c.blocks for el in b.iter() for a in _R_ATTRS if el.get(a)}
+        unused = {rid for rid in self._image_members if rid not in used}
+        if not unused and not c.links:
+            return None, set()
+        rels = deepcopy(self.rels)
+        for rel in list(rels):
+            if rel.get("Id") in unused:
+                rels.remove(rel)
+        for rid, name in c.links:
+            etree.SubElement(rels, f"{{{_REL_NS}}}Relationship", Id=rid, Type=_RT_HYPERLINK,
+                             Target=XREF_SCHEME + name, TargetMode="External")
+        drop = {self._image_members[rid] for rid in unused}
+        # Several rIds may share one media file
+        drop -= {self._image_members[rid] for rid in self._image_members if rid not in unused}
+        return etree.tostring(rels, xml_declaration=True, encoding="UTF-8", standalone=True), drop
+
+    def write(self, src: zipfile.ZipFile, c: _Chunk, work: Path) -> None:
+        if c.set_start:
+            _set_page_start(c.sectpr, c.start)
+        for b in c.blocks:
+            self.body.append(b)
+        self.body.append(c.sectpr)
+        try:
+            doc_xml = etree.tostring(self.root, xml_declaration=True, encoding="UTF-8", standalone=True)
+        finally:
+            for b in list(self.body):
+                self.body.remove(b)
+        rels, drop = self._chunk_rels(c)
+
+        c.docx = work / f"chunk_{c.index:02d}.docx"
+        c.pdf = work / f"chunk_{c.index:02d}.pdf"
+        with zipfile.ZipFile(c.docx, "w", zipfile.ZIP_DEFLATED) as dst:
+            for info in src.infolist():
+                name = info.filename
+                if name in drop:
+                    continue
+                if name == DOCUMENT_PART:
+                    dst.writestr(_entry(name), doc_xml)
+                elif name == DOCUMENT_RELS and rels is not None:
+                    dst.writestr(_entry(name), rels)
+                elif not _copy_raw_member(src, dst, name):
+                    dst.writestr(_entry(name), src.read(name))
+        c.rendered = c.key()
+
+    # ---------- chunk PDFs ----------
+    def read_pdf(self, c: _Chunk) -> None:
+        from pypdf import PdfReader
+        reader = PdfReader(str(c.pdf))
+        c.pages = len(reader.pages)
+        wanted = {n for n in self.targets if self.owner[n] is c}
+        c.anchors = {}
+        for name, dest in reader.named_destinations.items():
+            if name in wanted:
+                top = dest.top if isinstance(dest.top, (int, float)) else None
+                c.anchors[name] = (reader.get_destination_page_number(dest), top)
+        # Without named destinations (older LibreOffice), headings still show up in the outline
+        missing = {c.bookmarks[n]: n for n in wanted - set(c.anchors) if c.bookmarks.get(n)}
+        if missing:
+            for title, page in _flat_outline(reader, reader.outline):
+                name = missing.pop(" ".join(title.split()), None)
+                if name:
+                    c.anchors[name] = (page, None)
+
+
+def _flat_outline(reader, items) -> List[Tuple[str, int]]:
+    out = []
+    for item in items:
+        if isinstance(item, list):
+            out.extend(_flat_outline(reader, item))
+        else:
+            try:
+                out.append((str(item.title), reader.get_destination_page_number(item)))
+            except Exception:
+                pass
+    return out
+
+
+def _concatenate(plan: _SectionPlan, pdf_path: Path) -> int:
+    """Join the chunk PDFs, re-point links between chunks; returns the page count."""
+    from pypdf import PdfReader, PdfWriter
+    from pypdf.generic import ArrayObject, FloatObject, NameObject, NullObject
+
+    writer = PdfWriter()
+    offsets = {}
+    for c in plan.chunks:
+        offsets[c.index] = len(writer.pages)
+        writer.append(str(c.pdf), import_outline=True)
+    meta = PdfReader(str(plan.chunks[0].pdf)).metadata
+    if meta:
+        writer.add_metadata({k: v for k, v in meta.items() if isinstance(v, str)})
+
+    for page in writer.pages:
+        annots = page.get("/Annots")
+        for ref in (annots.get_object() if annots is not None else []):
+            annot = ref.get_object()
+            action = annot.get("/A")
+            uri = action.get_object().get("/URI") if action is not None else None
+            if not isinstance(uri, str) or not uri.startswith(XREF_SCHEME):
+                continue
+            name = uri[len(XREF_SCHEME):]
+            owner = plan.owner.get(name)
+            del annot[NameObject("/A")]
+            if owner is None or name not in owner.anchors:
+                continue
+            idx, top = owner.anchors[name]
+            target = writer.pages[offsets[owner.index] + idx].indirect_reference
+            if top is None:
+                annot[NameObject("/Dest")] = ArrayObject([target, NameObject("/Fit")])
+            else:
+                annot[NameObject("/Dest")] = ArrayObject(
+                    [target, NameObject("/XYZ"), NullObject(), FloatObject(top), NullObject()])
+
+    tmp = pdf_path.with_name(pdf_path.stem + ".sections.pdf")
+    with tmp.open("wb") as f:
+        writer.write(f)
+    os.replace(tmp, pdf_path)
+    return len(writer.pages)
+
+
+def _render(c: _Chunk, timeout_s: int, cancel=None) -> Optional[str]:
+    with lo_worker_profile() as profile:
+        err = _convert_with_libreoffice(c.docx, c.pdf, timeout_s=timeout_s,
+                                        profile=profile, export_filter=EXPORT_FILTER, cancel=cancel)
+    return f"chunk {c.index}: {err}" if err else None
+
+
+def docx_to_pdf_sections(docx: Path | str, pdf: Path | str, workers: Optional[int] = None,
+                         timeout_s: int = 600, cancel=None) -> dict:
+    """
+    Convert DOCX -> PDF with the document split into chunks rendered side by side.
+
+    Returns stats: mode ("sections" or "serial"), chunks, workers, passes,
+    renders, pages, seconds, reason (why it fell back to serial) and error
+    (None on success; converters.CANCELLED once `cancel` is set, with every
+    chunk's soffice killed).
+    """
+    docx_path, pdf_path = Path(docx), Path(pdf)
+    workers = max(1, min(workers or os.cpu_count() or 2, MAX_WORKERS))
+    stats = {"mode": "sections", "chunks": 0, "workers": workers, "passes": 0,
+             "renders": 0, "pages": 0, "seconds": 0.0, "reason": None, "error": None}
+    t0 = time.perf_counter()
+
+    def serial(reason: str) -> dict:
+        print(f"📄 Section-parallel PDF not used ({reason}); converting in one piece")
+        stats.update(mode="serial", reason=reason, error=docx_to_pdf(docx_path, pdf_path, cancel=cancel))
+        stats["seconds"] = round(time.perf_counter() - t0, 2)
+        return stats
+
+    if not docx_path.exists():
+        stats["error"] = f"DOCX file not found: {docx_path}"
+        return stats
+    detect_pdf_engine()
+    if _DETECTED.get("engine") != "libreoffice":
+        return serial("engine is not LibreOffice")
+    if workers < 2:
+        return serial("one worker")
+    try:
+        import pypdf  # noqa: F401
+    except Exception:
+        return serial("pypdf is not installed")
+
+    pdf_path.parent.mkdir(parents=True, exist_ok=True)
+    work = Path(tempfile.mkdtemp(prefix="pdf_sections_", dir=pdf_path.parent))
+    try:
+        with zipfile.ZipFile(docx_path) as src:
+            try:
+                doc_xml = src.read(DOCUMENT_PART)
+            except KeyError:
+                return serial(f"no {DOCUMENT_PART}")
+            parts = [doc_xml] + [src.read(n) for n in src.namelist()
+                                 if re.match(r"word/(header|footer)\d*\.xml$", n)]
+            if any(_PAGE_TOTALS.search(x) for x in parts):
+                return serial("NUMPAGES/SECTIONPAGES fields")
+            plan = _SectionPlan(src, doc_xml, workers)
+            if plan.main_chunks < 2:
+                return serial("fewer than two Heading 1 chunks")
+            stats["chunks"] = len(plan.chunks)
+
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pdf-section") as pool:
+                while stats["passes"] < MAX_PASSES:
+                    todo = plan.pending()
+                    if not todo:
+                        break
+                    for c in todo:
+                        plan.write(src, c, work)
+                    errors = [e for e in pool.map(lambda c: _render(c, timeout_s, cancel), todo) if e]
+                    stats["passes"] += 1
+                    stats["renders"] += len(todo)
+                    if cancel is not None and cancel.is_set():
+                        stats["error"] = CANCELLED
+                        return stats
+                    if errors:
+                        stats["error"] = "; ".join(errors)
+                        return stats
+                    for c in todo:
+                        plan.read_pdf(c)
+                    plan.update()
+                if plan.pending():
+                    print(f"⚠️ Page numbers still moving after {MAX_PASSES} passes; keeping the last render")
+
+        stats["pages"] = _concatenate(plan, pdf_path)
+    except Exception as e:
+        stats["error"] = f"Section-parallel PDF failed: {e!s}"
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    stats["seconds"] = round(time.perf_counter() - t0, 2)
+    if stats["error"] is None:
+        print(f"📄 PDF from {stats['chunks']} chunks on {workers} workers: {stats['pages']} pages, "
+              f"{stats['renders']} renders in {stats['passes']} pass(es), {stats['seconds']}s")
+    return stats
@@ -0,0 +1,168 @@
+# render_pool.py
+"""
+Warm process pool for the CPU-bound stages of a conversion (Markdown render,
+template merge), so concurrent requests stop taking turns on one GIL.
+
+Flask threads call RenderPool.call(fn, *args, cancel=event, **kwargs) with a
+module-level function (pandoc_render.md_to_docx, merge.merge_from_any); it
+runs in a worker process and its return value comes back pickled. Inputs and
+outputs stay on disk, so only paths and the stats dict cross the process
+boundary. Each worker is spawned once and keeps its caches for its lifetime:
+
+  • the initializer parses the given templates into merge's template cache
+    and builds parser's global image index;
+  • parser's image-width cache then fills up as requests come in.
+
+Cancellation can't pass a threading.Event between processes: while the call
+is waiting, a set event touches a flag file next to the output and the worker
+sees it through the same is_set() check_cancel uses, so the render/merge
+stops at its next checkpoint and Cancelled is re-raised in the caller.
+
+Size it with "RENDER_PROCESSES" in config.json or DOC_COMPOSER_RENDER_PROCESSES
+(default: one per CPU on multi-core machines; 0 keeps everything in-process,
+as before). Entry scripts must keep their `if __name__ == "__main__"` guard:
+spawned workers re-import the main module.
+"""
+from __future__ import annotations
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Callable, Optional, Sequence
+
+_POLL_S = 0.2
+
+
+class _FlagCancel:
+    """Worker-side stand-in for the caller's threading.Event: set once the flag file exists."""
+
+    def __init__(self, flag: str, every_s: float = 0.1):
+        self.flag = flag
+        self.every_s = every_s
+        self._next = 0.0
+        self._set = False
+
+    def is_set(self) -> bool:
+        # check_cancel runs once per Markdown line; stat at most every every_s
+        now = time.monotonic()
+        if not self._set and now >= self._next:
+            self._next = now + self.every_s
+            self._set = os.path.exists(self.flag)
+        return self._set
+
+
+# ===================== WORKER SIDE =====================
+
+def _init_worker(templates: Sequence[str]) -> None:
+    from merge import preload_template
+    from parser import build_image_index
+
+    for tpl in templates:
+        try:
+            preload_template(tpl)
+        except Exception as e:
+            print(f"⚠️ Render worker {os.getpid()}: template preload failed ({tpl}):", e)
+    build_image_index()
+
+
+def _invoke(fn: Callable[..., Any], args: tuple, kwargs: dict, flag: Optional[str]) -> Any:
+    if flag is not None:
+        kwargs["cancel"] = _FlagCancel(flag)
+    return fn(*args, **kwargs)
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+# ===================== CALLER SIDE =====================
+
+class RenderPool:
+    def __init__(self, processes: int, templates: Sequence[str] = ()):
+        self.processes = processes
+        self.templates = [str(t) for t in templates]
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a process full of server threads isn't safe, and it's what Windows does anyway
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.templates,),
+                )
+            return self._executor
+
+    def start(self) -> int:
+        """Spawn the workers now rather than on the first request; returns their count."""
+        # A spawn-context pool starts all of its processes on the first submit
+        pool = self._pool()
+        for f in [pool.submit(_ping) for _ in range(self.processes)]:
+            f.result()
+        return self.processes
+
+    def call(self, fn: Callable[..., Any], *args, cancel: Optional[threading.Event] = None,
+             cancel_flag: Optional[Path] = None, **kwargs) -> Any:
+        """
+        fn(*args, cancel=…, **kwargs) in a worker; blocks until it returns.
+        cancel_flag is where a cancellation is signalled (required with cancel).
+        """
+        flag = str(cancel_flag) if cancel is not None and cancel_flag is not None else None
+        try:
+            future = self._pool().submit(_invoke, fn, args, kwargs, flag)
+        except BrokenProcessPool:
+            self._reset()
+            future = self._pool().submit(_invoke, fn, args, kwargs, flag)
+        try:
+            while True:
+                try:
+                    return future.result(timeout=_POLL_S)
+                except FutureTimeout:
+                    if flag is not None and cancel.is_set() and not os.path.exists(flag):
+                        Path(flag).touch()
+        except BrokenProcessPool:
+            # A worker died mid-job (killed, out of memory); the next call gets a fresh pool
+            self._reset()
+            raise RuntimeError("Render worker process died; please retry.") from None
+        finally:
+            if flag is not None:
+                Path(flag).unlink(missing_ok=True)
+
+    def _reset(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+
+def pool_from_config(config_file: Optional[Path] = None, templates: Sequence[str] = ()) -> Optional[RenderPool]:
+    """DOC_COMPOSER_RENDER_PROCESSES, else "RENDER_PROCESSES" from config.json, else one per CPU; None for 0."""
+    value = os.environ.get("DOC_COMPOSER_RENDER_PROCESSES", "")
+    if not value and config_file is not None and config_file.exists():
+        try:
+            value = str(json.loads(config_file.read_text(encoding="utf-8")).get("RENDER_PROCESSES", ""))
+        except Exception as e:
+            print("⚠️ Failed to read RENDER_PROCESSES from config.json:", e)
+    cpus = os.cpu_count() or 1
+    try:
+        # A single core gains nothing from a pool but the hand-off cost
+        processes = int(value) if value.strip() else (cpus if cpus > 1 else 0)
+    except ValueError:
+        print(f"⚠️ Invalid render process count {value!r}; rendering in-process")
+        return None
+    if processes <= 0:
+        return None
+    return RenderPool(processes, templates)
@@ -6,10 +6,14 @@ Usage:
   - python run_server.py        # launches on an available port and opens browser
   - python run_server.py --port 5055  # force port
   - python run_server.py --host 0.0.0.0 --port 8080
+  - python run_server.py --workers 4 --port 8080   # pre-forked production mode (POSIX, gunicorn)
 """
 
 from __future__ import annotations
 import argparse
+import gc
+import os
+import shutil
 import socket
 import sys
 import threading
@@ -22,7 +26,7 @@ from pathlib import Path
 # app.py must expose `app` (Flask instance)
 try:
     # prefer package-style import if your project is a package; otherwise this will import app.py
-    from app import app  # type: ignore
+    from app import app, warm_up  # type: ignore
 except Exception as e:
     print("ERROR: Failed to import app from app.py:", e)
     sys.exit(1)
@@ -82,12 +86,119 @@ def open_browser_when_up(url: str, timeout: float = 6.0):
         print("Hint: open this URL in your browser:", url)
 
 
+# ===================== PRE-FORK PRODUCTION MODE =====================
+
+LO_PROFILE_ROOT = Path(__file__).resolve().parent / ".lo_profiles"
+
+
+def _current_rss_mb() -> float | None:
+    """Resident set size of this process right now (Linux), else its peak."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except Exception:
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except Exception:
+        return None
+
+
+def run_prefork(host: str, port: int, workers: int, threads: int,
+                max_requests: int, max_rss_mb: int, graceful_timeout: int, warmup: bool) -> None:
+    """
+    Load the app and warm its caches once in the master, then fork workers that
+    share that state copy-on-write. Workers are recycled after `max_requests`
+    (with jitter) or once their RSS passes `max_rss_mb`, and SIGTERM lets
+    in-flight conversions finish within `graceful_timeout`.
+    """
+    if sys.platform.startswith("win"):
+        print("ERROR: --workers needs a POSIX system (gunicorn); use the default threaded mode on Windows.")
+        sys.exit(1)
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        print("ERROR: gunicorn is not installed (pip install -r requirements.txt).")
+        sys.exit(1)
+
+    import app as app_module
+    import converters
+    from jobs import Limiter
+
+    # Every worker gets the limiter sizes below; the box-wide ceiling is workers × threads
+    app_module.RENDER_LIMIT = Limiter("render", slots=threads, max_waiting=threads * 2)
+    app_module.PDF_LIMIT = Limiter("pdf", slots=1, max_waiting=threads * 2)
+    # Progress streams may not take every thread from the requests they report on
+    app_module.SSE_LIMIT = Limiter("progress stream", slots=max(1, threads - 1), max_waiting=0)
+    # The pre-forked workers already spread conversions over the cores; a render
+    # pool per worker would only oversubscribe them
+    app_module.RENDER_POOL = None
+
+    base_profile = LO_PROFILE_ROOT / "base"
+    converters.set_lo_profile(base_profile)
+    if warmup:
+        app_module.warm_up()
+    # Keep warmed objects out of the GC's generations so collections in the
+    # workers don't touch (and un-share) their pages.
+    gc.collect()
+    gc.freeze()
+
+    def post_fork(server, worker):
+        # soffice instances must not share a profile; start each worker from the warmed one
+        converters.set_lo_profile(LO_PROFILE_ROOT / f"worker-{worker.pid}", seed=base_profile)
+
+    def post_request(worker, req, environ, resp):
+        rss = _current_rss_mb()
+        if rss is not None and rss > max_rss_mb and worker.alive:
+            worker.log.info("worker %s RSS %.0f MB > %s MB, recycling after this request", worker.pid, rss, max_rss_mb)
+            worker.alive = False
+
+    def worker_exit(server, worker):
+        shutil.rmtree(LO_PROFILE_ROOT / f"worker-{worker.pid}", ignore_errors=True)
+
+    class PreforkServer(BaseApplication):
+        def load_config(self):
+            options = {
+                "bind": f"{host}:{port}",
+                "workers": workers,
+                "worker_class": "gthread",
+                "threads": threads,
+                "preload_app": True,
+                "max_requests": max_requests,
+                "max_requests_jitter": max(1, max_requests // 10),
+                "graceful_timeout": graceful_timeout,
+                # a single conversion may legitimately run for minutes
+                "timeout": max(graceful_timeout, 300),
+                "post_fork": post_fork,
+                "post_request": post_request,
+                "worker_exit": worker_exit,
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app_module.app
+
+    PreforkServer().run()
+
+
 def main():
     parser = argparse.ArgumentParser(description="Start Document Composer (click-to-run).")
     parser.add_argument("--host", default="0.0.0.0", help="Host to bind (default 0.0.0.0)")
     parser.add_argument("--port", type=int, default=None, help="Port (default: auto-find 5000-5999)")
     parser.add_argument("--prefer-port", type=int, default=5055, help="Prefer this port when auto-finding")
     parser.add_argument("--no-open", action="store_true", help="Do not open browser automatically")
+    parser.add_argument("--no-warmup", action="store_true", help="Skip the start-up warm-up (first request will be slower)")
+    parser.add_argument("--workers", type=int, default=0, help="Pre-fork N worker processes (production mode, POSIX only)")
+    parser.add_argument("--threads", type=int, default=2, help="Threads per worker in --workers mode")
+    parser.add_argument("--max-requests", type=int, default=200, help="Recycle a worker after this many requests")
+    parser.add_argument("--max-rss-mb", type=int, default=1536, help="Recycle a worker once its RSS exceeds this")
+    parser.add_argument("--graceful-timeout", type=int, default=240, help="Seconds in-flight conversions get on shutdown")
+    parser.add_argument("--x-sendfile", action="store_true",
+                        help="Let a fronting nginx/Apache serve outputs (X-Sendfile) instead of the app")
     args = parser.parse_args()
 
     # choose port
@@ -118,6 +229,19 @@ def main():
 
     url_to_open = f"http://127.0.0.1:{port}/"
 
+    if args.x_sendfile:
+        app.config["USE_X_SENDFILE"] = True
+
+    if args.workers > 0:
+        print(f"Production mode: {args.workers} pre-forked worker(s) × {args.threads} thread(s)")
+        run_prefork(host, port, args.workers, args.threads, args.max_requests,
+                    args.max_rss_mb, args.graceful_timeout, warmup=not args.no_warmup)
+        return
+
+    # Warm caches in the background; /healthz/ready answers 503 until this is done
+    if not args.no_warmup:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
     if not args.no_open:
         # open browser in separate thread so it doesn't block server thread
         t = threading.Thread(target=open_browser_when_up, args=(url_to_open,), daemon=True)
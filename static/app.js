@@ -137,20 +137,120 @@
 
   // If server provided a message, show it as a warning toast
   try {
-    if (window._server_message) {
-      const msg = window._server_message;
-      if (msg) {
-        toast(msg, { type: "warn", timeout: 8000 });
-      }
+    const msg =
+      window._server_message ||
+      (document.body && document.body.dataset.serverMessage);
+    if (msg) {
+      toast(msg, { type: "warn", timeout: 8000 });
     }
   } catch (e) {
     console.warn("Toast show failed:", e);
   }
 
+  // --------------------
+  // Live progress: server-sent events from /progress/<id>
+  // --------------------
+  function plural(n, word) {
+    return `${n} ${word}${n === 1 ? "" : "s"}`;
+  }
+
+  function describeProgress(ev) {
+    const c = ev.counts || {};
+    switch (ev.stage) {
+      case "uploaded":
+        return `Received ${plural(c.files || 0, "file")}.`;
+      case "queued":
+        return "Queued for background conversion…";
+      case "rendering":
+        return `Rendering ${plural(c.sections || 0, "section")}…`;
+      case "merging":
+        return "Merging into the template…";
+      case "merged":
+        return `Merged — ${plural(c.images_inserted || 0, "image")} inserted.`;
+      case "converting":
+        return "Converting to PDF…";
+      case "converted":
+        return c.pdf
+          ? `PDF ready${c.pages ? ` (${plural(c.pages, "page")})` : ""}.`
+          : "PDF conversion failed.";
+      case "done":
+        return "Done — loading results…";
+      case "failed":
+        return `Failed: ${ev.error || "conversion error"}`;
+      case "cancelling":
+        return "Cancelling…";
+      case "cancelled":
+        return "Conversion cancelled.";
+      default:
+        return "Working…";
+    }
+  }
+
+  // Calls onEvent for each stage until the job ends; returns a stop function
+  function followProgress(id, onEvent) {
+    if (!window.EventSource) return () => {};
+    const es = new EventSource(`/progress/${encodeURIComponent(id)}`);
+    es.addEventListener("progress", (e) => {
+      let ev;
+      try {
+        ev = JSON.parse(e.data);
+      } catch (err) {
+        return;
+      }
+      onEvent(ev);
+      if (ev.state !== "running") es.close();
+    });
+    return () => es.close();
+  }
+
+  function toHex(buffer) {
+    return Array.from(new Uint8Array(buffer), (b) =>
+      b.toString(16).padStart(2, "0")
+    ).join("");
+  }
+
+  // --------------------
+  // Background jobs: follow progress, poll until the result page is ready
+  // --------------------
+  function pollBackgroundJob(jobUrl) {
+    let note = null;
+    followProgress(jobUrl.split("/").pop(), (ev) => {
+      if (ev.state !== "running") {
+        window.location.href = jobUrl;
+        return;
+      }
+      note && note.close();
+      note = toast(describeProgress(ev), { type: "info", timeout: 120000 });
+    });
+    // Safety net if the event stream is unavailable (proxies, old browsers)
+    const every = window.EventSource ? 15000 : 3000;
+    const tick = async () => {
+      try {
+        const resp = await fetch(`${jobUrl}/status`, { cache: "no-store" });
+        if (resp.ok) {
+          const st = await resp.json();
+          if (st.state === "done" || st.state === "failed") {
+            window.location.href = jobUrl;
+            return;
+          }
+        }
+      } catch (e) {}
+      setTimeout(tick, every);
+    };
+    setTimeout(tick, every);
+  }
+
+  try {
+    const jobUrl = document.body && document.body.dataset.jobUrl;
+    if (jobUrl) pollBackgroundJob(jobUrl);
+  } catch (e) {}
+
   // --------------------
   // Refs
   // --------------------
   const progress = document.getElementById("progressOverlay");
+  const progressSub = progress && progress.querySelector(".loader-text .sub");
+  const cancelConvertBtn = document.getElementById("cancelConvert");
   const convertBtn = document.getElementById("convertBtn");
   const form = document.getElementById("convertForm");
 
@@ -398,14 +498,32 @@
     const ext = (name || "").split(".").pop().toLowerCase();
     if (["md", "markdown", "mdx"].includes(ext)) return "ti ti-markdown";
     if (["doc", "docx"].includes(ext)) return "ti ti-file-type-docx";
+    if (ext === "zip") return "ti ti-file-zip";
     if (["pdf"].includes(ext)) return "ti ti-file-type-pdf";
     if (["png", "jpg", "jpeg", "gif", "bmp", "tiff", "svg"].includes(ext))
       return "ti ti-image";
     return "ti ti-file-text";
   }
 
+  // A .zip (sections + images) is uploaded on its own and has no section cap
+  const isArchive = (f) => /\.zip$/i.test(f.name);
+
   function addMdFiles(list) {
-    const incoming = Array.from(list || []).filter(
+    const all = Array.from(list || []);
+    const archive = all.find(isArchive);
+    if (archive) {
+      if (all.length > 1 || mdFiles.length) {
+        showClientWarning(
+          "A .zip archive is uploaded on its own — other sections were removed."
+        );
+      }
+      mdFiles = [archive];
+      renderAllMd();
+      return;
+    }
+    if (mdFiles.some(isArchive)) mdFiles = [];
+
+    const incoming = all.filter(
       (f) => /\.(m(d|arkdown|dx))$/i.test(f.name) || /\.mdx$/i.test(f.name)
     );
     if (!incoming.length) return;
@@ -460,7 +578,7 @@
       const arr = Array.from(comboInput.files || []);
       if (!arr.length) return;
       const md = arr.filter(
-        (f) => /\.(m(d|arkdown|dx))$/i.test(f.name) || /\.mdx$/i.test(f.name)
+        (f) => isArchive(f) || /\.(m(d|arkdown|dx))$/i.test(f.name)
       );
       const dx = arr.filter((f) => /\.docx$/i.test(f.name));
       if (md.length) addMdFiles(md);
@@ -478,7 +596,7 @@
       dz.classList.remove("active");
       const arr = Array.from(e.dataTransfer.files || []);
       const md = arr.filter(
-        (f) => /\.(m(d|arkdown|dx))$/i.test(f.name) || /\.mdx$/i.test(f.name)
+        (f) => isArchive(f) || /\.(m(d|arkdown|dx))$/i.test(f.name)
       );
       const dx = arr.filter((f) => /\.docx$/i.test(f.name));
       if (md.length) addMdFiles(md);
@@ -539,32 +657,145 @@
 
     showPreviewLoading();
 
-    try {
-      const fd = new FormData();
-      mdFiles.forEach((f) => fd.append("raw_files", f, f.name));
-      fd.append("template_file", tplFile, tplFile.name);
+    // Subscribe before uploading; the server binds this id to the job it starts
+    const progressId = toHex(crypto.getRandomValues(new Uint8Array(16)));
+    const stopProgress = followProgress(progressId, (ev) => {
+      if (progressSub) progressSub.textContent = describeProgress(ev);
+    });
+    const aborter = new AbortController();
+    inflight = { progressId, aborter };
 
-      const imgStyle = document.getElementById("imgStyle");
-      if (imgStyle && imgStyle.checked) {
-        fd.append("img_style", "1");
+    try {
+      // Unchanged files are already on the server: send references instead
+      const files = [tplFile, ...mdFiles];
+      const hashes = await uploadBlobs(files, aborter.signal).catch((err) => {
+        if (aborter.signal.aborted) throw err;
+        console.warn("Blob upload unavailable, sending files:", err);
+        return null;
+      });
+      let resp = await fetch("/convert", {
+        method: "POST",
+        body: buildConvertForm(hashes, progressId),
+        signal: aborter.signal,
+      });
+      // A blob vanished between check and convert: send everything
+      if (resp.status === 409 && hashes && resp.headers.get("Content-Type")?.includes("json")) {
+        resp = await fetch("/convert", {
+          method: "POST",
+          body: buildConvertForm(null, progressId),
+          signal: aborter.signal,
+        });
       }
-
-      const resp = await fetch("/convert", { method: "POST", body: fd });
       const html = await resp.text();
+      stopProgress();
+      inflight = null;
 
       document.open("text/html", "replace");
       document.write(html);
       document.close();
     } catch (err) {
+      stopProgress();
+      inflight = null;
       progress && progress.classList.remove("show");
-      toast("Upload/convert failed: " + (err?.message || err), {
-        type: "error",
-      });
+      if (aborter.signal.aborted) {
+        toast("Conversion cancelled.", { type: "warn" });
+      } else {
+        toast("Upload/convert failed: " + (err?.message || err), {
+          type: "error",
+        });
+      }
       convertBtn.disabled = false;
       convertBtn.classList.remove("is-loading");
     }
   });
 
+  // --------------------
+  // Cancel: tell the server first (it kills the render/soffice and drops the
+  // job's files), then abort the request. Closing the tab does the same.
+  // --------------------
+  let inflight = null; // { progressId, aborter } while a conversion runs
+
+  function cancelUrl(id) {
+    return `/progress/${encodeURIComponent(id)}/cancel`;
+  }
+
+  cancelConvertBtn &&
+    cancelConvertBtn.addEventListener("click", () => {
+      if (!inflight) return;
+      const { progressId, aborter } = inflight;
+      if (progressSub) progressSub.textContent = describeProgress({ stage: "cancelling" });
+      fetch(cancelUrl(progressId), { method: "POST", keepalive: true })
+        .catch(() => {}) // the dropped connection cancels it anyway
+        .finally(() => aborter.abort());
+    });
+
+  window.addEventListener("pagehide", () => {
+    if (inflight && navigator.sendBeacon) navigator.sendBeacon(cancelUrl(inflight.progressId));
+  });
+
+  // --------------------
+  // Content-addressed uploads: hash in the browser, upload only what the
+  // server doesn't have yet (crypto.subtle needs HTTPS or localhost)
+  // --------------------
+  const blobHashes = new WeakMap(); // File → SHA-256 hex, so re-clicks don't re-hash
+
+  async function sha256Hex(file) {
+    if (blobHashes.has(file)) return blobHashes.get(file);
+    const digest = await crypto.subtle.digest("SHA-256", await file.arrayBuffer());
+    const hex = toHex(digest);
+    blobHashes.set(file, hex);
+    return hex;
+  }
+
+  // Resolves to one hash per file once every file is stored server-side
+  async function uploadBlobs(files, signal) {
+    if (!(window.crypto && crypto.subtle)) throw new Error("no crypto.subtle");
+    const hashes = await Promise.all(files.map(sha256Hex));
+    const check = await fetch("/blobs/check", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ hashes }),
+      signal,
+    });
+    if (!check.ok) throw new Error(`blob check failed (${check.status})`);
+    const missing = new Set((await check.json()).missing || []);
+    if (missing.size && progressSub) {
+      progressSub.textContent = `Uploading ${plural(missing.size, "changed file")}…`;
+    }
+    for (const [i, file] of files.entries()) {
+      if (!missing.has(hashes[i])) continue;
+      missing.delete(hashes[i]);
+      const put = await fetch(`/blobs/${hashes[i]}`, { method: "PUT", body: file, signal });
+      if (!put.ok) throw new Error(`upload of ${file.name} failed (${put.status})`);
+    }
+    return hashes;
+  }
+
+  function buildConvertForm(hashes, progressId) {
+    const fd = new FormData();
+    fd.append("progress_id", progressId);
+    if (hashes) {
+      fd.append("template_blob", `${hashes[0]}:${tplFile.name}`);
+      mdFiles.forEach((f, i) => fd.append("raw_blobs", `${hashes[i + 1]}:${f.name}`));
+    } else {
+      mdFiles.forEach((f) => fd.append("raw_files", f, f.name));
+      fd.append("template_file", tplFile, tplFile.name);
+    }
+
+    const pdfOptimize = document.getElementById("pdfOptimize");
+    fd.append("pdf_optimize", pdfOptimize && pdfOptimize.checked ? "1" : "0");
+    const serverToc = document.getElementById("serverToc");
+    fd.append("toc_mode", serverToc && serverToc.checked ? "server" : "field");
+    const compactXml = document.getElementById("compactXml");
+    fd.append("compact", !compactXml || compactXml.checked ? "1" : "0");
+
+    const imgStyle = document.getElementById("imgStyle");
+    if (imgStyle && imgStyle.checked) {
+      fd.append("img_style", "1");
+    }
+    return fd;
+  }
+
   // --------------------
   // PDF button enable/disable logic (uses .btn-disabled class)
   // --------------------
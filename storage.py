@@ -0,0 +1,336 @@
+# storage.py
+"""
+Where uploads, outputs and job state live, so several app nodes behind a load
+balancer see the same files.
+
+Keys are relative POSIX paths — "uploads/<job>/<file>", "outputs/<job>/<file>",
+"outputs/<job>/job.json". Conversions still run on local disk (LibreOffice
+needs real files); finished files are published with put_file().
+
+  • LocalStorage → a directory (the default: the app directory, so keys map to
+                   the historical uploads/ and outputs/ folders and publishing
+                   a workspace file is a no-op)
+  • S3Storage    → any S3-compatible bucket (AWS, MinIO, Ceph RGW …); needs
+                   boto3. Downloads are answered with a presigned redirect.
+
+Both stream: reads hand back a file object, writes spool through a temporary
+file, and the SHA-256 used as the HTTP ETag is computed while the bytes pass
+(S3 keeps it as object metadata, so every node serves the same ETag).
+
+Configured by "STORAGE" in config.json, e.g.
+  {"backend": "s3", "bucket": "docs", "prefix": "composer",
+   "endpoint_url": "http://127.0.0.1:9000", "presign": true, "expires_s": 300}
+or DOC_COMPOSER_STORAGE=s3://bucket/prefix (+ DOC_COMPOSER_S3_ENDPOINT);
+credentials come from the usual AWS environment/config chain.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional
+
+_CHUNK = 1024 * 1024
+# Writes to S3 stay in memory up to this size, then spill to a temp file
+_SPOOL_BYTES = 8 * 1024 * 1024
+
+
+@dataclass
+class StoredObject:
+    size: int
+    etag: str
+    modified: Optional[datetime] = None
+
+
+def check_key(key: str) -> str:
+    """Normalised key; ValueError for anything that could leave the store's root."""
+    if not key or "\\" in key or key.startswith("/") or "\x00" in key:
+        raise ValueError(f"invalid storage key: {key!r}")
+    norm = posixpath.normpath(key)
+    if norm in (".", "..") or norm.startswith("../"):
+        raise ValueError(f"invalid storage key: {key!r}")
+    return norm
+
+
+def _sha256_of(f: BinaryIO) -> str:
+    """Hex SHA-256 of an open file, read in chunks (hashlib.file_digest needs 3.11)."""
+    sha = hashlib.sha256()
+    for chunk in iter(lambda: f.read(_CHUNK), b""):
+        sha.update(chunk)
+    return sha.hexdigest()
+
+
+class Storage:
+    """Interface shared by the backends. Missing keys: stat() → None, open_read() → FileNotFoundError."""
+
+    def open_read(self, key: str) -> BinaryIO:
+        raise NotImplementedError
+
+    @contextmanager
+    def open_write(self, key: str) -> Iterator[BinaryIO]:
+        """Yields a writable file; the object appears (atomically) when the block exits cleanly."""
+        raise NotImplementedError
+        yield
+
+    def put_file(self, key: str, path: Path) -> None:
+        with open(path, "rb") as src, self.open_write(key) as dst:
+            shutil.copyfileobj(src, dst, _CHUNK)
+
+    def put_bytes(self, key: str, data: bytes) -> None:
+        with self.open_write(key) as dst:
+            dst.write(data)
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        try:
+            f = self.open_read(key)
+        except FileNotFoundError:
+            return None
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+    def stat(self, key: str) -> Optional[StoredObject]:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def local_path(self, key: str) -> Optional[Path]:
+        """A file on this node holding the object, if the backend has one (send_file / X-Sendfile)."""
+        return None
+
+    def presigned_url(self, key: str, download_name: str, as_attachment: bool = True,
+                      mimetype: Optional[str] = None) -> Optional[str]:
+        """Short-lived URL the client can fetch the object from directly, if supported."""
+        return None
+
+
+# ===================== LOCAL FILESYSTEM =====================
+
+class LocalStorage(Storage):
+    # Hashes are cached per (path, size, mtime) and computed once per file
+    _ETAG_CACHE_MAX = 512
+
+    def __init__(self, root: Path | str):
+        self.root = Path(root).resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._etags: "OrderedDict[tuple, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        return self.root / check_key(key)
+
+    def open_read(self, key: str) -> BinaryIO:
+        return self._path(key).open("rb")
+
+    @contextmanager
+    def open_write(self, key: str) -> Iterator[BinaryIO]:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                yield f
+            os.replace(tmp, path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+    def put_file(self, key: str, path: Path) -> None:
+        target = self._path(key)
+        try:
+            if target.exists() and os.path.samefile(path, target):
+                return   # the workspace already is the store
+        except OSError:
+            pass
+        super().put_file(key, path)
+
+    def stat(self, key: str) -> Optional[StoredObject]:
+        path = self._path(key)
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        if not path.is_file():
+            return None
+        return StoredObject(size=st.st_size, etag=self._etag(path, st),
+                            modified=datetime.fromtimestamp(st.st_mtime, timezone.utc))
+
+    def _etag(self, path: Path, st: os.stat_result) -> str:
+        cache_key = (str(path), st.st_size, st.st_mtime_ns)
+        with self._lock:
+            etag = self._etags.get(cache_key)
+            if etag is not None:
+                self._etags.move_to_end(cache_key)
+                return etag
+        with path.open("rb") as f:
+            etag = _sha256_of(f)[:32]
+        with self._lock:
+            self._etags[cache_key] = etag
+            while len(self._etags) > self._ETAG_CACHE_MAX:
+                self._etags.popitem(last=False)
+        return etag
+
+    def delete(self, key: str) -> None:
+        self._path(key).unlink(missing_ok=True)
+
+    def local_path(self, key: str) -> Optional[Path]:
+        path = self._path(key)
+        return path if path.is_file() else None
+
+
+# ===================== S3-COMPATIBLE =====================
+
+class _HashingWriter:
+    """File wrapper that hashes what passes through write()."""
+
+    def __init__(self, f):
+        self._f = f
+        self.sha = hashlib.sha256()
+
+    def write(self, data) -> int:
+        self.sha.update(data)
+        return self._f.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+
+class S3Storage(Storage):
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None,
+                 region: Optional[str] = None, presign: bool = True, expires_s: int = 300,
+                 client=None):
+        if client is None:
+            try:
+                import boto3  # noqa: F401
+            except ImportError:
+                raise RuntimeError("S3 storage needs boto3 (pip install boto3)")
+        self._client = client
+        self._client_lock = threading.Lock()
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.presign = presign
+        self.expires_s = expires_s
+
+    @property
+    def client(self):
+        # Created on first use, so pre-forked workers don't share the master's connection pool
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    import boto3
+                    from botocore.config import Config
+                    # Path-style addressing works for MinIO and friends as well as AWS
+                    self._client = boto3.client("s3", endpoint_url=self.endpoint_url, region_name=self.region,
+                                                config=Config(s3={"addressing_style": "path"}))
+        return self._client
+
+    def _key(self, key: str) -> str:
+        key = check_key(key)
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    @staticmethod
+    def _missing(e: Exception) -> bool:
+        code = str(getattr(e, "response", {}).get("Error", {}).get("Code", ""))
+        return code in ("404", "NoSuchKey", "NotFound")
+
+    def open_read(self, key: str) -> BinaryIO:
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(key))["Body"]
+        except Exception as e:
+            if self._missing(e):
+                raise FileNotFoundError(key) from e
+            raise
+
+    @contextmanager
+    def open_write(self, key: str) -> Iterator[BinaryIO]:
+        s3_key = self._key(key)
+        with tempfile.SpooledTemporaryFile(max_size=_SPOOL_BYTES) as spool:
+            writer = _HashingWriter(spool)
+            yield writer
+            spool.seek(0)
+            self._upload(spool, s3_key, writer.sha.hexdigest()[:32], key)
+
+    def put_file(self, key: str, path: Path) -> None:
+        with open(path, "rb") as f:
+            sha = _sha256_of(f)[:32]
+            f.seek(0)
+            self._upload(f, self._key(key), sha, key)
+
+    def _upload(self, fileobj, s3_key: str, sha: str, key: str) -> None:
+        extra = {"Metadata": {"sha256": sha}}
+        ctype = mimetypes.guess_type(key)[0]
+        if ctype:
+            extra["ContentType"] = ctype
+        # upload_fileobj switches to a multipart upload for large files
+        self.client.upload_fileobj(fileobj, self.bucket, s3_key, ExtraArgs=extra)
+
+    def stat(self, key: str) -> Optional[StoredObject]:
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except Exception as e:
+            if self._missing(e):
+                return None
+            raise
+        etag = (head.get("Metadata") or {}).get("sha256") or head.get("ETag", "").strip('"')
+        return StoredObject(size=int(head.get("ContentLength", 0)), etag=etag,
+                            modified=head.get("LastModified"))
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def presigned_url(self, key: str, download_name: str, as_attachment: bool = True,
+                      mimetype: Optional[str] = None) -> Optional[str]:
+        if not self.presign:
+            return None
+        disposition = "attachment" if as_attachment else "inline"
+        params = {
+            "Bucket": self.bucket,
+            "Key": self._key(key),
+            "ResponseContentDisposition": f'{disposition}; filename="{download_name}"',
+        }
+        if mimetype:
+            params["ResponseContentType"] = mimetype
+        return self.client.generate_presigned_url("get_object", Params=params, ExpiresIn=self.expires_s)
+
+
+# ===================== CONFIGURATION =====================
+
+def storage_from_config(base_dir: Path, config_file: Optional[Path] = None) -> Storage:
+    """Build the configured backend; LocalStorage(base_dir) when nothing is set."""
+    conf = {}
+    if config_file is not None and config_file.exists():
+        try:
+            conf = json.loads(config_file.read_text(encoding="utf-8")).get("STORAGE", {}) or {}
+        except Exception as e:
+            print("⚠️ Failed to read STORAGE settings from config.json:", e)
+
+    url = os.environ.get("DOC_COMPOSER_STORAGE", "")
+    if url.startswith("s3://"):
+        bucket, _, prefix = url[len("s3://"):].partition("/")
+        conf = {**conf, "backend": "s3", "bucket": bucket, "prefix": prefix}
+    elif url:
+        conf = {**conf, "backend": "local", "root": url}
+    if os.environ.get("DOC_COMPOSER_S3_ENDPOINT"):
+        conf["endpoint_url"] = os.environ["DOC_COMPOSER_S3_ENDPOINT"]
+
+    if conf.get("backend") == "s3":
+        store = S3Storage(conf["bucket"], prefix=conf.get("prefix", ""),
+                          endpoint_url=conf.get("endpoint_url"), region=conf.get("region"),
+                          presign=conf.get("presign", True), expires_s=int(conf.get("expires_s", 300)))
+        print(f"🗄️ Storage: s3://{store.bucket}/{store.prefix}"
+              + (f" at {conf['endpoint_url']}" if conf.get("endpoint_url") else ""))
+        return store
+    return LocalStorage(conf.get("root") or base_dir)
@@ -0,0 +1,297 @@
+import hashlib
+import io
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+import zipfile
+
+import pytest
+from docx import Document
+
+# Keep conversions in-process: the tests don't need worker processes
+os.environ.setdefault("DOC_COMPOSER_RENDER_PROCESSES", "0")
+
+import app as app_module
+from render_pool import RenderPool
+from storage import LocalStorage
+
+
+@pytest.fixture
+def client():
+    app_module.app.config["TESTING"] = True
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def job_dir():
+    job = f"test-{uuid.uuid4().hex[:8]}"
+    d = app_module.OUTPUT_DIR / job
+    d.mkdir(parents=True)
+    (d / "job.json").write_text('{"state": "done"}', encoding="utf-8")
+    (d / "merged.docx").write_bytes(b"PK\x03\x04 not really a docx")
+    yield job
+    shutil.rmtree(d, ignore_errors=True)
+
+
+def test_outputs_serve_regular_files(client, job_dir):
+    resp = client.get(f"/outputs/{job_dir}/merged.docx")
+    assert resp.status_code == 200
+    assert resp.data.startswith(b"PK")
+
+
+@pytest.mark.parametrize("suffix", ["job.json", "job.json/.", "./job.json", "sub/../job.json", "job.json/",
+                                    "JOB.JSON", "Job.Json/."])
+def test_outputs_never_serve_job_state(client, job_dir, suffix):
+    assert client.get(f"/outputs/{job_dir}/{suffix}").status_code == 404
+    assert client.get(f"/outputs/inline/{job_dir}/{suffix}").status_code == 404
+
+
+def test_outputs_refuse_job_state_in_any_case(client, job_dir):
+    # What a case-insensitive filesystem (Windows, macOS) would hand back for "JOB.JSON"
+    (app_module.OUTPUT_DIR / job_dir / "JOB.JSON").write_text('{"state": "done"}', encoding="utf-8")
+    assert client.get(f"/outputs/{job_dir}/JOB.JSON").status_code == 404
+    assert client.get(f"/outputs/inline/{job_dir}/JOB.JSON").status_code == 404
+
+
+def _convert_form():
+    tpl = (app_module.BASE_DIR / "templates" / "template.docx").read_bytes()
+    return {
+        "template_file": (io.BytesIO(tpl), "template.docx"),
+        "raw_files": [(io.BytesIO(b"# Title\n\nSome text.\n"), "section.md")],
+    }
+
+
+def _job_dirs():
+    return {p.name for root in (app_module.UPLOAD_DIR, app_module.OUTPUT_DIR) for p in root.iterdir() if p.is_dir()}
+
+
+def test_rejected_job_leaves_no_workspace(client, monkeypatch):
+    monkeypatch.setattr(app_module.estimator, "decide", lambda est: ("reject", "too big"))
+    before = _job_dirs()
+    resp = client.post("/convert", data=_convert_form(), content_type="multipart/form-data")
+    assert resp.status_code == 413
+    assert _job_dirs() == before
+
+
+def test_rejected_archive_leaves_no_workspace(client):
+    tpl = (app_module.BASE_DIR / "templates" / "template.docx").read_bytes()
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("book/intro.md", "# Intro\n")
+        zf.writestr("../escape.md", "# Out\n")
+    buf.seek(0)
+    before = _job_dirs()
+    resp = client.post("/convert", data={
+        "template_file": (io.BytesIO(tpl), "template.docx"),
+        "raw_files": [(buf, "book.zip")],
+    }, content_type="multipart/form-data")
+    assert b"Unsafe path" in resp.data
+    assert _job_dirs() == before
+
+
+def test_shed_background_job_leaves_no_workspace(client, monkeypatch):
+    monkeypatch.setattr(app_module.estimator, "decide", lambda est: ("background", "large"))
+
+    def full(*args, **kwargs):
+        raise app_module.Overloaded("background", 30)
+
+    monkeypatch.setattr(app_module.BACKGROUND, "submit", full)
+    before = _job_dirs()
+    resp = client.post("/convert", data=_convert_form(), content_type="multipart/form-data")
+    assert resp.status_code == 503
+    assert resp.headers.get("Retry-After")
+    assert _job_dirs() == before
+
+
+def test_extra_slots_take_only_free_slots():
+    limiter = app_module.Limiter("t", slots=3, max_waiting=2)
+    with limiter.slot():
+        with limiter.extra_slots(5) as extra:
+            assert extra == 2
+            assert limiter.stats()["active"] == 3
+            with limiter.extra_slots(1) as none_left:
+                assert none_left == 0
+    assert limiter.stats()["active"] == 0
+    with limiter.slot(), limiter.slot(), limiter.slot():
+        pass   # every slot was given back
+
+
+def test_section_pdf_workers_bounded_by_free_pdf_slots(fake_soffice, tmp_path, monkeypatch):
+    monkeypatch.setattr(app_module, "PDF_LIMIT", app_module.Limiter("pdf", slots=3, max_waiting=2))
+    monkeypatch.setattr(app_module.os, "cpu_count", lambda: 8)
+    seen = []
+
+    def fake_sections(docx, pdf, workers=None, cancel=None):
+        seen.append((workers, app_module.PDF_LIMIT.stats()["active"]))
+        return {"error": "stub"}
+
+    monkeypatch.setattr(app_module, "docx_to_pdf_sections", fake_sections)
+    out = tmp_path / "merged.docx"
+    out.write_bytes(b"PK")
+
+    app_module._export_pdf(out, sections=True)
+    assert seen[-1] == (3, 3)   # the whole limiter, never MAX_WORKERS
+
+    with app_module.PDF_LIMIT.slot():   # another job converting
+        app_module._export_pdf(out, sections=True)
+    assert seen[-1] == (2, 3)
+    assert app_module.PDF_LIMIT.stats()["active"] == 0
+
+
+def test_pdf_optimisation_is_opt_in(client):
+    page = client.get("/").get_data(as_text=True)
+    assert 'id="pdfOptimize" />' in page
+
+
+def test_progress_streams_are_capped(client, monkeypatch):
+    monkeypatch.setattr(app_module, "SSE_LIMIT", app_module.Limiter("progress stream", slots=1, max_waiting=0))
+    key = uuid.uuid4().hex
+    first = client.get(f"/progress/{key}")
+    assert first.status_code == 200
+    busy = client.get(f"/progress/{key}")
+    assert busy.status_code == 503
+    assert busy.headers.get("Retry-After")
+    first.close()   # the stream's thread is free again
+    again = client.get(f"/progress/{key}")
+    assert again.status_code == 200
+    again.close()
+
+
+def test_progress_stream_ends_after_max_lifetime(client, monkeypatch):
+    monkeypatch.setattr(app_module, "SSE_MAX_S", 0.5)
+    t0 = time.monotonic()
+    resp = client.get(f"/progress/{uuid.uuid4().hex}")
+    body = resp.get_data(as_text=True)   # returns only once the server ends the stream
+    resp.close()
+    assert body.startswith("retry: 3000")
+    assert time.monotonic() - t0 < 10
+    assert app_module.SSE_LIMIT.stats()["active"] == 0
+
+
+def test_offload_measures_the_stage(monkeypatch):
+    monkeypatch.setattr(app_module, "RENDER_POOL", None)
+    ws = app_module.Workspace(app_module.UPLOAD_DIR, app_module.OUTPUT_DIR)
+    try:
+        memory = {}
+        assert app_module._offload(ws, lambda n, cancel=None: n * 2, 21, memory=memory) == 42
+        assert memory["where"] == "thread"
+        if app_module.estimator.rss_mb() is not None:
+            assert memory["job_mb"] >= 0 and memory["rss_peak_mb"] > 0
+    finally:
+        app_module._discard(ws)
+
+
+def test_convert_from_blob_references_uploads_only_missing_files(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(app_module, "STORAGE", LocalStorage(tmp_path / "store"))
+    tpl = (app_module.BASE_DIR / "templates" / "template.docx").read_bytes()
+    md = b"# From blobs\n\nReferenced, not re-uploaded.\n"
+    tpl_sha, md_sha = (hashlib.sha256(b).hexdigest() for b in (tpl, md))
+    refs = {"template_blob": f"{tpl_sha}:template.docx", "raw_blobs": [f"{md_sha}:section.md"]}
+
+    # the template is already stored (an earlier conversion); only the section is missing
+    assert client.put(f"/blobs/{tpl_sha}", data=tpl).status_code == 201
+    assert client.post("/blobs/check", json={"hashes": [tpl_sha, md_sha]}).get_json() == {"missing": [md_sha]}
+    resp = client.post("/convert", data=refs)
+    assert resp.status_code == 409 and resp.get_json()["missing"] == [md_sha]
+
+    assert client.put(f"/blobs/{md_sha}", data=b"tampered").status_code == 400
+    assert client.put(f"/blobs/{md_sha}", data=md).status_code == 201
+    assert client.put(f"/blobs/{md_sha}", data=md).get_json()["stored"] is False
+
+    resp = client.post("/convert", data=refs)
+    assert resp.status_code == 200
+    page = resp.get_data(as_text=True)
+    docx_url = re.search(r'href="(/outputs/[^"?]+\.docx)', page).group(1)
+    merged = client.get(docx_url)
+    texts = [p.text for p in Document(io.BytesIO(merged.data)).paragraphs]
+    merged.close()
+    assert "Referenced, not re-uploaded." in texts
+
+
+def test_offload_runs_stages_in_the_render_pool(monkeypatch):
+    pool = RenderPool(1)
+    monkeypatch.setattr(app_module, "RENDER_POOL", pool)
+    ws = app_module.Workspace(app_module.UPLOAD_DIR, app_module.OUTPUT_DIR)
+    try:
+        md = ws.uploads / "section.md"
+        md.write_text("# Pooled\n\nMerged in a worker.\n", encoding="utf-8")
+        out = ws.outputs / "merged.docx"
+        memory = {}
+        stats = app_module._offload(ws, app_module.merge_from_any, str(app_module.DEFAULT_TEMPLATE),
+                                    str(md), str(out), cancel=threading.Event(), memory=memory)
+        assert stats["inserted_images"] == 0
+        assert "Merged in a worker." in [p.text for p in Document(str(out)).paragraphs]
+        assert memory["where"] == "render pool"
+        assert not (ws.outputs / ".cancel").exists()
+    finally:
+        pool.shutdown()
+        app_module._discard(ws)
+
+
+def test_full_render_queue_answers_503_with_retry_after(client, monkeypatch):
+    limiter = app_module.Limiter("render", slots=1, max_waiting=0)
+    monkeypatch.setattr(app_module, "RENDER_LIMIT", limiter)
+    before = _job_dirs()
+    with limiter.slot():   # another conversion holds the only slot
+        resp = client.post("/convert", data=_convert_form(), content_type="multipart/form-data")
+    assert resp.status_code == 503
+    assert int(resp.headers["Retry-After"]) >= 1
+    assert _job_dirs() == before
+    assert client.post("/convert", data=_convert_form(), content_type="multipart/form-data").status_code == 200
+
+
+def test_ready_only_after_warm_up(client, monkeypatch):
+    monkeypatch.setattr(app_module, "_WARMUP", {"state": "cold", "detail": "", "seconds": None})
+    resp = client.get("/healthz/ready")
+    assert resp.status_code == 503 and resp.get_json()["ready"] is False
+
+    app_module.warm_up(dummy_pdf=False)
+    resp = client.get("/healthz/ready")
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert body["ready"] is True and body["seconds"] is not None
+    assert "render+merge ok" in body["detail"]
+
+
+def test_failed_warm_up_still_reports_ready(client, monkeypatch):
+    monkeypatch.setattr(app_module, "_WARMUP", {"state": "cold", "detail": "", "seconds": None})
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("template unreadable")
+
+    monkeypatch.setattr(app_module, "merge_from_any", broken)
+    app_module.warm_up(dummy_pdf=False)
+    body = client.get("/healthz/ready").get_json()
+    assert body["ready"] is True
+    assert "error: template unreadable" in body["detail"]
+
+
+def test_outputs_revalidate_by_etag_and_serve_ranges(client, job_dir):
+    body = bytes(range(256)) * 64
+    (app_module.OUTPUT_DIR / job_dir / "merged.pdf").write_bytes(body)
+    url = f"/outputs/inline/{job_dir}/merged.pdf"
+
+    first = client.get(url)
+    etag = first.headers["ETag"]
+    assert first.status_code == 200 and first.data == body
+    assert hashlib.sha256(body).hexdigest().startswith(etag.strip('"'))   # content hash, not mtime
+    assert "no-cache" in first.headers["Cache-Control"]
+    assert first.headers["Accept-Ranges"] == "bytes"
+    first.close()
+
+    again = client.get(url, headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.data == b""
+
+    part = client.get(url, headers={"Range": "bytes=100-199"})
+    assert part.status_code == 206
+    assert part.data == body[100:200]
+    assert part.headers["Content-Range"] == f"bytes 100-199/{len(body)}"
+    part.close()
+
+    # a range against a stale copy gets the whole (new) file instead
+    stale = client.get(url, headers={"Range": "bytes=0-9", "If-Range": '"not-the-current-etag"'})
+    assert stale.status_code == 200 and stale.data == body
+    stale.close()
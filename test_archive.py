@@ -0,0 +1,94 @@
+import stat
+import zipfile
+
+import pytest
+
+import archive
+from archive import ArchiveError, extract_archive
+
+
+def _zip(tmp_path, members, name="upload.zip"):
+    """members: [(name or ZipInfo, bytes)]"""
+    path = tmp_path / name
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for member, data in members:
+            zf.writestr(member, data)
+    return path
+
+
+def _files(root):
+    return sorted(p.relative_to(root).as_posix() for p in root.rglob("*") if p.is_file())
+
+
+def test_sections_in_natural_order_with_image_index(tmp_path):
+    src = _zip(tmp_path, [
+        ("book/10_setup.md", b"# Setup\n"),
+        ("book/2_intro.md", b"# Intro\n"),
+        ("book/img/Logo.PNG", b"\x89PNG fake"),
+        ("book/notes.txt", b"ignored"),
+        ("__MACOSX/book/._2_intro.md", b"resource fork"),
+        ("book/.hidden.md", b"# hidden\n"),
+    ])
+    dest = tmp_path / "out"
+    sections, index = extract_archive(src, dest)
+    assert [rel for _, rel in sections] == ["book/2_intro.md", "book/10_setup.md"]
+    assert index["book/img/logo.png"] == index["logo.png"] == dest.resolve() / "book/img/Logo.PNG"
+    assert _files(dest) == ["book/10_setup.md", "book/2_intro.md", "book/img/Logo.PNG"]
+
+
+@pytest.mark.parametrize("name", [
+    "../evil.md",
+    "book/../../evil.md",
+    "/tmp/evil.md",
+    "C:/evil.md",
+    "C:\\evil.md",
+    "..\\evil.md",
+])
+def test_unsafe_member_names_are_rejected(tmp_path, name):
+    src = _zip(tmp_path, [("ok.md", b"# ok\n"), (name, b"# pwned\n")])
+    dest = tmp_path / "jail" / "out"
+    with pytest.raises(ArchiveError, match="Unsafe path"):
+        extract_archive(src, dest)
+    assert not (tmp_path / "jail" / "evil.md").exists()
+    assert not (tmp_path / "evil.md").exists()
+    assert not list(tmp_path.rglob("evil.md"))
+
+
+def test_symlink_members_are_skipped(tmp_path):
+    link = zipfile.ZipInfo("book/passwd.md")
+    link.external_attr = (stat.S_IFLNK | 0o777) << 16
+    src = _zip(tmp_path, [("book/intro.md", b"# Intro\n"), (link, b"/etc/passwd")])
+    dest = tmp_path / "out"
+    sections, _ = extract_archive(src, dest)
+    assert [rel for _, rel in sections] == ["book/intro.md"]
+    assert not (dest / "book" / "passwd.md").exists()
+    assert not any(p.is_symlink() for p in dest.rglob("*"))
+
+
+def test_too_many_members(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "MAX_ARCHIVE_MEMBERS", 3)
+    src = _zip(tmp_path, [(f"s{i}.md", b"# s\n") for i in range(4)])
+    with pytest.raises(ArchiveError, match="4 entries"):
+        extract_archive(src, tmp_path / "out")
+
+
+def test_decompression_bomb_is_stopped_while_copying(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "MAX_ARCHIVE_BYTES", 1024 * 1024)
+    # 8 MB of zeros compresses to a few KB
+    src = _zip(tmp_path, [("intro.md", b"# Intro\n"), ("bomb.md", b"\0" * (8 * 1024 * 1024))])
+    assert src.stat().st_size < 64 * 1024
+    dest = tmp_path / "out"
+    with pytest.raises(ArchiveError, match="expands beyond 1 MB"):
+        extract_archive(src, dest)
+    # copying stopped at the cap instead of writing the whole member
+    assert sum(p.stat().st_size for p in dest.rglob("*") if p.is_file()) <= 1024 * 1024
+
+
+def test_not_a_zip_and_no_sections(tmp_path):
+    junk = tmp_path / "junk.zip"
+    junk.write_bytes(b"not a zip at all")
+    with pytest.raises(ArchiveError, match="Not a valid"):
+        extract_archive(junk, tmp_path / "a")
+    images_only = _zip(tmp_path, [("img/a.png", b"\x89PNG")], name="images.zip")
+    with pytest.raises(ArchiveError, match="no Markdown"):
+        extract_archive(images_only, tmp_path / "b")
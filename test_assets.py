@@ -0,0 +1,53 @@
+import gzip
+import hashlib
+
+import pytest
+from flask import Flask
+
+from assets import AssetPipeline
+
+JS = b"// app\n" + b"console.log('hello');\n" * 200
+
+
+@pytest.fixture
+def site(tmp_path):
+    static = tmp_path / "static"
+    static.mkdir()
+    (static / "app.js").write_bytes(JS)
+    app = Flask(__name__)
+    pipeline = AssetPipeline(static, tmp_path / ".assets")
+    pipeline.init_app(app)
+    return app, pipeline, static
+
+
+def test_url_is_the_fingerprinted_name(site):
+    app, pipeline, static = site
+    with app.test_request_context():
+        assert pipeline.url("app.js") == f"/assets/app.{hashlib.sha256(JS).hexdigest()[:12]}.js"
+        assert pipeline.url("missing.css") == "/static/missing.css"
+
+        (static / "app.js").write_bytes(JS + b"// edited\n")
+        assert pipeline.url("app.js", reload=True) != f"/assets/app.{hashlib.sha256(JS).hexdigest()[:12]}.js"
+
+
+def test_serve_is_immutable_and_precompressed(site):
+    app, pipeline, _ = site
+    client = app.test_client()
+    with app.test_request_context():
+        url = pipeline.url("app.js")
+
+    resp = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert resp.status_code == 200
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert "immutable" in resp.headers["Cache-Control"]
+    assert "max-age=31536000" in resp.headers["Cache-Control"]
+    assert "Accept-Encoding" in resp.headers["Vary"]
+    assert gzip.decompress(resp.data) == JS
+    resp.close()
+
+    plain = client.get(url, headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in plain.headers
+    assert plain.data == JS
+    plain.close()
+
+    assert client.get("/assets/app.js").status_code == 404   # only fingerprinted names are served
@@ -0,0 +1,82 @@
+import hashlib
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from docx import Document
+
+import cli
+
+TEMPLATE = Path(__file__).resolve().parent / "templates" / "template.docx"
+
+
+@pytest.fixture
+def section(tmp_path):
+    md = tmp_path / "section.md"
+    md.write_text("# From the CLI\n\nSome **bold** text.\n", encoding="utf-8")
+    return md
+
+
+def _texts(path) -> list:
+    return [p.text for p in Document(str(path)).paragraphs]
+
+
+def test_md2docx(tmp_path, section, capsys):
+    out = tmp_path / "raw.docx"
+    assert cli.main(["-q", "md2docx", str(section), "-o", str(out)]) == 0
+    assert capsys.readouterr().out.strip() == str(out)
+    assert "Some bold text." in _texts(out)
+
+
+@pytest.mark.parametrize("flags, compacted", [([], True), (["--no-compact"], False)])
+def test_merge(tmp_path, section, capsys, flags, compacted):
+    out = tmp_path / "merged.docx"
+    assert cli.main(["-q", "merge", str(TEMPLATE), str(section), "-o", str(out), *flags]) == 0
+    line = capsys.readouterr().out.strip()
+    assert line.startswith(f"{out}\tinserted_images=0\tskipped_images=0")
+    assert ("xml_elements=" in line) is compacted
+    assert "From the CLI" in _texts(out)
+
+
+def test_topdf_converts_all_inputs_in_one_launch(fake_soffice, tmp_path, capsys):
+    docs = []
+    for name in ("a", "b"):
+        doc = tmp_path / f"{name}.docx"
+        doc.write_bytes(b"PK" + name.encode())
+        docs.append(doc)
+    outdir = tmp_path / "pdf"
+    outdir.mkdir()
+    assert cli.main(["-q", "topdf", *map(str, docs), "--outdir", str(outdir)]) == 0
+    assert capsys.readouterr().out.split() == [str(outdir / "a.pdf"), str(outdir / "b.pdf")]
+    assert [len(line.split()) for line in fake_soffice["launches"]()] == [2]
+    for doc in docs:
+        assert hashlib.sha256(doc.read_bytes()).hexdigest().encode() in (outdir / f"{doc.stem}.pdf").read_bytes()
+
+
+def test_watch_once(tmp_path, capsys):
+    sections = tmp_path / "sections"
+    sections.mkdir()
+    (sections / "01.md").write_text("# One\n", encoding="utf-8")
+    (sections / "02.md").write_text("# Two\n", encoding="utf-8")
+    out = tmp_path / "book.docx"
+    assert cli.main(["-q", "watch", str(sections), str(TEMPLATE), "-o", str(out), "--once"]) == 0
+    assert "rendered=2/2" in capsys.readouterr().out
+    assert {"One", "Two"} <= set(_texts(out))
+
+
+def test_errors_and_exit_codes(tmp_path, capsys):
+    assert cli.main(["merge", str(TEMPLATE), str(tmp_path / "missing.md")]) == 1
+    assert "not found" in capsys.readouterr().err
+    assert cli.main(["topdf", "a.docx", "b.docx", "-o", "x.pdf"]) == 2
+    with pytest.raises(SystemExit) as exc:
+        cli.main(["merge", str(TEMPLATE)])
+    assert exc.value.code == 2
+
+
+def test_parsing_arguments_imports_no_heavy_modules():
+    code = ("import sys, cli; cli.build_parser().parse_args(['topdf', 'x.docx']); "
+            "print(sorted(m for m in ('docx', 'lxml', 'PIL', 'pypdf') if m in sys.modules))")
+    out = subprocess.run([sys.executable, "-c", code], cwd=Path(cli.__file__).parent,
+                         capture_output=True, text=True, check=True).stdout
+    assert out.strip() == "[]"
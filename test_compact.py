@@ -0,0 +1,162 @@
+from pathlib import Path
+
+import pytest
+from docx import Document
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls, qn
+
+from compact import Compactor
+from merge import merge_from_any
+
+TEMPLATE = Path(__file__).resolve().parent / "templates" / "template.docx"
+
+STYLES = parse_xml(f"""<w:styles {nsdecls('w')}>
+  <w:docDefaults><w:rPrDefault><w:rPr><w:sz w:val="22"/></w:rPr></w:rPrDefault></w:docDefaults>
+  <w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/></w:style>
+  <w:style w:type="paragraph" w:styleId="Heading1">
+    <w:basedOn w:val="Normal"/>
+    <w:pPr><w:keepNext/><w:jc w:val="center"/></w:pPr>
+    <w:rPr><w:b/><w:color w:val="2F5496"/></w:rPr>
+  </w:style>
+  <w:style w:type="paragraph" w:styleId="Title"><w:basedOn w:val="Heading1"/></w:style>
+  <w:style w:type="character" w:styleId="Plain"><w:rPr><w:b w:val="0"/></w:rPr></w:style>
+</w:styles>""")
+
+
+def _char_formats(p):
+    """(character, rPr xml) for every character of a paragraph, links included."""
+    out = []
+    for r in p.iter(qn("w:r")):
+        rpr = r.find(qn("w:rPr"))
+        key = rpr.xml if rpr is not None and len(rpr) else ""
+        for t in r.iter(qn("w:t")):
+            out.extend((ch, key) for ch in t.text or "")
+    return out
+
+
+def _text(el) -> str:
+    return "".join(t.text or "" for t in el.iter(qn("w:t")))
+
+
+def _p(runs_xml: str):
+    return parse_xml(f"<w:p {nsdecls('w')}><w:pPr/>{runs_xml}</w:p>")
+
+
+def test_merged_runs_keep_text_and_formatting():
+    p = _p(
+        '<w:r><w:rPr><w:b/></w:rPr><w:t xml:space="preserve">Hello </w:t></w:r>'
+        '<w:r><w:rPr><w:b/></w:rPr><w:t>world</w:t></w:r>'
+        '<w:r><w:t/></w:r>'
+        '<w:r><w:rPr><w:i/></w:rPr><w:t xml:space="preserve"> and </w:t></w:r>'
+        '<w:r><w:rPr><w:i/></w:rPr><w:t>more</w:t></w:r>'
+        '<w:r><w:br/></w:r>'
+        '<w:r><w:rPr><w:i/></w:rPr><w:t>after break</w:t></w:r>'
+    )
+    before = _char_formats(p)
+    c = Compactor()
+    c.feed([p])
+
+    assert _char_formats(p) == before
+    runs = p.findall(qn("w:r"))
+    assert [_text(r) for r in runs] == ["Hello world", " and more", "", "after break"]
+    # the merged italic run starts with a space, which Word drops without xml:space
+    t = runs[1].find(qn("w:t"))
+    assert t.get("{http://www.w3.org/XML/1998/namespace}space") == "preserve"
+    assert p.find(qn("w:pPr")) is None
+    assert c.stats["runs_merged"] == 2 and c.stats["runs_removed"] == 1
+    assert c.stats["elements_after"] < c.stats["elements_before"]
+
+
+def test_runs_inside_hyperlinks_are_merged_too():
+    p = parse_xml(
+        f'<w:p {nsdecls("w", "r")}><w:hyperlink w:anchor="setup">'
+        '<w:r><w:rPr><w:rStyle w:val="Hyperlink"/></w:rPr><w:t>Get</w:t></w:r>'
+        '<w:r><w:rPr><w:rStyle w:val="Hyperlink"/></w:rPr><w:t>ting started</w:t></w:r>'
+        '</w:hyperlink></w:p>')
+    before = _char_formats(p)
+    Compactor().feed([p])
+    assert _char_formats(p) == before
+    assert len(p.findall(f"{qn('w:hyperlink')}/{qn('w:r')}")) == 1
+
+
+def test_round_trip_through_save(tmp_path):
+    doc = Document()
+    body = doc.element.body
+    first = len(body) - 1   # before the final sectPr
+    para = doc.add_paragraph()
+    for text, bold in (("Bold ", True), ("bold", True), (" plain", None), (" text", None)):
+        para.add_run(text).bold = bold
+    for _ in range(3):
+        doc.add_paragraph()
+    cell_p = doc.add_table(rows=1, cols=1).cell(0, 0).paragraphs[0]
+    for text in ("cell ", "text"):
+        cell_p.add_run(text).italic = True
+    doc.add_paragraph("End")
+
+    expected = [_char_formats(p) for p in body.iter(qn("w:p")) if _text(p)]
+    Compactor().feed([el for el in list(body)[first:] if el.tag != qn("w:sectPr")])
+    out = tmp_path / "compacted.docx"
+    doc.save(str(out))
+
+    back = Document(str(out))
+    assert [_char_formats(p) for p in back.element.body.iter(qn("w:p")) if _text(p)] == expected
+    assert [p.text for p in back.paragraphs] == ["Bold bold plain text", "", "End"]   # 3 empty → 1
+    assert [(r.text, r.bold) for r in back.paragraphs[0].runs] == [("Bold bold", True), (" plain text", None)]
+    assert [(r.text, r.italic) for r in back.tables[0].cell(0, 0).paragraphs[0].runs] == [("cell text", True)]
+
+
+def _props(el, kind):
+    pr = el.find(qn(kind))
+    return [c.tag.split("}")[1] for c in pr] if pr is not None else []
+
+
+def _styled(ppr: str, runs_xml: str):
+    return parse_xml(f"<w:p {nsdecls('w')}><w:pPr>{ppr}</w:pPr>{runs_xml}</w:p>")
+
+
+def test_formatting_the_style_already_gives_is_dropped():
+    p = _styled(
+        '<w:pStyle w:val="Title"/><w:keepNext/><w:jc w:val="left"/>',
+        '<w:r><w:rPr><w:b/><w:color w:val="2F5496"/><w:sz w:val="22"/></w:rPr><w:t>Inherited </w:t></w:r>'
+        '<w:r><w:rPr><w:color w:val="FF0000"/><w:sz w:val="28"/></w:rPr><w:t>own</w:t></w:r>'
+        '<w:r><w:rPr><w:rStyle w:val="Plain"/><w:b/></w:rPr><w:t> bold again</w:t></w:r>')
+    c = Compactor(STYLES)
+    c.feed([p])
+
+    # keepNext comes from Heading1 via Title's basedOn; jc differs from the style
+    assert _props(p, "w:pPr") == ["pStyle", "jc"]
+    runs = p.findall(qn("w:r"))
+    assert runs[0].find(qn("w:rPr")) is None            # b, color (style) and sz (docDefaults)
+    assert _props(runs[1], "w:rPr") == ["color", "sz"]
+    # the character style turns bold off, so the run's own w:b still matters
+    assert _props(runs[2], "w:rPr") == ["rStyle", "b"]
+    assert c.stats["props_redundant"] == 4
+
+
+def test_default_paragraph_style_and_numbering():
+    p = _styled(
+        '<w:numPr><w:ilvl w:val="0"/><w:numId w:val="1"/></w:numPr><w:ind w:left="0"/>',
+        '<w:r><w:rPr><w:sz w:val="22"/><w:b/></w:rPr><w:t>item</w:t></w:r>')
+    Compactor(STYLES).feed([p])
+    # numbering sits between style and direct indents, so w:ind stays
+    assert _props(p, "w:pPr") == ["numPr", "ind"]
+    assert _props(p.find(qn("w:r")), "w:rPr") == ["b"]
+
+
+def test_without_styles_redundant_formatting_is_kept():
+    p = _styled('<w:pStyle w:val="Heading1"/>', '<w:r><w:rPr><w:b/></w:rPr><w:t>x</w:t></w:r>')
+    c = Compactor()
+    c.feed([p])
+    assert _props(p.find(qn("w:r")), "w:rPr") == ["b"]
+    assert c.stats["props_redundant"] == 0
+
+
+@pytest.mark.parametrize("compact", [True, False])
+def test_merge_can_turn_compaction_off(tmp_path, compact):
+    md = tmp_path / "section.md"
+    md.write_text("# Title\n\nSome **bold** text.\n\n\n\nEnd.\n", encoding="utf-8")
+    out = tmp_path / "out.docx"
+    stats = merge_from_any(str(TEMPLATE), str(md), str(out), compact=compact)
+
+    assert ("compaction" in stats) is compact
+    assert "Some bold text." in [p.text for p in Document(str(out)).paragraphs]
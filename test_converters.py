@@ -0,0 +1,93 @@
+import hashlib
+import threading
+import time
+
+import pytest
+
+import converters
+from converters import PdfBatcher, optimize_pdf
+
+
+def _docx(tmp_path, name, payload: bytes):
+    path = tmp_path / name
+    path.write_bytes(b"PK" + payload)
+    return path
+
+
+def _digest(path) -> bytes:
+    return hashlib.sha256(path.read_bytes()).hexdigest().encode()
+
+
+def _launch_sizes(fake_soffice):
+    return [len(line.split()) for line in fake_soffice["launches"]()]
+
+
+def test_idle_batcher_converts_at_once_and_coalesces_the_rest(fake_soffice, tmp_path, monkeypatch):
+    monkeypatch.setenv("FAKE_SOFFICE_SLEEP", "1.0")
+    batcher = PdfBatcher()
+    docs = [_docx(tmp_path, f"doc{i}.docx", f"content {i}".encode()) for i in range(4)]
+
+    first = batcher.submit(docs[0], docs[0].with_suffix(".pdf"))
+    time.sleep(0.1)   # the first run is in progress, not waiting for company
+    rest = [batcher.submit(d, d.with_suffix(".pdf")) for d in docs[1:]]
+
+    assert [f.result(timeout=30) for f in [first, *rest]] == [None] * 4
+    assert _launch_sizes(fake_soffice) == [1, 3]
+    for doc in docs:
+        # each caller got the PDF of its own document
+        assert _digest(doc) in doc.with_suffix(".pdf").read_bytes()
+
+
+def test_bad_document_fails_only_its_own_caller(fake_soffice, tmp_path, monkeypatch):
+    monkeypatch.setenv("FAKE_SOFFICE_SLEEP", "0.5")
+    batcher = PdfBatcher()
+    opener = _docx(tmp_path, "opener.docx", b"opener")
+    held = batcher.submit(opener, opener.with_suffix(".pdf"))
+    time.sleep(0.1)
+    good1 = _docx(tmp_path, "good1.docx", b"first")
+    bad = _docx(tmp_path, "bad.docx", b"BAD content")
+    good2 = _docx(tmp_path, "good2.docx", b"second")
+    futures = [batcher.submit(d, d.with_suffix(".pdf")) for d in (good1, bad, good2)]
+
+    assert held.result(timeout=60) is None
+    err_good1, err_bad, err_good2 = (f.result(timeout=60) for f in futures)
+    assert err_good1 is None and err_good2 is None
+    assert err_bad is not None
+    assert not bad.with_suffix(".pdf").exists()
+    for doc in (good1, good2):
+        assert _digest(doc) in doc.with_suffix(".pdf").read_bytes()
+    # the three shared a run; the bad one was then retried on its own
+    assert _launch_sizes(fake_soffice) == [1, 3, 1]
+
+
+def test_pypdf_fallback_reports_not_linearized(tmp_path, monkeypatch):
+    pypdf = pytest.importorskip("pypdf")
+    pdf = tmp_path / "doc.pdf"
+    writer = pypdf.PdfWriter()
+    for _ in range(3):
+        writer.add_blank_page(width=595, height=842)
+    with open(pdf, "wb") as f:
+        writer.write(f)
+    # no qpdf on PATH: pypdf can compress but not linearize
+    monkeypatch.setattr(converters.shutil, "which", lambda name: None)
+
+    stats = optimize_pdf(pdf)
+    assert stats["engine"] == "pypdf"
+    assert stats["error"] is None
+    assert stats["linearized"] is False
+    assert stats["after_bytes"] == pdf.stat().st_size
+
+
+def test_cancel_kills_soffice_and_reports_cancelled(fake_soffice, tmp_path, monkeypatch):
+    monkeypatch.setenv("FAKE_SOFFICE_SLEEP", "2.0")
+    doc = _docx(tmp_path, "slow.docx", b"slow")
+    cancel = threading.Event()
+    threading.Timer(0.3, cancel.set).start()
+
+    t0 = time.monotonic()
+    assert converters.docx_to_pdf(doc, doc.with_suffix(".pdf"), cancel=cancel) == converters.CANCELLED
+    assert time.monotonic() - t0 < 1.5
+    # had the stub survived the kill it would write its PDF once its sleep ends
+    time.sleep(2.5 - (time.monotonic() - t0))
+    assert fake_soffice["launches"]() == ["slow.docx"]
+    assert not doc.with_suffix(".pdf").exists()
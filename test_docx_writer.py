@@ -0,0 +1,149 @@
+import io
+import struct
+import zipfile
+import zlib
+from pathlib import Path
+
+from docx import Document
+
+from docx_writer import StreamingDocxWriter, _copy_raw_member, save_document
+
+TEMPLATE = Path(__file__).resolve().parent / "templates" / "template.docx"
+REWRITTEN = {"word/document.xml", "word/settings.xml", "word/_rels/document.xml.rels",
+             "_rels/.rels", "[Content_Types].xml"}
+
+
+def _raw(zf: zipfile.ZipFile, name: str) -> bytes:
+    """The member's bytes as stored (still compressed)."""
+    info = zf.getinfo(name)
+    zf.fp.seek(info.header_offset)
+    header = zf.fp.read(30)
+    name_len, extra_len = struct.unpack("<2H", header[26:30])
+    zf.fp.seek(info.header_offset + 30 + name_len + extra_len)
+    return zf.fp.read(info.compress_size)
+
+
+def test_save_copies_untouched_template_parts_byte_for_byte(tmp_path):
+    doc = Document(str(TEMPLATE))
+    doc.add_paragraph("Appended by the merge")
+    out = tmp_path / "out.docx"
+    stats = save_document(doc, str(out), template_path=str(TEMPLATE))
+
+    with zipfile.ZipFile(TEMPLATE) as src, zipfile.ZipFile(out) as dst:
+        assert dst.testzip() is None
+        assert set(dst.namelist()) == set(src.namelist())
+        clean = [n for n in src.namelist() if n not in REWRITTEN]
+        assert stats["copied_parts"] == len(clean)
+        for name in clean:
+            assert _raw(dst, name) == _raw(src, name), name
+            assert dst.getinfo(name).CRC == src.getinfo(name).CRC
+        # no data descriptors left behind in the copies
+        assert all(not dst.getinfo(n).flag_bits & 0x8 for n in clean)
+
+    reloaded = Document(str(out))
+    assert reloaded.paragraphs[-1].text == "Appended by the merge"
+    assert len(reloaded.sections) == len(doc.sections)
+
+
+def test_save_is_deterministic(tmp_path):
+    outs = []
+    for i in range(2):
+        doc = Document(str(TEMPLATE))
+        doc.add_paragraph("Same input")
+        outs.append(tmp_path / f"out{i}.docx")
+        save_document(doc, str(outs[-1]), template_path=str(TEMPLATE))
+    assert outs[0].read_bytes() == outs[1].read_bytes()
+
+
+def _source_zip():
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr(zipfile.ZipInfo("stored.bin"), b"\x00\x01" * 500)
+        deflated = zipfile.ZipInfo("deflated.xml")
+        deflated.compress_type = zipfile.ZIP_DEFLATED
+        zf.writestr(deflated, b"<a>" + b"x" * 5000 + b"</a>")
+    # An entry streamed to an unseekable file carries a data descriptor (flag 0x08)
+    raw = io.BytesIO()
+
+    class Unseekable(io.RawIOBase):
+        def writable(self):
+            return True
+
+        def write(self, b):
+            return raw.write(b)
+
+    with zipfile.ZipFile(Unseekable(), "w", zipfile.ZIP_DEFLATED) as zf:
+        with zf.open("streamed.txt", "w") as f:
+            f.write(b"streamed " * 300)
+    buf.seek(0)
+    raw.seek(0)
+    return buf, raw
+
+
+def test_copy_raw_member_round_trip():
+    plain, streamed = _source_zip()
+    out = io.BytesIO()
+    with zipfile.ZipFile(plain) as src, zipfile.ZipFile(streamed) as src2, \
+            zipfile.ZipFile(out, "w") as dst:
+        assert src2.getinfo("streamed.txt").flag_bits & 0x8
+        for name in ("stored.bin", "deflated.xml"):
+            assert _copy_raw_member(src, dst, name)
+        assert _copy_raw_member(src2, dst, "streamed.txt")
+        dst.writestr("after.txt", b"written normally after the copies")
+        expected = {n: src.read(n) for n in src.namelist()}
+        expected["streamed.txt"] = src2.read("streamed.txt")
+
+    with zipfile.ZipFile(out) as back:
+        assert back.testzip() is None
+        assert back.getinfo("stored.bin").compress_type == zipfile.ZIP_STORED
+        assert back.getinfo("deflated.xml").compress_type == zipfile.ZIP_DEFLATED
+        assert not back.getinfo("streamed.txt").flag_bits & 0x8
+        for name, data in expected.items():
+            assert back.read(name) == data
+        assert back.read("after.txt") == b"written normally after the copies"
+
+
+def test_copy_raw_member_refuses_encrypted_entries():
+    plain, _ = _source_zip()
+    out = io.BytesIO()
+    with zipfile.ZipFile(plain) as src, zipfile.ZipFile(out, "w") as dst:
+        src.getinfo("deflated.xml").flag_bits |= 0x1
+        assert not _copy_raw_member(src, dst, "deflated.xml")
+        assert dst.namelist() == []
+
+
+def _png(rgb: bytes) -> bytes:
+    """A 2x2 PNG of one colour."""
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    raw = b"".join(b"\0" + rgb * 2 for _ in range(2))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", 2, 2, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b""))
+
+
+def test_streaming_writer_numbers_drawings_and_dedupes_flushed_images(tmp_path):
+    doc = Document(str(TEMPLATE))
+    part_class = type(doc.part)
+    out = tmp_path / "streamed.docx"
+    writer = StreamingDocxWriter(doc, str(out), template_path=str(TEMPLATE))
+    writer.start()
+    red, blue = _png(b"\xff\0\0"), _png(b"\0\0\xff")
+    for batch in ([red], [red, blue], [blue, red]):
+        for blob in batch:
+            doc.add_paragraph().add_run().add_picture(io.BytesIO(blob))
+        writer.flush()
+    writer.close()
+    # python-docx objects are left as they are
+    assert type(doc.part) is part_class
+    assert "_get_by_sha1" not in vars(doc.part.package.image_parts)
+
+    with zipfile.ZipFile(TEMPLATE) as src, zipfile.ZipFile(out) as dst:
+        assert dst.testzip() is None
+        new_media = {n for n in dst.namelist() if n.startswith("word/media/")} - set(src.namelist())
+        assert len(new_media) == 2   # red and blue once each
+    back = Document(str(out))
+    ids = back.element.body.xpath(".//wp:docPr/@id")
+    assert len(ids) == len(set(ids))
+    blips = back.element.body.xpath(".//a:blip/@r:embed")
+    targets = [back.part.rels[rId].target_part.blob for rId in blips[-5:]]
+    assert targets == [red, red, blue, blue, red]
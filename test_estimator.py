@@ -0,0 +1,41 @@
+import sys
+
+import pytest
+
+import estimator
+
+
+def _allocate(mb: int, cancel=None):
+    block = bytearray(mb * 1024 * 1024)
+    for i in range(0, len(block), 4096):   # touch every page so it is resident
+        block[i] = 1
+    return len(block)
+
+
+@pytest.mark.skipif(estimator.rss_mb() is None, reason="RSS not readable on this platform")
+def test_measure_reports_what_the_job_added():
+    result, mem = estimator.measure(_allocate, 64)
+    assert result == 64 * 1024 * 1024
+    assert mem["rss_peak_mb"] >= mem["rss_before_mb"] + 48
+    assert 48 <= mem["job_mb"] < 512
+
+
+def test_measure_passes_errors_through():
+    def boom(cancel=None):
+        raise ValueError("bad input")
+
+    with pytest.raises(ValueError, match="bad input"):
+        estimator.measure(boom, cancel=None)
+
+
+def test_scan_markdown_resolves_images_quietly(tmp_path, capsys):
+    (tmp_path / "img").mkdir()
+    (tmp_path / "img" / "shot.png").write_bytes(b"\x89PNG" + b"\0" * 996)
+    md = tmp_path / "section.md"
+    md.write_text("# Title\n\n![Shot](img/shot.png)\n\n![Gone](img/missing.png)\n", encoding="utf-8")
+
+    feats = estimator.scan_markdown([(md, tmp_path)])
+    assert feats["images"] == 2
+    assert feats["image_bytes"] == 1000
+    assert feats["missing_images"] == 1
+    assert "Resolving image" not in capsys.readouterr().out
@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+
+from jobs import Limiter, Overloaded, ProgressBoard
+from storage import LocalStorage
+
+ALIAS = "browser-progress-id-0001"
+
+
+def _wait_for(predicate, timeout_s: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return predicate()
+
+
+def test_cancel_reaches_job_running_in_another_process(tmp_path):
+    store = LocalStorage(tmp_path)
+    # Two boards on one store stand in for two gunicorn workers
+    runner = ProgressBoard(store=store, cancel_poll_s=0.05)
+    other = ProgressBoard(store=store, cancel_poll_s=0.05)
+    assert runner.open("job-0001", alias=ALIAS) is None
+    runner.emit("job-0001", "rendering", sections=3)
+
+    assert other.cancel(ALIAS, "cancelled by the user") is True
+    assert _wait_for(runner.cancel_event("job-0001").is_set)
+    assert store.get_bytes(f"progress/{ALIAS}.cancel") is None   # consumed
+    runner.finish("job-0001", "cancelled")
+    assert store.get_bytes("progress/job-0001.json") is not None
+
+
+def test_cancel_of_unknown_or_finished_job_leaves_no_flag(tmp_path):
+    store = LocalStorage(tmp_path)
+    runner = ProgressBoard(store=store, cancel_poll_s=0.05)
+    other = ProgressBoard(store=store, cancel_poll_s=0.05)
+    assert other.cancel("no-such-job-anywhere", "cancelled by the user") is False
+
+    runner.open("job-0002", alias=ALIAS)
+    runner.finish("job-0002", "done", result={})
+    assert other.cancel(ALIAS, "cancelled by the user") is False
+    assert store.get_bytes(f"progress/{ALIAS}.cancel") is None
+
+
+def test_local_cancel_drops_one_watcher_at_a_time():
+    board = ProgressBoard()
+    board.open("job-0003", dedupe_key="same-inputs")
+    assert board.open("job-0004", dedupe_key="same-inputs") == "job-0003"
+    assert board.cancel("job-0003", "cancelled by the user") is False   # one watcher left
+    assert board.cancel("job-0003", "cancelled by the user") is True
+    assert board.cancel_event("job-0003").is_set()
+
+
+def test_limiter_sheds_callers_beyond_the_queue():
+    limiter = Limiter("render", slots=1, max_waiting=1)
+    ran = []
+
+    def queued():
+        with limiter.slot():
+            ran.append("queued")
+
+    with limiter.slot():
+        waiter = threading.Thread(target=queued)
+        waiter.start()
+        assert _wait_for(lambda: limiter.stats()["waiting"] == 1)
+        with pytest.raises(Overloaded) as exc:
+            with limiter.slot():
+                ran.append("shed")
+        assert exc.value.stage == "render"
+        assert 1 <= exc.value.retry_after <= 120
+    waiter.join(timeout=5)
+    assert ran == ["queued"]
+    assert limiter.stats() == {"active": 0, "waiting": 0, "slots": 1, "max_waiting": 1}
+
+
+def test_limiter_gives_up_after_wait_timeout():
+    limiter = Limiter("pdf", slots=1, max_waiting=4, wait_timeout_s=0.2)
+    with limiter.slot():
+        with pytest.raises(Overloaded):
+            with limiter.slot():
+                pass
+    assert limiter.stats()["waiting"] == 0
@@ -0,0 +1,90 @@
+from docx import Document
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml.ns import qn
+
+from parser import _emit_inline_runs, inline_spans
+
+
+def test_inline_spans_formatting_and_links():
+    assert inline_spans("a **b** *c* `d` [e](https://x.test)") == [
+        ("a ", False, False, False, None),
+        ("b", True, False, False, None),
+        (" ", False, False, False, None),
+        ("c", False, True, False, None),
+        (" ", False, False, False, None),
+        ("d", False, False, True, None),
+        (" ", False, False, False, None),
+        ("e", False, False, False, "https://x.test"),
+    ]
+
+
+def test_inline_spans_anchor_link_keeps_fragment():
+    assert inline_spans("see [Intro](#introduction)") == [
+        ("see ", False, False, False, None),
+        ("Intro", False, False, False, "#introduction"),
+    ]
+
+
+def test_inline_spans_inline_image_stays_literal():
+    spans = inline_spans("click ![Save button](img/save.png) then **OK**")
+    assert spans == [
+        ("click ![Save button](img/save.png) then ", False, False, False, None),
+        ("OK", True, False, False, None),
+    ]
+    # no "!" followed by a hyperlink to the image
+    assert all(url is None for *_, url in spans)
+
+
+def test_inline_spans_empty_alt_image_and_lone_bang():
+    assert inline_spans("x ![](a.png) y") == [("x ![](a.png) y", False, False, False, None)]
+    assert inline_spans("Wow! [go](https://x.test)") == [
+        ("Wow! ", False, False, False, None),
+        ("go", False, False, False, "https://x.test"),
+    ]
+
+
+def _hyperlink_rels(doc):
+    return [r for r in doc.part.rels.values() if r.reltype == RT.HYPERLINK]
+
+
+def test_anchor_links_become_internal_hyperlinks():
+    doc = Document()
+    p = doc.add_paragraph()
+    _emit_inline_runs(p, "go to [setup](#setup) or [site](https://example.com)")
+    links = p._p.findall(qn("w:hyperlink"))
+    assert len(links) == 2
+    internal, external = links
+    assert internal.get(qn("w:anchor")) == "setup"
+    assert internal.get(qn("r:id")) is None
+    assert external.get(qn("w:anchor")) is None
+    rels = _hyperlink_rels(doc)
+    assert [r.target_ref for r in rels] == ["https://example.com"]
+    assert doc.part.rels[external.get(qn("r:id"))].is_external
+
+
+def test_triple_delimiter_nests_by_its_closers():
+    # CommonMark: <em><strong>a</strong> b</em>
+    assert inline_spans("***a** b*") == [
+        ("a", True, True, False, None),
+        (" b", False, True, False, None),
+    ]
+    # and the mirror: <strong><em>a</em> b</strong>
+    assert inline_spans("***a* b**") == [
+        ("a", True, True, False, None),
+        (" b", True, False, False, None),
+    ]
+    assert inline_spans("***both***") == [("both", True, True, False, None)]
+    assert inline_spans("***a**") == [("*", False, False, False, None), ("a", True, False, False, None)]
+
+
+def test_nested_emphasis_inside_bold_and_italic():
+    assert inline_spans("**b *i* b**") == [
+        ("b ", True, False, False, None),
+        ("i", True, True, False, None),
+        (" b", True, False, False, None),
+    ]
+    assert inline_spans("*a **b** c*") == [
+        ("a ", False, True, False, None),
+        ("b", True, True, False, None),
+        (" c", False, True, False, None),
+    ]
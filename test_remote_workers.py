@@ -0,0 +1,145 @@
+"""
+RemoteWorkers against real conversion_worker.py processes on localhost, each
+converting with the stub soffice from conftest.py.
+"""
+import hashlib
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from pathlib import Path
+
+import pytest
+
+import converters
+from converters import RemoteWorkers
+from jobs import Overloaded
+
+WORKER = Path(__file__).resolve().parent / "conversion_worker.py"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_healthy(url: str, proc, timeout_s: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"worker exited with {proc.returncode}")
+        try:
+            with urllib.request.urlopen(url + "/healthz", timeout=1) as resp:
+                if resp.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"worker at {url} did not become healthy")
+
+
+@pytest.fixture
+def start_worker(fake_soffice, tmp_path):
+    procs = []
+
+    def start(slots: int = 2, max_waiting: int = 4, sleep_s: float = 0.0) -> str:
+        port = _free_port()
+        env = {**os.environ, "FAKE_SOFFICE_SLEEP": str(sleep_s)}
+        proc = subprocess.Popen(
+            [sys.executable, str(WORKER), "--port", str(port), "--slots", str(slots),
+             "--max-waiting", str(max_waiting)],
+            cwd=tmp_path, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        procs.append(proc)
+        url = f"http://127.0.0.1:{port}"
+        _wait_healthy(url, proc)
+        return url
+
+    yield start
+    for proc in procs:
+        proc.kill()
+        proc.wait()
+
+
+def _docx(tmp_path: Path, name: str, payload: bytes) -> Path:
+    path = tmp_path / name
+    path.write_bytes(b"PK" + payload)
+    return path
+
+
+def _digest(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def test_spreads_load_over_workers(start_worker, tmp_path):
+    urls = [start_worker(sleep_s=0.5), start_worker(sleep_s=0.5)]
+    pool = RemoteWorkers(urls)
+    docs = [_docx(tmp_path, f"doc{i}.docx", f"content {i}".encode()) for i in range(4)]
+    errors = {}
+
+    def convert(doc):
+        errors[doc.name] = pool.convert(doc, doc.with_suffix(".pdf"))
+
+    threads = [threading.Thread(target=convert, args=(d,)) for d in docs]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert all(result == (None, True) for result in errors.values())
+    for doc in docs:
+        # each caller got the PDF of its own document
+        assert _digest(doc).encode() in doc.with_suffix(".pdf").read_bytes()
+    assert [w["done"] for w in pool.workers] == [2, 2]
+
+
+def test_unreachable_worker_is_skipped(start_worker, tmp_path):
+    dead = f"http://127.0.0.1:{_free_port()}"
+    live = start_worker()
+    pool = RemoteWorkers([dead, live])
+    for i in range(3):
+        doc = _docx(tmp_path, f"doc{i}.docx", b"x%d" % i)
+        assert pool.convert(doc, doc.with_suffix(".pdf")) == (None, True)
+    dead_w, live_w = pool.workers
+    assert not dead_w["healthy"] and dead_w["done"] == 0
+    assert live_w["done"] == 3
+
+
+def test_busy_workers_raise_overloaded_instead_of_converting_locally(start_worker, tmp_path, fake_soffice):
+    url = start_worker(slots=1, max_waiting=0, sleep_s=2.0)
+    pool = RemoteWorkers([url])
+    first = _docx(tmp_path, "first.docx", b"first")
+    holder = threading.Thread(target=pool.convert, args=(first, first.with_suffix(".pdf")))
+    holder.start()
+    time.sleep(0.8)   # the only slot is taken now
+
+    launches_before = len(fake_soffice["launches"]())
+    second = _docx(tmp_path, "second.docx", b"second")
+    with pytest.raises(Overloaded) as info:
+        pool.convert(second, second.with_suffix(".pdf"))
+    assert info.value.retry_after >= 1
+    holder.join()
+    assert first.with_suffix(".pdf").exists()
+    assert not second.with_suffix(".pdf").exists()
+    # the worker's launch for "first" is the only one: nothing ran on this side
+    assert len(fake_soffice["launches"]()) == launches_before
+
+
+def test_local_fallback_only_when_no_worker_is_reachable(fake_soffice, tmp_path, monkeypatch):
+    doc = _docx(tmp_path, "doc.docx", b"local")
+    dead = f"http://127.0.0.1:{_free_port()}"
+    monkeypatch.setitem(converters._DETECTED, "engine", "remote")
+
+    converters.set_remote_workers([dead], local_fallback=False)
+    err = converters.docx_to_pdf(doc, tmp_path / "off.pdf")
+    assert err is not None and "unreachable" in err
+    assert not (tmp_path / "off.pdf").exists()
+    assert fake_soffice["launches"]() == []
+
+    converters.set_remote_workers([dead], local_fallback=True)
+    assert converters.docx_to_pdf(doc, tmp_path / "on.pdf") is None
+    assert _digest(doc).encode() in (tmp_path / "on.pdf").read_bytes()
+    assert len(fake_soffice["launches"]()) == 1
@@ -0,0 +1,58 @@
+import os
+import threading
+import time
+
+import pytest
+
+import estimator
+from parser import Cancelled, check_cancel
+from render_pool import RenderPool, pool_from_config
+
+
+# Module-level, so spawned workers can unpickle them by reference
+def _whoami() -> int:
+    return os.getpid()
+
+
+def _spin(seconds: float, cancel=None) -> str:
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        check_cancel(cancel)
+        time.sleep(0.01)
+    return "finished"
+
+
+@pytest.fixture
+def pool():
+    pool = RenderPool(1)
+    yield pool
+    pool.shutdown()
+
+
+def test_jobs_run_out_of_process_and_cancel_through_the_flag_file(pool, tmp_path):
+    assert pool.start() == 1
+    worker = pool.call(_whoami)
+    assert worker != os.getpid()
+    # the path app._offload takes: the job and its memory are measured in the worker
+    pid, mem = pool.call(estimator.measure, _whoami)
+    assert pid == worker
+    assert set(mem) == {"rss_before_mb", "rss_peak_mb", "job_mb"}
+
+    flag = tmp_path / "job.cancel"
+    cancel = threading.Event()
+    threading.Timer(0.5, cancel.set).start()
+    t0 = time.monotonic()
+    with pytest.raises(Cancelled):
+        pool.call(_spin, 30, cancel=cancel, cancel_flag=flag)
+    assert time.monotonic() - t0 < 10
+    assert not flag.exists()
+    # the worker survives a cancelled job
+    assert pool.call(_spin, 0, cancel=threading.Event(), cancel_flag=flag) == "finished"
+    assert pool.call(_whoami) == worker
+
+
+@pytest.mark.parametrize("value, processes", [("0", None), ("2", 2), ("many", None)])
+def test_pool_size_from_env(monkeypatch, value, processes):
+    monkeypatch.setenv("DOC_COMPOSER_RENDER_PROCESSES", value)
+    pool = pool_from_config()
+    assert (pool.processes if pool else None) == processes
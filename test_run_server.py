@@ -0,0 +1,70 @@
+import gc
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+os.environ.setdefault("DOC_COMPOSER_RENDER_PROCESSES", "0")
+
+import app as app_module
+import converters
+import run_server
+
+pytestmark = pytest.mark.skipif(sys.platform.startswith("win"), reason="pre-fork mode is POSIX only")
+
+
+@pytest.fixture
+def prefork(tmp_path, monkeypatch):
+    """run_prefork() up to the point gunicorn would start; returns its config."""
+    base = pytest.importorskip("gunicorn.app.base")
+    seen = {}
+    monkeypatch.setattr(base.BaseApplication, "run", lambda self: seen.update(cfg=self.cfg, app=self.load()))
+    monkeypatch.setattr(run_server, "LO_PROFILE_ROOT", tmp_path / "profiles")
+    # run_prefork resizes these module globals; monkeypatch puts them back afterwards
+    for name in ("RENDER_LIMIT", "PDF_LIMIT", "SSE_LIMIT", "RENDER_POOL"):
+        monkeypatch.setattr(app_module, name, getattr(app_module, name))
+    monkeypatch.setitem(converters._LO_PROFILE, "dir", converters._LO_PROFILE["dir"])
+
+    run_server.run_prefork("127.0.0.1", 8080, workers=3, threads=4, max_requests=100,
+                           max_rss_mb=512, graceful_timeout=60, warmup=False)
+    gc.unfreeze()
+    return seen
+
+
+def test_prefork_config(prefork):
+    cfg = prefork["cfg"]
+    assert prefork["app"] is app_module.app
+    assert cfg.bind == ["127.0.0.1:8080"]
+    assert (cfg.workers, cfg.threads, cfg.worker_class_str) == (3, 4, "gthread")
+    assert cfg.preload_app is True
+    assert (cfg.max_requests, cfg.max_requests_jitter) == (100, 10)
+    assert cfg.graceful_timeout == 60 and cfg.timeout == 300
+
+    # per-worker limits follow the thread count; no render pool inside forked workers
+    assert app_module.RENDER_LIMIT.stats()["slots"] == 4
+    assert app_module.SSE_LIMIT.stats()["slots"] == 3
+    assert app_module.RENDER_POOL is None
+
+
+def test_prefork_hooks_give_workers_own_profiles_and_recycle_on_rss(prefork, monkeypatch):
+    cfg = prefork["cfg"]
+    base = run_server.LO_PROFILE_ROOT / "base"
+    (base / "user").mkdir(parents=True, exist_ok=True)
+    log = SimpleNamespace(info=lambda *args: None)
+
+    worker = SimpleNamespace(pid=4242, alive=True, log=log)
+    cfg.post_fork(None, worker)
+    profile = run_server.LO_PROFILE_ROOT / "worker-4242"
+    assert converters._LO_PROFILE["dir"] == profile
+    assert (profile / "user").is_dir()   # seeded from the warmed profile
+
+    monkeypatch.setattr(run_server, "_current_rss_mb", lambda: 100.0)
+    cfg.post_request(worker, None, {}, None)
+    assert worker.alive is True
+    monkeypatch.setattr(run_server, "_current_rss_mb", lambda: 600.0)
+    cfg.post_request(worker, None, {}, None)
+    assert worker.alive is False
+
+    cfg.worker_exit(None, worker)
+    assert not profile.exists()
@@ -0,0 +1,153 @@
+import hashlib
+import io
+import types
+
+import pytest
+
+from storage import LocalStorage, S3Storage, check_key, storage_from_config
+
+
+class _ClientError(Exception):
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+
+class StubS3:
+    """Just enough of a boto3 S3 client, keeping objects in a dict."""
+
+    def __init__(self):
+        self.objects = {}   # (bucket, key) → (bytes, metadata, content type)
+        self.calls = []
+
+    def upload_fileobj(self, fileobj, bucket, key, ExtraArgs=None):
+        extra = ExtraArgs or {}
+        self.calls.append(("upload", key))
+        self.objects[(bucket, key)] = (fileobj.read(), extra.get("Metadata", {}), extra.get("ContentType"))
+
+    def get_object(self, Bucket, Key):
+        self.calls.append(("get", Key))
+        if (Bucket, Key) not in self.objects:
+            raise _ClientError("NoSuchKey")
+        return {"Body": io.BytesIO(self.objects[(Bucket, Key)][0])}
+
+    def head_object(self, Bucket, Key):
+        self.calls.append(("head", Key))
+        if (Bucket, Key) not in self.objects:
+            raise _ClientError("404")
+        data, meta, ctype = self.objects[(Bucket, Key)]
+        return {"ContentLength": len(data), "Metadata": meta, "ETag": '"md5-ish"', "ContentType": ctype}
+
+    def delete_object(self, Bucket, Key):
+        self.calls.append(("delete", Key))
+        self.objects.pop((Bucket, Key), None)
+
+    def generate_presigned_url(self, op, Params, ExpiresIn):
+        self.calls.append(("presign", Params["Key"]))
+        return f"https://s3.test/{Params['Bucket']}/{Params['Key']}?op={op}&expires={ExpiresIn}", Params
+
+
+@pytest.fixture
+def s3():
+    client = StubS3()
+    return S3Storage("docs", prefix="composer/", client=client), client
+
+
+def test_s3_put_get_and_stat(s3):
+    store, client = s3
+    store.put_bytes("outputs/job1/merged.docx", b"PK docx bytes")
+    data, meta, ctype = client.objects[("docs", "composer/outputs/job1/merged.docx")]
+    assert data == b"PK docx bytes"
+    assert meta["sha256"] == hashlib.sha256(b"PK docx bytes").hexdigest()[:32]
+    assert ctype and "wordprocessingml" in ctype
+
+    assert store.get_bytes("outputs/job1/merged.docx") == b"PK docx bytes"
+    st = store.stat("outputs/job1/merged.docx")
+    assert st.size == len(b"PK docx bytes")
+    assert st.etag == meta["sha256"]
+
+
+def test_s3_missing_keys(s3):
+    store, _ = s3
+    assert store.stat("outputs/nope/x.pdf") is None
+    assert store.get_bytes("outputs/nope/x.pdf") is None
+    with pytest.raises(FileNotFoundError):
+        store.open_read("outputs/nope/x.pdf")
+    store.put_bytes("progress/a.json", b"{}")
+    store.delete("progress/a.json")
+    assert store.stat("progress/a.json") is None
+
+
+def test_s3_put_file_etag_matches_local_store(s3, tmp_path):
+    store, _ = s3
+    path = tmp_path / "big.pdf"
+    path.write_bytes(b"%PDF" + bytes(range(256)) * 50_000)   # spills past one read chunk
+    store.put_file("outputs/job1/big.pdf", path)
+    local = LocalStorage(tmp_path / "local")
+    local.put_file("outputs/job1/big.pdf", path)
+    # every node serves the same ETag whichever backend it uses
+    assert store.stat("outputs/job1/big.pdf").etag == local.stat("outputs/job1/big.pdf").etag
+    assert store.stat("outputs/job1/big.pdf").etag == hashlib.sha256(path.read_bytes()).hexdigest()[:32]
+
+
+def test_s3_presigned_url(s3):
+    store, _ = s3
+    url, params = store.presigned_url("outputs/job1/merged.pdf", "merged.pdf", as_attachment=False,
+                                      mimetype="application/pdf")
+    assert url.startswith("https://s3.test/docs/composer/outputs/job1/merged.pdf")
+    assert params["ResponseContentDisposition"] == 'inline; filename="merged.pdf"'
+    assert params["ResponseContentType"] == "application/pdf"
+    store.presign = False
+    assert store.presigned_url("outputs/job1/merged.pdf", "merged.pdf") is None
+
+
+@pytest.mark.parametrize("key", ["", "/etc/passwd", "../x", "a/../../x", "..", "a\\b", "a\x00b"])
+def test_check_key_rejects_escaping_keys(s3, key):
+    store, client = s3
+    with pytest.raises(ValueError):
+        check_key(key)
+    with pytest.raises(ValueError):
+        store.put_bytes(key, b"x")
+    with pytest.raises(ValueError):
+        store.stat(key)
+    assert client.calls == []   # refused before reaching the bucket
+
+
+def test_check_key_normalises():
+    assert check_key("outputs/./job/../job/x.pdf") == "outputs/job/x.pdf"
+
+
+def test_local_storage_round_trip(tmp_path):
+    store = LocalStorage(tmp_path)
+    store.put_bytes("uploads/j/a.md", b"# A\n")
+    assert store.get_bytes("uploads/j/a.md") == b"# A\n"
+    assert store.stat("uploads/j/a.md").etag == hashlib.sha256(b"# A\n").hexdigest()[:32]
+    assert store.local_path("uploads/j/a.md") == tmp_path / "uploads/j/a.md"
+    store.delete("uploads/j/a.md")
+    assert store.stat("uploads/j/a.md") is None
+    with pytest.raises(ValueError):
+        store.put_bytes("../outside", b"x")
+    assert not (tmp_path.parent / "outside").exists()
+
+
+def test_storage_from_config_env(tmp_path, monkeypatch):
+    monkeypatch.setitem(__import__("sys").modules, "boto3", types.ModuleType("boto3"))
+    monkeypatch.setenv("DOC_COMPOSER_STORAGE", "s3://docs/composer")
+    monkeypatch.setenv("DOC_COMPOSER_S3_ENDPOINT", "http://127.0.0.1:9000")
+    store = storage_from_config(tmp_path)
+    assert isinstance(store, S3Storage)
+    assert (store.bucket, store.prefix, store.endpoint_url) == ("docs", "composer", "http://127.0.0.1:9000")
+
+    monkeypatch.setenv("DOC_COMPOSER_STORAGE", str(tmp_path / "shared"))
+    monkeypatch.delenv("DOC_COMPOSER_S3_ENDPOINT")
+    store = storage_from_config(tmp_path)
+    assert isinstance(store, LocalStorage) and store.root == (tmp_path / "shared").resolve()
+
+
+def test_storage_from_config_file(tmp_path, monkeypatch):
+    monkeypatch.delenv("DOC_COMPOSER_STORAGE", raising=False)
+    monkeypatch.delenv("DOC_COMPOSER_S3_ENDPOINT", raising=False)
+    cfg = tmp_path / "config.json"
+    cfg.write_text('{"STORAGE": {"backend": "local", "root": "%s"}}' % (tmp_path / "files").as_posix())
+    assert storage_from_config(tmp_path, cfg).root == (tmp_path / "files").resolve()
+    assert storage_from_config(tmp_path).root == tmp_path.resolve()
@@ -0,0 +1,62 @@
+from pathlib import Path
+
+import pytest
+from docx import Document
+from docx.oxml.ns import qn
+
+from merge import merge_from_any
+
+TEMPLATE = Path(__file__).resolve().parent / "templates" / "template.docx"
+
+SECTION = """# Getting started
+
+Some text.
+
+## Logging in
+
+More text.
+
+### Dashboard
+
+Even more.
+"""
+
+
+def _toc_entries(doc):
+    """(style, text, anchor) for the generated TOC paragraphs."""
+    entries = []
+    for p in doc.element.body.iter(qn("w:p")):
+        ps = p.find(qn("w:pPr") + "/" + qn("w:pStyle"))
+        style = ps.get(qn("w:val")) if ps is not None else ""
+        anchors = p.xpath("./w:hyperlink/@w:anchor")
+        if style.startswith("TOC") and anchors:
+            text = "".join(p.xpath("./w:hyperlink/w:r/w:t/text()"))
+            entries.append((style, text.strip(), anchors[0]))
+    return entries
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_server_toc_includes_template_and_merged_headings(tmp_path, streaming):
+    md = tmp_path / "section.md"
+    md.write_text(SECTION, encoding="utf-8")
+    out = tmp_path / "out.docx"
+    merge_from_any(str(TEMPLATE), str(md), str(out), streaming=streaming, toc_mode="server")
+
+    doc = Document(str(out))
+    entries = _toc_entries(doc)
+    # Entry text is followed by the cached page number; compare the heading part
+    titles = [(style, text.rstrip("0123456789")) for style, text, _ in entries]
+    assert titles == [
+        ("TOC1", "Introduction"),
+        ("TOC1", "Getting started"),
+        ("TOC2", "Logging in"),
+        ("TOC3", "Dashboard"),
+    ]
+
+    # The template heading keeps the bookmark Word gave it
+    assert entries[0][2] == "_Toc207030213"
+
+    bookmarks = {b.get(qn("w:name")) for b in doc.element.body.iter(qn("w:bookmarkStart"))}
+    assert all(anchor in bookmarks for _, _, anchor in entries)
+    # The field itself is gone: no stale TOC instruction survives
+    assert not any(t.strip().startswith("TOC") for t in doc.element.body.xpath(".//w:instrText/text()"))
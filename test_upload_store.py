@@ -0,0 +1,41 @@
+import hashlib
+import io
+
+from werkzeug.datastructures import FileStorage
+
+from upload_store import ContentStore
+
+
+def test_spool_digest_is_sha256_of_what_was_written(tmp_path):
+    store = ContentStore(tmp_path)
+    body = b"# Chapter\n\n" + bytes(range(256)) * 4096
+    with store.spool() as spool:
+        for i in range(0, len(body), 1000):
+            spool.write(body[i:i + 1000])
+        assert spool.hexdigest() == hashlib.sha256(body).hexdigest()
+        assert spool.size == len(body)
+        staged = spool.path
+        assert staged.exists()
+    # an uncommitted spool leaves nothing behind
+    assert not staged.exists()
+    assert list(store.staging.iterdir()) == []
+
+
+def test_store_keeps_one_copy_per_content(tmp_path):
+    store = ContentStore(tmp_path / "blobs")
+    jobs = tmp_path / "uploads"
+    jobs.mkdir()
+    body = b"same bytes, two uploads"
+
+    # a part parsed straight into a spool, and a plain in-memory one
+    spool = store.spool()
+    spool.write(body)
+    first = store.save(FileStorage(stream=spool, filename="a.md"), jobs / "a.md")
+    second = store.save(FileStorage(stream=io.BytesIO(body), filename="b.md"), jobs / "b.md")
+
+    assert first == second == store.path(hashlib.sha256(body).hexdigest())
+    assert [p.name for p in store.root.iterdir() if p.is_file()] == [first.name]
+    assert list(store.staging.iterdir()) == []
+    for name in ("a.md", "b.md"):
+        assert (jobs / name).read_bytes() == body
+        assert (jobs / name).stat().st_ino == first.stat().st_ino   # hard links, not copies
@@ -0,0 +1,73 @@
+import threading
+import time
+from pathlib import Path
+
+from docx import Document
+
+import watch
+
+TEMPLATE = Path(__file__).resolve().parent / "templates" / "template.docx"
+
+
+class _Stoppable:
+    """The real watcher, ending run() with a KeyboardInterrupt once `stop` is set."""
+
+    def __init__(self, inner, stop: threading.Event):
+        self.inner, self.stop, self.kind = inner, stop, inner.kind
+
+    def watch(self, dirs):
+        self.inner.watch(dirs)
+
+    def wait(self, timeout_s):
+        if self.stop.is_set():
+            raise KeyboardInterrupt
+        return self.inner.wait(min(timeout_s, 0.2))
+
+    def close(self):
+        self.inner.close()
+
+
+def test_burst_of_edits_rebuilds_once(tmp_path, monkeypatch):
+    sections = tmp_path / "sections"
+    sections.mkdir()
+    (sections / "01_intro.md").write_text("# Intro\n\nFirst draft.\n", encoding="utf-8")
+    (sections / "02_usage.md").write_text("# Usage\n\nUnchanged.\n", encoding="utf-8")
+    out = tmp_path / "book.docx"
+    build = watch.WatchBuild(sections, TEMPLATE, out)
+
+    results = []
+    rebuild = build.rebuild
+
+    def counted(force=False):
+        result = rebuild(force=force)
+        if result is not None:
+            results.append(result)
+        return result
+
+    monkeypatch.setattr(build, "rebuild", counted)
+    stop = threading.Event()
+    real_open = watch.open_watcher
+    monkeypatch.setattr(watch, "open_watcher", lambda poll=False: _Stoppable(real_open(poll), stop))
+    loop = threading.Thread(target=watch.run, args=(build,), kwargs={"debounce_s": 0.4}, daemon=True)
+    loop.start()
+    try:
+        deadline = time.monotonic() + 30
+        while not results and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert len(results) == 1   # the initial build
+        time.sleep(0.3)            # watches are in place
+
+        # an editor saving repeatedly, well inside the debounce window
+        for i in range(5):
+            (sections / "01_intro.md").write_text(f"# Intro\n\nDraft {i}.\n", encoding="utf-8")
+            time.sleep(0.05)
+        while len(results) < 2 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        time.sleep(1.0)            # room for a (wrong) second rebuild
+    finally:
+        stop.set()
+        loop.join(timeout=10)
+
+    assert len(results) == 2
+    assert results[1]["rendered"] == 1 and results[1]["sections"] == 2
+    assert "Draft 4." in [p.text for p in Document(str(out)).paragraphs]
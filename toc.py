@@ -0,0 +1,280 @@
+# toc.py
+"""
+Server-side table of contents.
+
+The template's TOC field (TOC \\o "1-4" ...) normally carries a stale cached
+result, so merges set w:updateFields and leave Word (prompting on every open)
+or LibreOffice to rebuild it. ServerToc builds the entries during the merge
+instead:
+  • every heading after the field within its \\o levels — the template's own
+    (e.g. its "Introduction") and the merged ones — gets a bookmark, or keeps
+    the _Toc… bookmark Word already gave it,
+  • the field's cached result is replaced by one TOC1..TOCn paragraph per
+    heading: a hyperlink to the bookmark, a tab and a PAGEREF field.
+
+PAGEREF outside a TOC field is laid out live by LibreOffice, so PDFs get
+exact page numbers; the cached value Word shows is an estimate.
+"""
+from __future__ import annotations
+import re
+from typing import Dict, List, Optional, Tuple
+
+from lxml import etree
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+
+TOC_PLACEHOLDER = "docx-server-toc"
+
+_TOC_INSTR = re.compile(r"^\s*TOC\b", re.IGNORECASE)
+_LEVELS = re.compile(r'\\o\s+"(\d)-(\d)"')
+_HEADING_NAME = re.compile(r"^heading (\d)$", re.IGNORECASE)
+
+# Page estimate used only for the cached PAGEREF values
+CHARS_PER_PAGE = 2500
+CHARS_PER_IMAGE = 1200
+CHARS_PER_TABLE_ROW = 80
+
+
+def _fld_type(r) -> Optional[str]:
+    fc = r.find(qn("w:fldChar"))
+    return fc.get(qn("w:fldCharType")) if fc is not None else None
+
+
+class ServerToc:
+    """
+    Usage (see merge.merge_into_template):
+        toc = ServerToc(doc)      # after the template is loaded; detaches the field
+        toc.scan(new_blocks)      # for every block appended by the merge
+                                  # (the template's own blocks after the field are scanned here)
+        toc.fill()                # or writer.close(fill={TOC_PLACEHOLDER: toc.entries()})
+    """
+
+    def __init__(self, doc):
+        self.doc = doc
+        self.levels: Tuple[int, int] = (1, 3)
+        self.found = False
+        self._placeholder = None
+        self._headings: List[Tuple[int, str, str, int]] = []   # level, text, bookmark, page
+        self._chars = 0
+
+        body = doc.element.body
+        self._style_levels = self._heading_style_ids()
+        self._style_ids = {s.style_id for s in doc.styles}
+        self._next_id = 1 + max((int(b.get(qn("w:id"), "0") or 0)
+                                 for b in body.iter(qn("w:bookmarkStart"))), default=0)
+        self._page = 1
+        self._detach_field(body)
+        self._scan_template(body)
+
+    # ---------- template ----------
+    def _heading_style_ids(self) -> Dict[str, int]:
+        levels: Dict[str, int] = {}
+        for style in self.doc.styles:
+            m = _HEADING_NAME.match(getattr(style, "name", "") or "")
+            if m:
+                levels[style.style_id] = int(m.group(1))
+        return levels
+
+    @staticmethod
+    def _count_page_breaks(el) -> int:
+        n = 0
+        for br in el.iter(qn("w:br")):
+            if br.get(qn("w:type")) == "page":
+                n += 1
+        n += sum(1 for _ in el.iter(qn("w:pageBreakBefore")))
+        return n
+
+    def _scan_template(self, body) -> None:
+        """Page breaks up to the field set the starting page; headings after it are TOC entries too."""
+        if self._placeholder is None:
+            return
+        top = self._placeholder
+        while top.getparent() is not body:
+            top = top.getparent()
+        children = list(body)
+        at = children.index(top)
+        self._page = 1 + sum(self._count_page_breaks(el) for el in children[:at + 1])
+        self.scan([el for el in children[at + 1:] if el.tag != qn("w:sectPr")])
+
+    def _detach_field(self, body) -> None:
+        """Replace the template's TOC field (begin … end paragraphs) with a placeholder."""
+        runs = list(body.iter(qn("w:r")))
+        begin_at = None
+        for i, r in enumerate(runs):
+            instr = r.find(qn("w:instrText"))
+            if instr is not None and _TOC_INSTR.match(instr.text or ""):
+                m = _LEVELS.search(instr.text or "")
+                if m:
+                    self.levels = (int(m.group(1)), int(m.group(2)))
+                for j in range(i - 1, -1, -1):
+                    if _fld_type(runs[j]) == "begin":
+                        begin_at = j
+                        break
+                break
+        if begin_at is None:
+            return
+
+        depth = 0
+        end_run = None
+        for r in runs[begin_at:]:
+            t = _fld_type(r)
+            if t == "begin":
+                depth += 1
+            elif t == "end":
+                depth -= 1
+                if depth == 0:
+                    end_run = r
+                    break
+        if end_run is None:
+            return
+
+        first_p = runs[begin_at].getparent()
+        while first_p is not None and first_p.tag != qn("w:p"):
+            first_p = first_p.getparent()
+        last_p = end_run.getparent()
+        while last_p is not None and last_p.tag != qn("w:p"):
+            last_p = last_p.getparent()
+        if first_p is None or last_p is None or first_p.getparent() is not last_p.getparent():
+            return
+
+        container = first_p.getparent()
+        doomed = []
+        el = first_p
+        while el is not None:
+            doomed.append(el)
+            if el is last_p:
+                break
+            el = el.getnext()
+        if doomed[-1] is not last_p:
+            return
+
+        self._placeholder = etree.Comment(TOC_PLACEHOLDER)
+        first_p.addprevious(self._placeholder)
+        for el in doomed:
+            container.remove(el)
+        self.found = True
+
+    # ---------- merged content ----------
+    def scan(self, blocks) -> None:
+        """Bookmark headings among newly merged body blocks and advance the page estimate."""
+        lo, hi = self.levels
+        for el in blocks:
+            if el.tag == qn("w:sdt"):
+                self.scan(el.findall(qn("w:sdtContent") + "/*"))
+                continue
+            if el.tag == qn("w:tbl"):
+                self._chars += CHARS_PER_TABLE_ROW * len(el.findall(qn("w:tr")))
+                self._chars += sum(len(t) for t in el.xpath(".//w:t/text()"))
+                continue
+            if el.tag != qn("w:p"):
+                continue
+            for br in el.iter(qn("w:br")):
+                if br.get(qn("w:type")) == "page":
+                    self._new_page()
+            self._chars += CHARS_PER_IMAGE * len(el.findall(".//" + qn("w:drawing")))
+            text = "".join(el.xpath(".//w:t/text()"))
+            self._chars += len(text)
+
+            ps = el.find(qn("w:pPr") + "/" + qn("w:pStyle"))
+            level = self._style_levels.get(ps.get(qn("w:val"))) if ps is not None else None
+            if level is None or not (lo <= level <= hi) or not text.strip():
+                continue
+            self._headings.append((level, text.strip(), self._bookmark(el), self.page))
+
+    @property
+    def page(self) -> int:
+        return self._page + self._chars // CHARS_PER_PAGE
+
+    def _new_page(self) -> None:
+        self._page = self.page + 1
+        self._chars = 0
+
+    def _bookmark(self, p) -> str:
+        # Word's own TOC bookmarks stay valid targets (and keep cross-references to them working)
+        for bm in p.iter(qn("w:bookmarkStart")):
+            name = bm.get(qn("w:name"), "")
+            if name.startswith("_Toc"):
+                return name
+        bm_id = str(self._next_id)
+        name = f"_TocDC{self._next_id:06d}"
+        self._next_id += 1
+        start = OxmlElement("w:bookmarkStart")
+        start.set(qn("w:id"), bm_id)
+        start.set(qn("w:name"), name)
+        end = OxmlElement("w:bookmarkEnd")
+        end.set(qn("w:id"), bm_id)
+        ppr = p.find(qn("w:pPr"))
+        if ppr is not None:
+            ppr.addnext(start)
+        else:
+            p.insert(0, start)
+        p.append(end)
+        return name
+
+    # ---------- output ----------
+    def _run(self, *children, style: Optional[str] = None):
+        r = OxmlElement("w:r")
+        rpr = OxmlElement("w:rPr")
+        if style and style in self._style_ids:
+            rs = OxmlElement("w:rStyle")
+            rs.set(qn("w:val"), style)
+            rpr.append(rs)
+        rpr.append(OxmlElement("w:noProof"))
+        if style is None:
+            rpr.append(OxmlElement("w:webHidden"))
+        r.append(rpr)
+        for c in children:
+            r.append(c)
+        return r
+
+    def _entry(self, level: int, text: str, bookmark: str, page: int):
+        p = OxmlElement("w:p")
+        style_id = f"TOC{level}"
+        if style_id in self._style_ids:
+            ppr = OxmlElement("w:pPr")
+            ps = OxmlElement("w:pStyle")
+            ps.set(qn("w:val"), style_id)
+            ppr.append(ps)
+            p.append(ppr)
+
+        link = OxmlElement("w:hyperlink")
+        link.set(qn("w:anchor"), bookmark)
+        link.set(qn("w:history"), "1")
+
+        t = OxmlElement("w:t")
+        t.set("{http://www.w3.org/XML/1998/namespace}space", "preserve")
+        t.text = text
+        link.append(self._run(t, style="Hyperlink"))
+        link.append(self._run(OxmlElement("w:tab")))
+
+        def fld(kind):
+            fc = OxmlElement("w:fldChar")
+            fc.set(qn("w:fldCharType"), kind)
+            return self._run(fc)
+
+        instr = OxmlElement("w:instrText")
+        instr.set("{http://www.w3.org/XML/1998/namespace}space", "preserve")
+        instr.text = f" PAGEREF {bookmark} \\h "
+        num = OxmlElement("w:t")
+        num.text = str(page)
+        link.append(fld("begin"))
+        link.append(self._run(instr))
+        link.append(fld("separate"))
+        link.append(self._run(num))
+        link.append(fld("end"))
+        p.append(link)
+        return p
+
+    def entries(self) -> list:
+        return [self._entry(*h) for h in self._headings]
+
+    def fill(self) -> int:
+        """Put the entries where the template's field was; returns the entry count."""
+        if self._placeholder is None:
+            return 0
+        entries = self.entries()
+        for e in entries:
+            self._placeholder.addprevious(e)
+        self._placeholder.getparent().remove(self._placeholder)
+        self._placeholder = None
+        return len(entries)
@@ -0,0 +1,126 @@
+# upload_store.py
+"""
+Content-addressed home for uploaded files: every distinct template or section
+is kept once, as <root>/<sha256>, and each job's uploads/<job>/<name> is a
+hard link to it.
+
+Multipart parts never sit in memory: UploadRequest hands Werkzeug's form
+parser a HashingSpool per file part (the stream factory), so each part is
+hashed while it is written to a temp file inside the store. commit() then
+renames the temp file to its digest (or drops it when that content is already
+stored) and link() gives the job its timestamped name without copying bytes.
+
+With the default LocalStorage(BASE_DIR) the root is the same blobs/ folder the
+browser's /blobs/<sha256> uploads land in, so both routes dedupe together.
+Nothing in the pipeline edits its inputs in place, which is what makes
+sharing one inode between jobs safe.
+"""
+from __future__ import annotations
+import hashlib
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+from flask import Request
+
+_CHUNK = 1024 * 1024
+
+
+class HashingSpool:
+    """Writable + readable temp file in the store that hashes what is written to it."""
+
+    def __init__(self, staging: Path):
+        fd, path = tempfile.mkstemp(dir=staging, suffix=".part")
+        self.path: Optional[Path] = Path(path)
+        self._f = os.fdopen(fd, "w+b")
+        self.sha = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data) -> int:
+        self.sha.update(data)
+        self.size += len(data)
+        return self._f.write(data)
+
+    def hexdigest(self) -> str:
+        return self.sha.hexdigest()
+
+    def close(self) -> None:
+        # An uncommitted spool (rejected or failed request) leaves nothing behind
+        self._f.close()
+        if self.path is not None:
+            self.path.unlink(missing_ok=True)
+            self.path = None
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ContentStore:
+    def __init__(self, root: Path | str):
+        self.root = Path(root).resolve()
+        self.staging = self.root / ".staging"
+        self.staging.mkdir(parents=True, exist_ok=True)
+
+    def path(self, sha: str) -> Path:
+        return self.root / sha
+
+    def spool(self) -> HashingSpool:
+        return HashingSpool(self.staging)
+
+    def commit(self, spool: HashingSpool) -> Path:
+        """Move a fully written spool to <root>/<sha256>; duplicates are discarded."""
+        target = self.path(spool.hexdigest())
+        spool._f.close()   # Windows can't rename an open file
+        if not target.exists():
+            # Same bytes under the same name, so a concurrent identical upload is harmless
+            os.replace(spool.path, target)
+            spool.path = None
+        spool.close()
+        return target
+
+    def put(self, src) -> Path:
+        """Hash-and-store any readable stream."""
+        with self.spool() as spool:
+            shutil.copyfileobj(src, spool, _CHUNK)
+            return self.commit(spool)
+
+    @staticmethod
+    def link(src: Path, dst: Path) -> None:
+        """Give a stored file a per-job name: a hard link, or a copy across filesystems."""
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copyfile(src, dst)
+
+    def save(self, upload, dst: Path) -> Path:
+        """
+        Store a request.files entry and link it to dst. Parts parsed by
+        UploadRequest are already hashed on disk; anything else is copied in once.
+        """
+        stream = upload.stream
+        if isinstance(stream, HashingSpool) and stream.path is not None:
+            blob = self.commit(stream)
+        else:
+            stream.seek(0)
+            blob = self.put(stream)
+        self.link(blob, dst)
+        return blob
+
+
+class UploadRequest(Request):
+    """Flask request whose file parts stream straight into a ContentStore's spools."""
+
+    upload_store: Optional[ContentStore] = None
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.upload_store is None:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        return self.upload_store.spool()
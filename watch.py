@@ -0,0 +1,332 @@
+# watch.py
+"""
+Watch mode: rebuild the merged DOCX (and optionally the PDF) whenever a
+section, the template or an image a section references changes.
+
+  python cli.py watch sections/ template.docx -o out.docx [--pdf] [--debounce-ms 150]
+
+Sections are the *.md files directly inside the directory, in name order.
+Each one is rendered on its own and kept in memory (a python-docx Document)
+with the mtimes of the file and of the images it uses. A rebuild re-renders
+only sections whose stamps moved, then merges the cached sections into the
+template again; unchanged Markdown is never re-parsed and images are never
+re-resolved, so a one-section edit costs one render plus the merge.
+
+Changes come from inotify on Linux (through ctypes, nothing to install) and
+from polling mtimes elsewhere or when inotify is unavailable. A burst of
+events (an editor's write + rename, a git checkout) is debounced into a
+single rebuild. Outputs are written next to the target and renamed over it,
+so a viewer that has the DOCX or PDF open never reads a half-written file.
+"""
+from __future__ import annotations
+import contextlib
+import ctypes
+import ctypes.util
+import os
+import select
+import shutil
+import struct
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+MD_SUFFIXES = {".md", ".markdown", ".mdx"}
+DEBOUNCE_S = 0.15
+
+Stamp = Optional[Tuple[int, int]]
+
+
+def _stamp(path: Path) -> Stamp:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+@contextlib.contextmanager
+def atomic_output(target: Path) -> Iterator[Path]:
+    """A scratch path with target's name; it replaces target only if the block succeeds."""
+    target.parent.mkdir(parents=True, exist_ok=True)
+    # Same directory → same filesystem, so the final rename is atomic
+    scratch = Path(tempfile.mkdtemp(dir=target.parent, prefix=f".{target.stem}."))
+    try:
+        tmp = scratch / target.name
+        yield tmp
+        os.replace(tmp, target)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+# ===================== CHANGE SOURCES =====================
+
+# <sys/inotify.h>
+_IN_ATTRIB = 0x004
+_IN_CLOSE_WRITE = 0x008
+_IN_MOVED_FROM = 0x040
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+# Finished writes and renames, not every IN_MODIFY of a write in progress
+_IN_MASK = _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+_EVENT = struct.Struct("iIII")   # wd, mask, cookie, len (+ name[len])
+
+
+class InotifyWatcher:
+    """Directory watches through the kernel's inotify (Linux only)."""
+
+    kind = "inotify"
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.fd = fd
+        self._wds: Dict[Path, int] = {}
+        self._dirs: Dict[int, Path] = {}
+
+    def watch(self, dirs: Iterable[Path]) -> None:
+        """Watch exactly these directories: new ones are added, the rest dropped."""
+        wanted = {d for d in dirs if d.is_dir()}
+        for d in set(self._wds) - wanted:
+            self._rm_watch(self.fd, self._wds.pop(d))
+        for d in wanted - set(self._wds):
+            wd = self._add_watch(self.fd, os.fsencode(d), _IN_MASK)
+            if wd < 0:
+                print(f"⚠️ Cannot watch {d}: {os.strerror(ctypes.get_errno())}")
+                continue
+            self._wds[d] = wd
+            self._dirs[wd] = d
+
+    def wait(self, timeout_s: float) -> Set[Path]:
+        """Paths touched within timeout_s; an empty set on timeout."""
+        ready, _, _ = select.select([self.fd], [], [], timeout_s)
+        if not ready:
+            return set()
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        changed, off = set(), 0
+        while off + _EVENT.size <= len(buf):
+            wd, _mask, _cookie, length = _EVENT.unpack_from(buf, off)
+            name = buf[off + _EVENT.size:off + _EVENT.size + length].rstrip(b"\0")
+            off += _EVENT.size + length
+            d = self._dirs.get(wd)
+            if d is not None:
+                changed.add(d / os.fsdecode(name) if name else d)
+        return changed
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Fallback: compares the files' mtimes in the watched directories every interval_s."""
+
+    kind = "polling"
+
+    def __init__(self, interval_s: float = 0.25):
+        self.interval_s = interval_s
+        self._dirs: Set[Path] = set()
+        self._snap: Dict[Path, Stamp] = {}
+
+    @staticmethod
+    def _scan(dirs: Iterable[Path]) -> Dict[Path, Stamp]:
+        snap = {}
+        for d in dirs:
+            try:
+                with os.scandir(d) as it:
+                    for entry in it:
+                        try:
+                            st = entry.stat()
+                        except OSError:
+                            continue
+                        snap[d / entry.name] = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                continue
+        return snap
+
+    def watch(self, dirs: Iterable[Path]) -> None:
+        # Only new directories are snapshotted: a change that landed between two
+        # wait() calls still shows up in the next comparison
+        wanted = set(dirs)
+        self._snap = {p: s for p, s in self._snap.items() if p.parent in wanted}
+        self._snap.update(self._scan(wanted - self._dirs))
+        self._dirs = wanted
+
+    def wait(self, timeout_s: float) -> Set[Path]:
+        deadline = time.monotonic() + timeout_s
+        while True:
+            snap = self._scan(self._dirs)
+            changed = {p for p in snap.keys() | self._snap.keys() if snap.get(p) != self._snap.get(p)}
+            self._snap = snap
+            remaining = deadline - time.monotonic()
+            if changed or remaining <= 0:
+                return changed
+            time.sleep(min(self.interval_s, remaining))
+
+    def close(self) -> None:
+        pass
+
+
+def open_watcher(poll: bool = False):
+    """inotify where the kernel offers it, polling otherwise."""
+    if not poll and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher()
+        except (OSError, AttributeError) as e:
+            print(f"⚠️ inotify unavailable ({e}); polling instead")
+    return PollingWatcher()
+
+
+# ===================== INCREMENTAL BUILD =====================
+
+@dataclass
+class _Section:
+    stamp: Stamp
+    doc: object                                   # rendered python-docx Document
+    images: Dict[Path, Stamp] = field(default_factory=dict)
+
+    def fresh(self, stamp: Stamp) -> bool:
+        return stamp == self.stamp and all(_stamp(p) == s for p, s in self.images.items())
+
+
+class WatchBuild:
+    def __init__(self, sections_dir: Path, template: Path, out_docx: Path,
+                 pdf: Optional[Path] = None, style_images: bool = True, toc_mode: str = "field",
+                 compact: bool = True):
+        self.sections_dir = Path(sections_dir).resolve()
+        self.template = Path(template).resolve()
+        self.out_docx = Path(out_docx).resolve()
+        self.pdf = Path(pdf).resolve() if pdf else None
+        self.style_images = style_images
+        self.toc_mode = toc_mode
+        self.compact = compact
+        self._cache: Dict[Path, _Section] = {}
+        self._order: List[Path] = []
+        self._tpl_stamp: Stamp = None
+
+    def section_paths(self) -> List[Path]:
+        return sorted(p for p in self.sections_dir.iterdir()
+                      if p.suffix.lower() in MD_SUFFIXES and not p.name.startswith(".") and p.is_file())
+
+    def watched_dirs(self) -> Set[Path]:
+        dirs = {self.sections_dir, self.template.parent}
+        for s in self._cache.values():
+            dirs.update(p.parent for p in s.images)
+        return dirs
+
+    def affects(self, path: Path) -> bool:
+        """Whether a changed path can alter the output (editor swap files and our own writes can't)."""
+        if path == self.template or path == self.sections_dir:
+            return True
+        if path.parent == self.sections_dir and path.suffix.lower() in MD_SUFFIXES:
+            return True
+        return any(path in s.images for s in self._cache.values())
+
+    def _render(self, path: Path, stamp: Stamp) -> _Section:
+        from docx import Document
+        from parser import render_markdown_into
+
+        doc, used = Document(), []
+        render_markdown_into(doc, path.read_text(encoding="utf-8"), path.parent,
+                             style_images=self.style_images, used_images=used)
+        return _Section(stamp, doc, {p.resolve(): _stamp(p) for p in used})
+
+    def rebuild(self, force: bool = False) -> Optional[dict]:
+        """Re-render what changed and re-merge; None when nothing did (and not forced)."""
+        from merge import merge_into_template
+
+        t0 = time.perf_counter()
+        paths = self.section_paths()
+        if not paths:
+            raise FileNotFoundError(f"no Markdown sections in {self.sections_dir}")
+        rendered = 0
+        for p in paths:
+            stamp = _stamp(p)
+            cached = self._cache.get(p)
+            if cached is None or not cached.fresh(stamp):
+                self._cache[p] = self._render(p, stamp)
+                rendered += 1
+        for p in set(self._cache) - set(paths):
+            del self._cache[p]
+
+        tpl_stamp = _stamp(self.template)
+        if not (force or rendered or paths != self._order or tpl_stamp != self._tpl_stamp):
+            return None
+        self._order, self._tpl_stamp = paths, tpl_stamp
+        t1 = time.perf_counter()
+
+        with atomic_output(self.out_docx) as tmp:
+            stats = merge_into_template(str(self.template), [self._cache[p].doc for p in paths], str(tmp),
+                                        toc_mode=self.toc_mode, compact=self.compact)
+        t2 = time.perf_counter()
+        result = {"sections": len(paths), "rendered": rendered, "render_seconds": t1 - t0,
+                  "merge_seconds": t2 - t1, "stats": stats}
+
+        if self.pdf is not None:
+            from converters import docx_to_pdf
+
+            with atomic_output(self.pdf) as tmp:
+                err = docx_to_pdf(self.out_docx, tmp)
+                if err is not None:
+                    raise RuntimeError(f"PDF export failed: {err}")
+            result["pdf_seconds"] = time.perf_counter() - t2
+        return result
+
+    def describe(self, result: dict) -> str:
+        line = (f"{self.out_docx}\trendered={result['rendered']}/{result['sections']}"
+                f"\trender_s={result['render_seconds']:.2f}\tmerge_s={result['merge_seconds']:.2f}")
+        if "pdf_seconds" in result:
+            line += f"\t{self.pdf}\tpdf_s={result['pdf_seconds']:.2f}"
+        return line
+
+
+# ===================== LOOP =====================
+
+def _rebuild(build: WatchBuild, mute, force: bool = False) -> bool:
+    try:
+        with mute():
+            result = build.rebuild(force=force)
+    except Exception as e:
+        print(f"error: rebuild failed: {e}", file=sys.stderr)
+        return False
+    if result is not None:
+        print(build.describe(result), flush=True)
+    return True
+
+
+def run(build: WatchBuild, debounce_s: float = DEBOUNCE_S, poll: bool = False,
+        mute=contextlib.nullcontext, once: bool = False) -> int:
+    """Build, then rebuild on every debounced change until Ctrl+C. mute() wraps the library chatter."""
+    ok = _rebuild(build, mute, force=True)
+    if once:
+        return 0 if ok else 1
+    watcher = open_watcher(poll)
+    print(f"Watching {build.sections_dir} ({watcher.kind}); Ctrl+C to stop", file=sys.stderr)
+    try:
+        while True:
+            # Images referenced by the last build may live in new directories
+            watcher.watch(build.watched_dirs())
+            if not any(build.affects(p) for p in watcher.wait(1.0)):
+                continue
+            # Settle: keep collecting until the burst has been quiet for debounce_s
+            while any(build.affects(p) for p in watcher.wait(debounce_s)):
+                pass
+            _rebuild(build, mute)
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        watcher.close()